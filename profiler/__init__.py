@@ -2,8 +2,26 @@
 # from .visualizer import visualizer, visualize_over_time
 # from .storage import save_to_azure
 
-from .core import Profiler
-from .visualizer import Visualizer
-from .storage import AzureStorage, save_to_azure
+# Submodules are imported on first attribute access, so decorating a function
+# with Profiler never imports pandas, matplotlib or the Azure SDK
+_LAZY_ATTRS = {
+    'Profiler': 'core',
+    'Visualizer': 'visualizer',
+    'AzureStorage': 'storage',
+    'save_to_azure': 'storage',
+}
 
-__all__ = ['Profiler', 'Visualizer', 'AzureStorage', 'save_to_azure']
\ No newline at end of file
+__all__ = ['Profiler', 'Visualizer', 'AzureStorage', 'save_to_azure']
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(__import__(f"{__name__}.{module_name}", fromlist=[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
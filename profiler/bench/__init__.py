@@ -0,0 +1,22 @@
+"""Benchmark harness and the profiler's own overhead suite.
+
+Run with ``python -m profiler.bench``; see ``--help``.
+"""
+from importlib import import_module
+from typing import Callable, Iterator
+
+from .harness import Benchmark, BenchmarkResult, Runner, save_results, summarize
+
+# Suite name -> module whose ``benchmarks(quick)`` yields the suite's benchmarks
+SUITES = {
+    "overhead": "overhead",
+}
+
+__all__ = ["Benchmark", "BenchmarkResult", "Runner", "SUITES", "load_suite", "save_results", "summarize"]
+
+
+def load_suite(name: str) -> Callable[..., Iterator[Benchmark]]:
+    """The ``benchmarks(quick=False)`` generator of a registered suite"""
+    if name not in SUITES:
+        raise ValueError(f"Unknown benchmark suite {name!r}, expected one of {sorted(SUITES)}")
+    return import_module(f".{SUITES[name]}", __name__).benchmarks
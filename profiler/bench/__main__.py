@@ -0,0 +1,85 @@
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import sys
+from typing import List, Optional, Sequence
+
+from . import SUITES, load_suite
+from .harness import BenchmarkResult, Runner, save_results
+
+logger = logging.getLogger(__name__)
+
+
+def _format_ns(value: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if value >= scale:
+            return f"{value / scale:.3g} {unit}"
+    return f"{value:.3g} ns"
+
+
+def _row(result: BenchmarkResult) -> str:
+    stats = result.stats
+    return (f"{result.name:<42} {_format_ns(stats['median']):>10} {_format_ns(stats['iqr']):>10} "
+            f"{_format_ns(stats['mad']):>10} {stats['outliers']:>4} {result.inner:>8}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """CLI: run benchmark suites, print per-operation timings and store them as a run"""
+    parser = argparse.ArgumentParser(prog="python -m profiler.bench",
+                                     description="Benchmark the profiler and store the results as a profiling run")
+    parser.add_argument("suites", nargs="*", default=["overhead"], help=f"suites to run: {', '.join(SUITES)}")
+    parser.add_argument("-k", "--filter", action="append", dest="patterns",
+                        help="only run benchmarks matching this glob, repeatable")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--repeat", type=int, default=20, help="timed samples per benchmark")
+    parser.add_argument("--warmup", type=float, default=0.1, help="warmup seconds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.01, help="minimum seconds per timed sample")
+    parser.add_argument("--cpu", type=int, help="pin the process to this CPU while timing")
+    parser.add_argument("--keep-gc", action="store_true", help="leave the cyclic GC on while timing")
+    parser.add_argument("--report-dir", default=os.path.join(os.getcwd(), "reports", "bench"),
+                        help="report directory the results are stored in")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--session-id", help="session_id of the stored run, e.g. the release version")
+    parser.add_argument("--no-save", action="store_true", help="do not store the results")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        benches = [bench for suite in args.suites for bench in load_suite(suite)(quick=args.quick)]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.patterns:
+        benches = [bench for bench in benches
+                   if any(fnmatch.fnmatchcase(bench.name, pattern) for pattern in args.patterns)]
+    if args.list:
+        for bench in benches:
+            print(f"{bench.suite}:{bench.name}")
+        return 0
+
+    runner = Runner(warmup=args.warmup, min_sample_time=args.min_time, repeat=args.repeat,
+                    disable_gc=not args.keep_gc, cpu=args.cpu)
+    print(f"{'benchmark':<42} {'median':>10} {'IQR':>10} {'MAD':>10} {'out':>4} {'inner':>8}")
+    results: List[BenchmarkResult] = []
+    for bench in benches:
+        try:
+            result = runner.run(bench)
+        except Exception as e:
+            logger.error(f"Benchmark {bench.name} failed: {str(e)}")
+            continue
+        results.append(result)
+        print(_row(result), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([result.to_dict() for result in results], f, indent=4)
+    if results and not args.no_save:
+        session_id = save_results(results, args.report_dir, session_id=args.session_id, storage=args.storage)
+        print(f"Stored {len(results)} results in {args.report_dir} as session {session_id}")
+    return 0 if len(results) == len(benches) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import asyncio
+import gc
+import inspect
+import logging
+import math
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import psutil
+
+from ..core import Profiler
+
+logger = logging.getLogger(__name__)
+
+# Samples outside [Q1 - k*IQR, Q3 + k*IQR] are reported as outliers (Tukey's fences)
+OUTLIER_FENCE = 1.5
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile (0..100) of a sorted sequence"""
+    if not ordered:
+        return math.nan
+    position = (len(ordered) - 1) * q / 100.0
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """Outlier-robust statistics of per-operation timings
+
+    Median, IQR and MAD describe the distribution regardless of outliers;
+    mean and stdev are computed over the samples inside the fences only.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    median = percentile(ordered, 50)
+    q1, q3 = percentile(ordered, 25), percentile(ordered, 75)
+    iqr = q3 - q1
+    low, high = q1 - OUTLIER_FENCE * iqr, q3 + OUTLIER_FENCE * iqr
+    inliers = [value for value in ordered if low <= value <= high]
+    return {
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": iqr,
+        "mad": statistics.median(abs(value - median) for value in ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": sum(inliers) / len(inliers),
+        "stdev": statistics.stdev(inliers) if len(inliers) > 1 else 0.0,
+        "outliers": len(ordered) - len(inliers),
+    }
+
+
+@contextmanager
+def gc_paused(enabled: bool = True) -> Iterator[None]:
+    """Collect once, then keep the cyclic GC out of the timed region"""
+    if not enabled:
+        yield
+        return
+    was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+@contextmanager
+def pinned(cpu: Optional[int]) -> Iterator[Optional[List[int]]]:
+    """Pin this process to one CPU for the duration, restoring the old affinity
+
+    Uses ``os.sched_setaffinity`` where available and psutil elsewhere
+    (Windows). Platforms without affinity control (macOS) run unpinned.
+    """
+    if cpu is None:
+        yield None
+        return
+    process = psutil.Process()
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            previous = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cpu})
+        else:
+            previous = process.cpu_affinity()
+            process.cpu_affinity([cpu])
+    except (AttributeError, OSError, ValueError, psutil.Error) as e:
+        logger.warning(f"Could not pin to CPU {cpu}, running unpinned: {str(e)}")
+        yield None
+        return
+    try:
+        yield [cpu]
+    finally:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, previous)
+        else:
+            process.cpu_affinity(previous)
+
+
+class Benchmark:
+    """One measurement: ``func`` is called ``inner`` times per timed sample
+
+    ``func`` may be a coroutine function, in which case every call is
+    awaited on one event loop kept for the whole benchmark. ``setup`` runs
+    once before warmup and ``teardown`` once after the last sample.
+    ``ops`` is how many operations one call performs (records written,
+    calls made by all threads, ...), so timings are per operation.
+    ``inner`` and ``repeat`` override the calibrated and configured counts
+    for benchmarks whose single call is already long.
+    """
+
+    def __init__(self, name: str, func: Callable[[], Any], setup: Callable[[], Any] = None,
+                 teardown: Callable[[], Any] = None, ops: int = 1, inner: int = None,
+                 repeat: int = None, params: Dict[str, Any] = None, suite: str = "bench"):
+        self.name = name
+        self.suite = suite
+        self.func = func
+        self.setup = setup
+        self.teardown = teardown
+        self.ops = ops
+        self.inner = inner
+        self.repeat = repeat
+        self.params = params or {}
+
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.func)
+
+
+class BenchmarkResult:
+    """Per-operation timings of one benchmark and their robust statistics"""
+
+    def __init__(self, suite: str, name: str, samples_ns: List[float], timestamps: List[str],
+                 inner: int, ops: int, params: Dict[str, Any], cpu_usage: float,
+                 process_cpu_usage: float, rss_mb: float, cpu: Optional[int]):
+        self.suite = suite
+        self.name = name
+        self.samples_ns = samples_ns
+        self.timestamps = timestamps
+        self.inner = inner
+        self.ops = ops
+        self.params = params
+        self.cpu_usage = cpu_usage
+        self.process_cpu_usage = process_cpu_usage
+        self.rss_mb = rss_mb
+        self.cpu = cpu
+        self.stats = summarize(samples_ns)
+
+    @property
+    def median_ns(self) -> float:
+        return self.stats["median"]
+
+    @property
+    def ops_per_second(self) -> float:
+        return 1e9 / self.median_ns if self.median_ns > 0 else math.inf
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "suite": self.suite,
+            "name": self.name,
+            "params": self.params,
+            "inner": self.inner,
+            "ops": self.ops,
+            "cpu": self.cpu,
+            "stats_ns": self.stats,
+            "ops_per_second": self.ops_per_second,
+            "samples_ns": self.samples_ns,
+        }
+
+
+class Runner:
+    """Warm up, calibrate and time benchmarks under controlled conditions
+
+    Each benchmark is warmed up for ``warmup`` seconds, then the inner loop
+    count is doubled until one sample takes at least ``min_sample_time``
+    seconds, so timer resolution and loop overhead stay negligible. Then
+    ``repeat`` samples are timed with ``perf_counter_ns`` while the cyclic
+    GC is paused (``disable_gc``) and the process is pinned to ``cpu``.
+    """
+
+    def __init__(self, warmup: float = 0.1, min_sample_time: float = 0.01, repeat: int = 20,
+                 disable_gc: bool = True, cpu: Optional[int] = None, max_inner: int = 1 << 24):
+        self.warmup = warmup
+        self.min_sample_time = min_sample_time
+        self.repeat = repeat
+        self.disable_gc = disable_gc
+        self.cpu = cpu
+        self.max_inner = max_inner
+
+    @staticmethod
+    def _timer(bench: Benchmark, loop: Optional[asyncio.AbstractEventLoop]) -> Callable[[int], int]:
+        func = bench.func
+        if loop is None:
+            def timed(n: int) -> int:
+                start = time.perf_counter_ns()
+                for _ in range(n):
+                    func()
+                return time.perf_counter_ns() - start
+            return timed
+
+        async def awaited(n: int) -> int:
+            start = time.perf_counter_ns()
+            for _ in range(n):
+                await func()
+            return time.perf_counter_ns() - start
+        return lambda n: loop.run_until_complete(awaited(n))
+
+    def calibrate(self, timed: Callable[[int], int]) -> int:
+        """Smallest power-of-two inner count whose sample lasts ``min_sample_time``"""
+        target = self.min_sample_time * 1e9
+        inner = 1
+        while inner < self.max_inner and timed(inner) < target:
+            inner *= 2
+        return inner
+
+    def run(self, bench: Benchmark) -> BenchmarkResult:
+        """Time one benchmark; setup and teardown run outside the timings"""
+        loop = asyncio.new_event_loop() if bench.is_async else None
+        process = psutil.Process()
+        if bench.setup is not None:
+            bench.setup()
+        try:
+            with pinned(self.cpu) as cpus:
+                timed = self._timer(bench, loop)
+                deadline = time.perf_counter() + self.warmup
+                timed(1)
+                while time.perf_counter() < deadline:
+                    timed(1)
+                inner = bench.inner or self.calibrate(timed)
+
+                samples, timestamps = [], []
+                psutil.cpu_percent(None)
+                cpu_start, wall_start = process.cpu_times(), time.perf_counter()
+                with gc_paused(self.disable_gc):
+                    for _ in range(bench.repeat or self.repeat):
+                        samples.append(timed(inner) / (inner * bench.ops))
+                        timestamps.append(datetime.now(timezone.utc).isoformat())
+                wall = time.perf_counter() - wall_start
+                cpu_end = process.cpu_times()
+                cpu_usage = psutil.cpu_percent(None)
+        finally:
+            if bench.teardown is not None:
+                bench.teardown()
+            if loop is not None:
+                loop.close()
+
+        cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+        return BenchmarkResult(
+            bench.suite, bench.name, samples, timestamps, inner, bench.ops, bench.params,
+            cpu_usage=cpu_usage,
+            process_cpu_usage=100.0 * cpu_seconds / wall if wall > 0 else 0.0,
+            rss_mb=process.memory_info().rss / (1024 ** 2),
+            cpu=cpus[0] if cpus else None,
+        )
+
+
+def result_entries(result: BenchmarkResult, system_info: Dict[str, Any],
+                   session_id: str) -> Iterator[Dict[str, Any]]:
+    """Profiling entries for one result, one per timed sample
+
+    Entries are keyed ``<suite>:<name>@bench`` and carry the per-operation
+    time in ``execution_time`` (seconds), so stored benchmark runs can be
+    charted and compared by regression detection like any profiled function.
+    """
+    for sample_ns, timestamp in zip(result.samples_ns, result.timestamps):
+        yield {
+            "file": result.suite,
+            "function": result.name,
+            "qualname": result.name,
+            "source": "bench",
+            "current_memory_mb": round(result.rss_mb, 3),
+            "peak_memory_mb": round(result.rss_mb, 3),
+            "cpu_usage": round(result.cpu_usage, 3),
+            "process_cpu_usage": round(result.process_cpu_usage, 3),
+            "execution_time": sample_ns / 1e9,
+            "timestamp": timestamp,
+            "system_info": system_info,
+            "session_id": session_id,
+            "params": result.params,
+            "inner": result.inner,
+            "ops": result.ops,
+        }
+
+
+def save_results(results: Iterable[BenchmarkResult], report_dir: str, session_id: str = None,
+                 storage: str = "json") -> str:
+    """Store results in a report directory as profiling records; returns the session_id
+
+    The records go through a ``Profiler`` and are compacted like any other
+    run, so ``python -m profiler.regression`` can compare releases.
+    """
+    profiler = Profiler(report_dir=report_dir, auto_finalize=False, storage=storage, session_id=session_id)
+    try:
+        for result in results:
+            for entry in result_entries(result, profiler.system_info, profiler.session_id):
+                profiler.record(entry)
+    finally:
+        profiler.close()
+    return profiler.session_id
@@ -0,0 +1,291 @@
+"""Overhead of the profiler itself.
+
+Decorator cost per call (sync, async, sampled out, with the call tree and
+under 1/8/32 threads), record persistence throughput, load time against
+history size, report rendering time against the number of functions and
+the slowdown of whole-program stack sampling.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+from ..core import Profiler
+from ..recordlog import RecordLog
+from ..shards import ShardSet, shard_path
+from ..store import RecordStore
+from .harness import Benchmark
+
+logger = logging.getLogger(__name__)
+
+SUITE = "overhead"
+THREAD_COUNTS = (1, 8, 32)
+
+
+def _entry(index: int, functions: int = 10, start: datetime = None) -> Dict[str, Any]:
+    """A record shaped like a profiled call"""
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    function = f"func_{index % functions}"
+    return {
+        "file": "bench.py",
+        "function": function,
+        "qualname": function,
+        "current_memory_mb": 0.5,
+        "peak_memory_mb": 1.0 + index % 7,
+        "cpu_usage": 12.5,
+        "process_cpu_usage": 50.0,
+        "execution_time": 0.001 * (1 + index % 13),
+        "timestamp": (start + timedelta(milliseconds=index)).isoformat(),
+        "system_info": {"os": "bench"},
+        "session_id": "bench",
+    }
+
+
+class _Workspace:
+    """A temporary report directory, the profilers opened in it and benchmark state"""
+
+    def __init__(self):
+        self.report_dir = None
+        self.profilers: List[Profiler] = []
+        self.state: Dict[str, Any] = {}
+
+    def open(self) -> str:
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_bench_")
+        return self.report_dir
+
+    def json_dir(self) -> str:
+        return os.path.join(self.report_dir, "JsonData")
+
+    def profiler(self, **options: Any) -> Profiler:
+        profiler = Profiler(report_dir=self.report_dir, auto_finalize=False, **options)
+        self.profilers.append(profiler)
+        return profiler
+
+    def close(self) -> None:
+        for profiler in self.profilers:
+            profiler.close(save=False)
+            if profiler.dropped_records:
+                logger.warning(f"{profiler.dropped_records} records were dropped by the recording pipeline")
+        self.profilers = []
+        self.state.clear()
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+
+def _bare():
+    return None
+
+
+async def _bare_async():
+    return None
+
+
+# name -> (profiler options, decorate(profiler, func)); None profiles nothing
+_DECORATED: Dict[str, Any] = {
+    "bare": None,
+    "full": ({}, lambda profiler, func: profiler.track_memory(func)),
+    "sampled_out": ({}, lambda profiler, func: profiler.track_memory(sample_rate=1e-6)(func)),
+    "call_tree": ({"call_tree": True}, lambda profiler, func: profiler.track_memory(sample_rate=1e-6)(func)),
+}
+_DECORATED_ASYNC: Dict[str, Any] = {
+    "bare": None,
+    "full": ({}, lambda profiler, func: profiler.track_memory_async(func)),
+    "sampled_out": ({}, lambda profiler, func: profiler.track_memory_async(sample_rate=1e-6)(func)),
+}
+
+
+def _decorated(name: str, variant: Any, func: Callable, wrap: Callable[[Dict[str, Any]], Callable],
+               **options: Any) -> Benchmark:
+    """A benchmark calling ``func`` decorated as ``variant`` in its own report directory
+
+    Every variant goes through the same ``wrap`` indirection, so the bare
+    timing is the baseline the decorated ones are compared against.
+    """
+    workspace = _Workspace()
+
+    def setup() -> None:
+        workspace.open()
+        if variant is None:
+            workspace.state["func"] = func
+        else:
+            profiler_options, decorate = variant
+            workspace.state["func"] = decorate(workspace.profiler(**profiler_options), func)
+
+    return Benchmark(name, wrap(workspace.state), setup=setup, teardown=workspace.close, suite=SUITE, **options)
+
+
+def _call(state: Dict[str, Any]) -> Callable[[], Any]:
+    return lambda: state["func"]()
+
+
+def _await(state: Dict[str, Any]) -> Callable[[], Any]:
+    async def awaited():
+        return await state["func"]()
+    return awaited
+
+
+def _threaded(threads: int, calls: int) -> Callable[[Dict[str, Any]], Callable[[], None]]:
+    """One call runs ``threads`` threads making ``calls`` calls each"""
+    def wrap(state: Dict[str, Any]) -> Callable[[], None]:
+        def run() -> None:
+            func = state["func"]
+            barrier = threading.Barrier(threads)
+
+            def work():
+                barrier.wait()
+                for _ in range(calls):
+                    func()
+
+            workers = [threading.Thread(target=work) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        return run
+    return wrap
+
+
+def _decorator_benchmarks(threads: Sequence[int], calls: int) -> Iterator[Benchmark]:
+    """Cost of a decorated call against a bare one: sync, async and threaded"""
+    for name, variant in _DECORATED.items():
+        yield _decorated(f"decorator.sync.{name}", variant, _bare, _call)
+    for name, variant in _DECORATED_ASYNC.items():
+        yield _decorated(f"decorator.async.{name}", variant, _bare_async, _await)
+    for count in threads:
+        for name in ("bare", "full", "sampled_out"):
+            yield _decorated(f"decorator.sync.{name}[threads={count}]", _DECORATED[name], _bare,
+                             _threaded(count, calls), ops=count * calls, inner=1,
+                             params={"threads": count, "calls": calls})
+
+
+def _write_records(json_dir: str, entries: Iterator[Dict[str, Any]]) -> ShardSet:
+    """A report directory whose only shard holds ``entries``"""
+    shards = ShardSet(json_dir)
+    log = RecordLog(shard_path(json_dir), flush_interval=60.0, max_buffer=1 << 30)
+    for entry in entries:
+        log.append(entry)
+    log.close()
+    return shards
+
+
+def _persistence_benchmarks(batch: int) -> Iterator[Benchmark]:
+    """Records per second appended to the record log and compacted into each backend"""
+    entries = [_entry(i) for i in range(batch)]
+    workspace = _Workspace()
+
+    def setup_log() -> None:
+        json_dir = os.path.join(workspace.open(), "JsonData")
+        ShardSet(json_dir)
+        workspace.state["log"] = RecordLog(shard_path(json_dir), flush_interval=60.0, max_buffer=batch * 2)
+
+    def write_log() -> None:
+        log = workspace.state["log"]
+        for entry in entries:
+            log.append(entry)
+        log.flush()
+
+    def teardown_log() -> None:
+        workspace.state["log"].close()
+        workspace.close()
+
+    yield Benchmark("persistence.record_log", write_log, setup=setup_log, teardown=teardown_log,
+                    ops=batch, params={"records": batch}, suite=SUITE)
+
+    for storage in ("json", "sqlite"):
+        compact_workspace = _Workspace()
+
+        def compact(storage=storage, workspace=compact_workspace) -> None:
+            # Every call compacts one shard into a new directory, so samples stay comparable
+            json_dir = tempfile.mkdtemp(dir=workspace.report_dir)
+            _write_records(json_dir, iter(entries))
+            shards = ShardSet(json_dir, storage=storage)
+            shards.compact()
+            if shards.database is not None:
+                shards.database.close()
+
+        yield Benchmark(f"persistence.compact.{storage}", compact, setup=compact_workspace.open,
+                        teardown=compact_workspace.close, ops=batch, inner=1,
+                        params={"records": batch, "storage": storage}, suite=SUITE)
+
+
+def _load_benchmarks(sizes: Sequence[int]) -> Iterator[Benchmark]:
+    """Time for a Profiler to load a report directory's history"""
+    for storage in ("json", "sqlite"):
+        for size in sizes:
+            workspace = _Workspace()
+
+            def setup(storage=storage, size=size, workspace=workspace) -> None:
+                workspace.open()
+                _write_records(workspace.json_dir(), (_entry(i) for i in range(size)))
+                shards = ShardSet(workspace.json_dir(), storage=storage)
+                shards.compact()
+                if shards.database is not None:
+                    shards.database.close()
+                workspace.state["profiler"] = workspace.profiler(storage=storage)
+
+            def load(workspace=workspace) -> None:
+                profiler = workspace.state["profiler"]
+                profiler._store = RecordStore()
+                profiler._stats = {}
+                profiler.load_existing_data()
+
+            yield Benchmark(f"load.{storage}[records={size}]", load, setup=setup,
+                            teardown=workspace.close, inner=1, repeat=5 if size >= 100_000 else None,
+                            params={"records": size, "storage": storage}, suite=SUITE)
+
+
+def _render_benchmarks(function_counts: Sequence[int], records: int) -> Iterator[Benchmark]:
+    """Time to render the over-time charts of a report from scratch, per function"""
+    try:
+        from ..visualizer import Visualizer
+    except ImportError as e:
+        logger.warning(f"Skipping rendering benchmarks, visualization extras are missing: {str(e)}")
+        return
+
+    for count in function_counts:
+        workspace = _Workspace()
+
+        def setup(count=count, workspace=workspace) -> None:
+            workspace.open()
+            entries = (_entry(i, functions=count) for i in range(count * records))
+            _write_records(workspace.json_dir(), entries).compact()
+
+        def render(workspace=workspace) -> None:
+            Visualizer(report_dir=workspace.report_dir, workers=1, incremental=False).visualize_over_time()
+
+        yield Benchmark(f"render.over_time[functions={count}]", render, setup=setup,
+                        teardown=workspace.close, ops=count, inner=1, repeat=3,
+                        params={"functions": count, "records": records}, suite=SUITE)
+
+
+def _fib(n: int) -> int:
+    return n if n < 2 else _fib(n - 1) + _fib(n - 2)
+
+
+def _sampling_benchmarks(hz: float, depth: int) -> Iterator[Benchmark]:
+    """A CPU-bound workload with and without whole-program stack sampling"""
+    workspace = _Workspace()
+
+    def setup() -> None:
+        workspace.open()
+        workspace.state["profiler"] = workspace.profiler()
+
+    def sampled() -> None:
+        with workspace.state["profiler"].sample(hz=hz):
+            _fib(depth)
+
+    yield Benchmark("sampling.workload", lambda: _fib(depth), inner=1, repeat=5,
+                    params={"depth": depth}, suite=SUITE)
+    yield Benchmark(f"sampling.workload[hz={hz:g}]", sampled, setup=setup, teardown=workspace.close,
+                    inner=1, repeat=5, params={"depth": depth, "hz": hz}, suite=SUITE)
+
+
+def benchmarks(quick: bool = False) -> Iterator[Benchmark]:
+    """The overhead suite; ``quick`` shrinks sizes for a fast smoke run"""
+    yield from _decorator_benchmarks(THREAD_COUNTS[:2] if quick else THREAD_COUNTS, calls=200 if quick else 2000)
+    yield from _persistence_benchmarks(batch=200 if quick else 1000)
+    yield from _load_benchmarks([1_000, 10_000] if quick else [1_000, 10_000, 100_000])
+    yield from _render_benchmarks([1, 2] if quick else [5, 20], records=50 if quick else 200)
+    yield from _sampling_benchmarks(hz=100.0, depth=25 if quick else 30)
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+STACKS_DIR = "stacks"
+# Collapsed stacks of profiled calls and of stack samples are kept apart
+CALL_STACKS = "stacks"
+SAMPLED_STACKS = "samples"
+
+Path = Tuple[str, ...]
+
+
+def stacks_path(json_dir: str, kind: str = CALL_STACKS) -> str:
+    """Collapsed-stacks file for one profiler: <kind>-<pid>-<token>.folded"""
+    return os.path.join(json_dir, STACKS_DIR, f"{kind}-{os.getpid()}-{time.time_ns():x}.folded")
+
+
+def write_collapsed(path: str, lines: Iterable[str]) -> None:
+    """Atomically replace a collapsed-stacks file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+    os.replace(temp, path)
+
+
+class PathStats:
+    """Aggregates of every call that ran under one call path"""
+
+    __slots__ = ("calls", "inclusive_ns", "self_ns", "net_bytes", "self_net_bytes", "peak_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive_ns = 0
+        self.self_ns = 0
+        self.net_bytes = 0
+        self.self_net_bytes = 0
+        self.peak_bytes = 0
+
+    def merge(self, other: "PathStats") -> None:
+        self.calls += other.calls
+        self.inclusive_ns += other.inclusive_ns
+        self.self_ns += other.self_ns
+        self.net_bytes += other.net_bytes
+        self.self_net_bytes += other.self_net_bytes
+        self.peak_bytes = max(self.peak_bytes, other.peak_bytes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Frame:
+    __slots__ = ("path", "parent", "start", "child_ns", "child_net", "token")
+
+    def __init__(self, path: Path, parent: Optional["_Frame"]):
+        self.path = path
+        self.parent = parent
+        self.child_ns = 0
+        self.child_net = 0
+        self.token = None
+        self.start = 0
+
+
+class CallTree:
+    """Self and inclusive cost of profiled calls per call path.
+
+    The active call is kept in a ``ContextVar``, so nesting follows the
+    caller across asyncio tasks (which copy the context when created) and
+    every thread starts its own roots. Each thread aggregates into its own
+    dict keyed by the path tuple, so ``exit`` takes no lock; ``paths()``
+    merges the per-thread dicts when the tree is read.
+
+    Self time is the call's inclusive time minus that of its profiled
+    children. Children running concurrently (e.g. ``asyncio.gather``) can
+    add up to more than the parent's wall time, so self time is clamped at
+    zero.
+    """
+
+    def __init__(self):
+        self._current: ContextVar[Optional[_Frame]] = ContextVar("profiler_call_path", default=None)
+        self._local = threading.local()
+        self._tables: List[Dict[Path, PathStats]] = []
+        self._tables_lock = threading.Lock()
+
+    def _table(self) -> Dict[Path, PathStats]:
+        table = getattr(self._local, "table", None)
+        if table is None:
+            table = self._local.table = {}
+            with self._tables_lock:
+                self._tables.append(table)
+        return table
+
+    def enter(self, func_key: str) -> _Frame:
+        """Start a call of ``func_key`` under the current call path"""
+        parent = self._current.get()
+        frame = _Frame(parent.path + (func_key,) if parent is not None else (func_key,), parent)
+        frame.token = self._current.set(frame)
+        frame.start = time.perf_counter_ns()
+        return frame
+
+    def exit(self, frame: _Frame, memory: Optional[tuple] = None) -> None:
+        """Finish a call; ``memory`` is the ``(net, peak, ...)`` result of a profiled call"""
+        elapsed = time.perf_counter_ns() - frame.start
+        self._current.reset(frame.token)
+        table = self._table()
+        stats = table.get(frame.path)
+        if stats is None:
+            stats = table[frame.path] = PathStats()
+        stats.calls += 1
+        stats.inclusive_ns += elapsed
+        stats.self_ns += max(elapsed - frame.child_ns, 0)
+        net = 0
+        if memory is not None:
+            net, peak = memory[0], memory[1]
+            stats.net_bytes += net
+            stats.self_net_bytes += net - frame.child_net
+            if peak > stats.peak_bytes:
+                stats.peak_bytes = peak
+        parent = frame.parent
+        if parent is not None:
+            parent.child_ns += elapsed
+            parent.child_net += net
+
+    def paths(self) -> Dict[Path, PathStats]:
+        """Aggregates per call path, merged across threads"""
+        with self._tables_lock:
+            tables = list(self._tables)
+        merged: Dict[Path, PathStats] = {}
+        for table in tables:
+            for path, stats in list(table.items()):
+                target = merged.get(path)
+                if target is None:
+                    target = merged[path] = PathStats()
+                target.merge(stats)
+        return merged
+
+    def to_dict(self) -> List[Dict[str, Any]]:
+        """The call tree as nested ``{"name", ..., "children"}`` dicts, one per root"""
+        roots: Dict[str, Dict[str, Any]] = {}
+        for path, stats in sorted(self.paths().items()):
+            level = roots
+            for name in path[:-1]:
+                level = level.setdefault(name, {"name": name, "children": {}})["children"]
+            node = level.setdefault(path[-1], {"name": path[-1], "children": {}})
+            node.update(stats.to_dict())
+
+        def listify(level: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [dict(node, children=listify(node["children"])) for node in level.values()]
+        return listify(roots)
+
+    def collapsed(self) -> Iterator[str]:
+        """Collapsed stacks (``root;child;leaf <self microseconds>``) for flamegraph tools"""
+        for path, stats in sorted(self.paths().items()):
+            micros = stats.self_ns // 1000
+            if micros > 0:
+                yield f"{';'.join(name.replace(';', '_') for name in path)} {micros}"
+
+
+def load_collapsed(json_dir: str, kind: str = CALL_STACKS) -> Dict[str, int]:
+    """Sum the collapsed stacks of one kind written by every profiler into a report directory"""
+    totals: Dict[str, int] = {}
+    directory = os.path.join(json_dir, STACKS_DIR)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not name.startswith(f"{kind}-") or not name.endswith(".folded"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                stack, _, value = line.rstrip("\n").rpartition(" ")
+                if stack and value.isdigit():
+                    totals[stack] = totals.get(stack, 0) + int(value)
+    return totals
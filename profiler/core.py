@@ -1,25 +1,45 @@
-import tracemalloc
 import psutil
+import inspect
 import os
 import time
-import json
-import inspect
 from functools import wraps
-import asyncio
-from collections import defaultdict
 from datetime import datetime, timezone
 import platform
-from typing import Any, Dict, List, Union
+import uuid
+import threading
+import weakref
+from typing import Any, Dict, List, Sequence, Union
 import logging
-from .visualizer import Visualizer
+from .sampler import CPUSampler, SampledFunction, StackSampler
+from .recordlog import RecordLog
+from .store import RecordStore, RecordView, TimeSeriesView, entry_key
+from .shards import ShardSet, shard_path
+from .policy import ProfilingPolicy
+from .pipeline import RecordPipeline
+from .memory import MemoryTracker
+from .registry import FunctionInfo, registry
+from .stats import FunctionStats, format_summary
+from .calltree import SAMPLED_STACKS, CallTree, stacks_path, write_collapsed
+from .retention import RetentionPolicy
+from .steps import StallMonitor, StepStats, timed_steps
 
 logger = logging.getLogger(__name__)
 
 class Profiler:
-    def __init__(self, report_dir: str = None, auto_finalize: bool = True):
+    def __init__(self, report_dir: str = None, auto_finalize: bool = True,
+                 cpu_sample_interval: float = 0.05, flush_interval: float = 1.0,
+                 flush_max_records: int = 1000, fsync: str = "batch",
+                 sample_rate: float = 1.0, max_per_second: float = None,
+                 top_allocations: int = 0, record_batch_size: int = 64,
+                 max_pending_batches: int = 1024, overflow: str = "drop",
+                 storage: str = "json", call_tree: bool = False, session_id: str = None,
+                 retention: RetentionPolicy = None, compaction_interval: float = None,
+                 stall_threshold: float = 0.1):
         # Initialize system info first
         self.python_version = platform.python_version()
         self.system_info = self._get_system_info()
+        # Groups this run's records for regression comparisons; forked workers keep it
+        self.session_id = session_id or f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
         
         # Set up report directories
         self.report_dir = report_dir or os.path.join(os.getcwd(), "reports")
@@ -29,15 +49,61 @@ class Profiler:
         # File paths
         self.log_file = os.path.join(self.json_data_dir, "profiler_log.json")
         self.time_series_file = os.path.join(self.json_data_dir, "profiler_time_series.json")
+        self.records_file = os.path.join(self.json_data_dir, "profiler_records.jsonl")
+        
+        # Each process appends to its own shard; compaction merges them into
+        # profiler_records.jsonl and the JSON views, or the SQLite database,
+        # and rolls up records that the retention policy expires
+        self.retention = retention
+        self._shards = ShardSet(self.json_data_dir, storage=storage, retention=retention)
+        self._log_options = dict(flush_interval=flush_interval, max_buffer=flush_max_records, fsync=fsync)
+        self._record_log = RecordLog(shard_path(self.json_data_dir), **self._log_options)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        _track_forks(self)
+        
+        # Which calls get a full profile; every call is counted regardless
+        self.policy = ProfilingPolicy(sample_rate=sample_rate, max_per_second=max_per_second)
+        
+        # Parent/child relationships of profiled calls, exported as collapsed stacks
+        self._call_tree = CallTree() if call_tree else None
+        self._stacks_file = stacks_path(self.json_data_dir)
+        
+        # Coroutine steps holding the event loop this long are recorded as stalls
+        self.stall_threshold = stall_threshold
+        self._stalls = StallMonitor(stall_threshold, self._record_stall) if stall_threshold else None
+        
+        # Whole-program stack samplers started with sample()
+        self._stack_samplers: List[StackSampler] = []
+        self._samples_file = stacks_path(self.json_data_dir, SAMPLED_STACKS)
+        
+        # tracemalloc runs only while profiled calls are in flight
+        self._memory = MemoryTracker(top_allocations=top_allocations)
         
         # Data storage
-        self.function_data: List[Dict[str, Any]] = []
-        self.time_series_data = defaultdict(list)
+        self._store = RecordStore()
+        self._stats: Dict[str, FunctionStats] = {}
         self.load_existing_data()
         
+        # Calling threads only touch their own buffers; one consumer thread
+        # writes the store, the aggregates and the record log
+        self._pipeline_options = dict(batch_size=record_batch_size, max_pending=max_pending_batches,
+                                      max_delay=min(flush_interval, 0.2), overflow=overflow)
+        self._pipeline = RecordPipeline(self._consume, **self._pipeline_options)
+        
+        # Background CPU sampling so profiled calls never block on cpu_percent
+        self._cpu_sampler = CPUSampler(interval=cpu_sample_interval)
+        self._cpu_sampler.start()
+        self._cpu_sample_interval = cpu_sample_interval
+        
         # Automatic finalization
         self.auto_finalize = auto_finalize
         self._finalized = False
+        self._closed = False
+
+        # Optional periodic compaction, so retention applies while the process runs
+        self.compaction_interval = compaction_interval
+        self._start_compaction()
 
     def __enter__(self):
         """Context manager entry point"""
@@ -66,144 +132,500 @@ class Profiler:
             logger.error(f"Failed to collect system info: {str(e)}")
             return {}
 
+    @property
+    def function_data(self) -> RecordView:
+        """All entries, as a lazy view over the record store"""
+        self._pipeline.flush()
+        return self._store.records()
+
+    @property
+    def time_series_data(self) -> TimeSeriesView:
+        """Entries grouped by ``func_key``, as a lazy view over the record store"""
+        self._pipeline.flush()
+        return self._store.time_series()
+
+    @property
+    def dropped_records(self) -> int:
+        """Profiled records discarded because the recording queue was full"""
+        return self._pipeline.dropped
+
     def load_existing_data(self) -> None:
-        """Load existing profiling data from JSON files"""
-        for file_path, target in [
-            (self.log_file, self.function_data),
-            (self.time_series_file, self.time_series_data)
-        ]:
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, "r") as f:
-                        data = json.load(f)
-                        if isinstance(data, list):
-                            target.extend(data)
-                        else:
-                            self.time_series_data.update(data)
-                except (json.JSONDecodeError, TypeError) as e:
-                    logger.warning(f"Error loading {file_path}: {str(e)}")
+        """Load the compacted records and every process's shard tail, merged by timestamp
+
+        With SQLite storage the history stays in the database: only its
+        stored aggregates and the unmerged shard tails are loaded, and
+        older records are read through ``query()``.
+        """
+        if self._shards.database_ready():
+            self._stats.update(self._shards.database.function_stats())
+            entries = self._shards.iter_tail_records()
+        else:
+            # Records expired into rollups still count towards the aggregates
+            self._stats.update(self._shards.rollups.function_stats())
+            entries = self._shards.iter_records()
+        for entry in entries:
+            self._ingest(entry_key(entry), entry)
+
+    def query(self, since: Any = None, until: Any = None,
+              functions: Sequence[str] = None) -> List[Dict[str, Any]]:
+        """Stored and current records with ``since <= timestamp < until``, by timestamp
+
+        ``since`` and ``until`` take ISO-8601 strings or datetimes and
+        ``functions`` a collection of func_keys. With SQLite storage the
+        filters are indexed lookups rather than a scan of the history.
+        """
+        self._pipeline.flush()
+        self._record_log.flush()
+        return list(self._shards.iter_records(since, until, functions))
+
+    def _ingest(self, func_key: str, entry: Dict[str, Any]) -> None:
+        """Add an entry to the record store and the streaming aggregates"""
+        self._store.append(entry, func_key)
+        stats = self._stats.get(func_key)
+        if stats is None:
+            stats = self._stats[func_key] = FunctionStats()
+        stats.add(entry)
+
+    def _record(self, func_key: str, entry: Dict[str, Any]) -> None:
+        """Queue an entry for the store and the record log"""
+        self._pipeline.submit(func_key, entry)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Store an entry collected outside the decorators, keyed by ``entry_key``
+
+        The entry needs at least ``file``, ``function`` and ``timestamp``;
+        ``system_info`` and ``session_id`` default to this profiler's.
+        """
+        entry.setdefault("system_info", self.system_info)
+        entry.setdefault("session_id", self.session_id)
+        self._record(entry_key(entry), entry)
+
+    def _consume(self, batch: list) -> None:
+        """Store a batch of entries in memory and append them to the record log"""
+        with self._lock:
+            for func_key, entry in batch:
+                self._ingest(func_key, entry)
+                self._record_log.append(entry)
 
     def save_profiling_data(self) -> None:
-        """Save data to JSON files with atomic writes"""
+        """Merge all shards into the compacted records and rewrite the JSON views
+
+        With a retention policy, expired records are rolled up and dropped
+        from memory as well.
+        """
         try:
-            # Save function log data
-            temp_log = f"{self.log_file}.tmp"
-            with open(temp_log, "w") as f:
-                json.dump(self.function_data, f, indent=4, default=str)
-            os.replace(temp_log, self.log_file)
-            
-            # Save time series data
-            temp_ts = f"{self.time_series_file}.tmp"
-            with open(temp_ts, "w") as f:
-                json.dump(dict(self.time_series_data), f, indent=4, default=str)
-            os.replace(temp_ts, self.time_series_file)
-            
+            with self._save_lock:
+                self._save()
         except Exception as e:
             logger.error(f"Failed to save profiling data: {str(e)}")
 
-    def _get_filename(self, func: Any) -> str:
-        """Resolve source filename for the decorated function"""
-        try:
-            module = inspect.getmodule(func)
-            if module and hasattr(module, '__file__'):
-                return os.path.basename(module.__file__)
-            
-            # Fallback to stack inspection
-            stack = inspect.stack()
-            for frame in stack:
-                filename = os.path.basename(frame.filename)
-                if filename not in {"core.py", "__init__.py"}:
-                    return filename
-            return "unknown_file.py"
-        except Exception as e:
-            logger.warning(f"Filename resolution failed: {str(e)}")
-            return "unknown_file.py"
+    def _save(self) -> None:
+        self._pipeline.flush()
+        self._record_log.flush()
+        offsets = self._shards.compact()
+
+        # Start a fresh shard once this one is fully merged
+        consumed = offsets.get(os.path.basename(self._record_log.path))
+        if consumed is not None:
+            self._record_log.rotate(consumed, shard_path(self.json_data_dir))
+
+        if self.retention is not None:
+            self._trim_store()
+
+        if self._call_tree is not None:
+            write_collapsed(self._stacks_file, self._call_tree.collapsed())
+        if self._stack_samplers:
+            stacks: Dict[str, int] = {}
+            for sampler in self._stack_samplers:
+                for stack, micros in sampler.stack_micros().items():
+                    stacks[stack] = stacks.get(stack, 0) + micros
+            write_collapsed(self._samples_file, (f"{stack} {micros}" for stack, micros in sorted(stacks.items())))
+
+    def _trim_store(self) -> None:
+        """Drop records the retention policy has expired from the in-memory store
 
-    def _create_profiling_entry(self, filename: str, func: Any,
-                              start_time: float, end_time: float) -> Dict[str, Any]:
+        The record cap is the one the compaction just applied, so
+        ``max_bytes`` is honoured too. The trimmed copy is built outside the
+        lock, so recording continues meanwhile; rows appended in between
+        are carried over when it is swapped in.
+        """
+        store = self._store
+        stop = len(store)
+        trimmed = store.trimmed(self.retention.raw_cutoff(), self._shards.record_limit, stop)
+        if trimmed is None:
+            return
+        with self._lock:
+            if self._store is not store:
+                return
+            for row in range(stop, len(store)):
+                entry = store.row(row)
+                trimmed.append(entry, entry_key(entry))
+            self._store = trimmed
+
+    def _start_compaction(self) -> None:
+        self._stop_compaction = threading.Event()
+        self._compaction_thread = None
+        if self.compaction_interval:
+            self._compaction_thread = threading.Thread(target=self._compaction_loop, daemon=True,
+                                                       name="profiler-compaction")
+            self._compaction_thread.start()
+
+    def _compaction_loop(self) -> None:
+        while not self._stop_compaction.wait(self.compaction_interval):
+            self.save_profiling_data()
+
+    def _stop_compaction_thread(self) -> None:
+        self._stop_compaction.set()
+        thread = self._compaction_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _after_fork_in_child(self) -> None:
+        """Give a forked worker its own shard, lock, pipeline and sampler"""
+        if self._closed:
+            # Nothing is collected after close, so the child starts nothing
+            return
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._pipeline = RecordPipeline(self._consume, **self._pipeline_options)
+        self._record_log = RecordLog(shard_path(self.json_data_dir), **self._log_options)
+        if self._call_tree is not None:
+            # The parent's paths stay in the parent's stacks file
+            self._call_tree = CallTree()
+            self._stacks_file = stacks_path(self.json_data_dir)
+        # Sampler threads do not survive the fork
+        self._stack_samplers = []
+        self._samples_file = stacks_path(self.json_data_dir, SAMPLED_STACKS)
+        self._cpu_sampler = CPUSampler(interval=self._cpu_sample_interval)
+        self._cpu_sampler.start()
+        self._start_compaction()
+
+    def _create_profiling_entry(self, info: FunctionInfo, start_time: float,
+                              end_time: float, memory: tuple) -> Dict[str, Any]:
         """Create a complete profiling entry with resource metrics"""
         try:
-            current, peak = tracemalloc.get_traced_memory()
-            return {
-                "file": filename,
-                "function": func.__name__,
+            current, peak, top = memory
+            cpu_usage, process_cpu_usage = self._cpu_sampler.cpu_usage(start_time, end_time)
+            entry = {
+                "file": info.file,
+                "function": info.name,
+                "qualname": info.qualname,
                 "current_memory_mb": round(current / (1024 ** 2), 3),
                 "peak_memory_mb": round(peak / (1024 ** 2), 3),
-                "cpu_usage": round(psutil.cpu_percent(interval=0.1), 3),
-                "execution_time": round(end_time - start_time, 3),
+                "cpu_usage": round(cpu_usage, 3),
+                "process_cpu_usage": round(process_cpu_usage, 3),
+                "execution_time": round(end_time - start_time, 6),
                 "timestamp": datetime.now(timezone.utc).isoformat(),
                 "system_info": self.system_info,
+                "session_id": self.session_id,
             }
+            if top:
+                entry["top_allocations"] = top
+            return entry
         except Exception as e:
             logger.error(f"Failed to create profiling entry: {str(e)}")
             return {}
 
-    def track_memory(self, func: Any) -> Any:
-        """Decorator to track resource usage for synchronous functions"""
+    def sample(self, hz: float = 100.0, window: float = 1.0, user_code: bool = True) -> StackSampler:
+        """Start whole-program stack sampling at ``hz`` samples per second
+
+        Use as ``with profiler.sample(100): ...`` or call ``stop()`` on the
+        returned sampler. Every ``window`` seconds each sampled function gets
+        a record (``source="sampler"``, keyed ``file:qualname@sampler``)
+        with its sample count, estimated time, hottest lines and the
+        process RSS and CPU over the window. Sampled stacks are saved for
+        the icicle chart. With ``user_code``, time in the standard library
+        and installed packages is charged to the user code that called it.
+        """
+        sampler = StackSampler(self._record_samples, hz=hz, window=window, user_code=user_code)
+        self._stack_samplers.append(sampler)
+        sampler.start()
+        return sampler
+
+    def _record_samples(self, start: float, end: float, functions: Dict[str, SampledFunction]) -> None:
+        """Turn one window of stack samples into profiling entries"""
+        rss_mb = round(psutil.Process().memory_info().rss / (1024 ** 2), 3)
+        cpu_usage, process_cpu_usage = self._cpu_sampler.cpu_usage(start, end)
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for function in functions.values():
+            entry = {
+                "file": function.file,
+                "function": function.name,
+                "qualname": function.qualname,
+                "source": "sampler",
+                "current_memory_mb": rss_mb,
+                "peak_memory_mb": rss_mb,
+                "cpu_usage": round(cpu_usage, 3),
+                "process_cpu_usage": round(process_cpu_usage, 3),
+                "execution_time": round(function.seconds, 6),
+                "timestamp": timestamp,
+                "system_info": self.system_info,
+                "session_id": self.session_id,
+                "samples": function.samples,
+                "lines": [{"line": line, "samples": count} for line, count in function.lines.most_common(5)],
+            }
+            self._record(entry_key(entry), entry)
+
+    def _record_stall(self, info: FunctionInfo, start_ns: int, end_ns: int, breakdown: Dict[str, float]) -> None:
+        """Record an event-loop stall against the profiled coroutine that caused it"""
+        try:
+            start, end = start_ns / 1e9, end_ns / 1e9
+            rss_mb = round(psutil.Process().memory_info().rss / (1024 ** 2), 3)
+            cpu_usage, process_cpu_usage = self._cpu_sampler.cpu_usage(start, end)
+            entry = {
+                "file": info.file,
+                "function": info.name,
+                "qualname": info.qualname,
+                "source": "stall",
+                "current_memory_mb": rss_mb,
+                "peak_memory_mb": rss_mb,
+                "cpu_usage": round(cpu_usage, 3),
+                "process_cpu_usage": round(process_cpu_usage, 3),
+                "execution_time": round(end - start, 6),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "system_info": self.system_info,
+                "session_id": self.session_id,
+                "breakdown": breakdown,
+            }
+            logger.debug(f"Event loop blocked for {end - start:.3f}s by {info.key}")
+            self._record(entry_key(entry), entry)
+        except Exception as e:
+            logger.error(f"Failed to record event loop stall: {str(e)}")
+
+    def _count_call(self, func_key: str, elapsed: float, profiled: bool) -> int:
+        """Update the exact call counters; returns the weight of a profiled record"""
+        return self._pipeline.count(func_key, elapsed, profiled)
+
+    def track_memory(self, func: Any = None, *, sample_rate: float = None,
+                     max_per_second: float = None) -> Any:
+        """Decorator to track resource usage for synchronous functions
+
+        Use bare or with ``sample_rate`` / ``max_per_second`` to override the
+        profiler-wide policy for this function. Every call is timed and
+        counted; only calls selected by the policy get a full profile.
+        """
+        if func is None:
+            return lambda f: self.track_memory(f, sample_rate=sample_rate, max_per_second=max_per_second)
+        policy = self.policy.override(sample_rate, max_per_second)
+        info = registry.resolve(func)
+        func_key = info.key
+
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            filename = self._get_filename(func)
-            func_key = f"{filename}:{func.__name__}"
-            start_time = time.time()
-            
-            tracemalloc.start()
+            tree = self._call_tree
+            call = tree.enter(func_key) if tree is not None else None
+            if not policy.should_profile(func_key):
+                start_time = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._count_call(func_key, time.perf_counter() - start_time, False)
+                    if call is not None:
+                        tree.exit(call)
+
+            frame = self._memory.begin()
+            start_time = time.perf_counter()
             try:
                 result = func(*args, **kwargs)
             finally:
-                end_time = time.time()
-                entry = self._create_profiling_entry(filename, func, start_time, end_time)
+                end_time = time.perf_counter()
+                memory = self._memory.end(frame)
+                if call is not None:
+                    tree.exit(call, memory)
+                weight = self._count_call(func_key, end_time - start_time, True)
+                entry = self._create_profiling_entry(info, start_time, end_time, memory)
                 if entry:
-                    self.function_data.append(entry)
-                    self.time_series_data[func_key].append(entry)
-                    self.save_profiling_data()
-                tracemalloc.stop()
+                    entry["sample_weight"] = weight
+                    self._record(func_key, entry)
             
             return result
         return wrapper
 
-    def track_memory_async(self, func: Any) -> Any:
-        """Decorator to track resource usage for asynchronous functions"""
+    def track_memory_async(self, func: Any = None, *, sample_rate: float = None,
+                           max_per_second: float = None) -> Any:
+        """Decorator to track resource usage for asynchronous functions
+
+        Accepts the same policy overrides as ``track_memory``. Profiled calls
+        also record ``loop_time`` (steps run on the event loop), ``cpu_time``,
+        ``awaited_time``, ``steps`` and ``max_step_time``; any call with a
+        step over ``stall_threshold`` records a ``@stall`` entry.
+        """
+        if func is None:
+            return lambda f: self.track_memory_async(f, sample_rate=sample_rate, max_per_second=max_per_second)
+        policy = self.policy.override(sample_rate, max_per_second)
+        info = registry.resolve(func)
+        func_key = info.key
+
         @wraps(func)
         async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            filename = self._get_filename(func)
-            func_key = f"{filename}:{func.__name__}"
-            start_time = time.time()
-            
-            tracemalloc.start()
+            tree = self._call_tree
+            call = tree.enter(func_key) if tree is not None else None
+            stalls = self._stalls
+            if not policy.should_profile(func_key):
+                start_time = time.perf_counter()
+                try:
+                    awaitable = func(*args, **kwargs)
+                    if stalls is None or not inspect.iscoroutine(awaitable):
+                        return await awaitable
+                    return await timed_steps(awaitable, info, monitor=stalls)
+                finally:
+                    self._count_call(func_key, time.perf_counter() - start_time, False)
+                    if call is not None:
+                        tree.exit(call)
+
+            # Each step a coroutine runs on the loop is timed, so the wall time
+            # splits into time holding the loop and time spent awaiting; other
+            # awaitables (futures, gather) are awaited as they are
+            steps = None
+            frame = self._memory.begin()
+            start_time = time.perf_counter()
             try:
-                result = await func(*args, **kwargs)
+                awaitable = func(*args, **kwargs)
+                if inspect.iscoroutine(awaitable):
+                    steps = StepStats()
+                    result = await timed_steps(awaitable, info, steps, stalls)
+                else:
+                    result = await awaitable
             finally:
-                end_time = time.time()
-                entry = self._create_profiling_entry(filename, func, start_time, end_time)
+                end_time = time.perf_counter()
+                memory = self._memory.end(frame)
+                if call is not None:
+                    tree.exit(call, memory)
+                weight = self._count_call(func_key, end_time - start_time, True)
+                entry = self._create_profiling_entry(info, start_time, end_time, memory)
                 if entry:
-                    self.function_data.append(entry)
-                    self.time_series_data[func_key].append(entry)
-                    self.save_profiling_data()
-                tracemalloc.stop()
+                    entry["sample_weight"] = weight
+                    if steps is not None:
+                        entry.update(steps.fields(end_time - start_time))
+                    self._record(func_key, entry)
             
             return result
         return wrapper
 
+    def close(self, save: bool = True) -> None:
+        """Stop collection and save the data without rendering reports
+
+        With ``save=False`` buffered records still reach this process's
+        shard, but nothing is compacted and the views are not rewritten.
+        """
+        if self._closed:
+            return
+        self._stop_compaction_thread()
+        for sampler in self._stack_samplers:
+            sampler.stop()
+        self._cpu_sampler.stop()
+        if save:
+            self.save_profiling_data()
+        self._pipeline.close()
+        self._record_log.close()
+        if self._shards.database is not None:
+            self._shards.database.close()
+        self._closed = True
+
     def finalize(self) -> None:
         """Finalize profiling and generate visual reports"""
         if self._finalized:
             return
             
         try:
-            self.save_profiling_data()
-            visualizer = Visualizer(report_dir=self.report_dir)
+            self.close()
+            # Imported here so collection never pulls in pandas/matplotlib
+            try:
+                from .visualizer import Visualizer
+            except ImportError as e:
+                logger.warning(f"Profiling data saved to {self.report_dir}; reports need the [viz] extra: {str(e)}")
+                self._finalized = True
+                return
+            visualizer = Visualizer(report_dir=self.report_dir, storage=self._shards.storage)
             visualizer.visualize_usage()
             visualizer.visualize_over_time()
+            visualizer.visualize_call_tree()
             logger.info(f"Reports generated successfully at: {self.report_dir}")
             self._finalized = True
         except Exception as e:
             logger.error(f"Failed to generate reports: {str(e)}")
             raise
 
-    def get_function_data(self) -> List[Dict[str, Any]]:
+    def get_function_data(self) -> RecordView:
         """Get aggregated profiling data"""
         return self.function_data
 
-    def get_time_series_data(self) -> Dict[str, List[Dict[str, Any]]]:
+    def get_time_series_data(self) -> TimeSeriesView:
         """Get time-series profiling data"""
-        return dict(self.time_series_data)
\ No newline at end of file
+        return self.time_series_data
+
+    def get_call_counts(self) -> Dict[str, Dict[str, Any]]:
+        """Get exact call counts per function, including calls that were not profiled"""
+        return {key: counts.to_dict() for key, counts in self._pipeline.call_counts().items()}
+
+    def stats(self, func_key: str = None) -> Dict[str, Dict[str, Any]]:
+        """Get streaming aggregates per function
+
+        Each function maps to count/total/mean/stddev/min/max and p50/p95/p99
+        of ``execution_time`` and ``peak_memory_mb`` over its profiled
+        records, plus exact ``calls`` when calls were counted this session.
+        Quantiles come from DDSketch sketches, so this is O(functions) no
+        matter how much history was recorded.
+        """
+        self._pipeline.flush()
+        call_counts = self._pipeline.call_counts()
+        with self._lock:
+            keys = [func_key] if func_key is not None else list(self._stats)
+            result = {}
+            for key in keys:
+                if key not in self._stats:
+                    continue
+                summary = self._stats[key].summary()
+                if key in call_counts:
+                    summary["calls"] = call_counts[key].calls
+                result[key] = summary
+            return result
+
+    def summary(self, fmt: str = "text") -> str:
+        """Render ``stats()`` as a text table or JSON"""
+        return format_summary(self.stats(), fmt)
+
+    def call_tree(self) -> List[Dict[str, Any]]:
+        """Call tree of profiled calls with self/inclusive time and memory per path
+
+        Requires ``Profiler(call_tree=True)``. Each node has ``calls``,
+        ``inclusive_ns``, ``self_ns``, ``net_bytes``, ``self_net_bytes``
+        (profiled calls only), ``peak_bytes`` and ``children``.
+        """
+        return self._call_tree.to_dict() if self._call_tree is not None else []
+
+    def collapsed_stacks(self) -> str:
+        """Call tree as collapsed stacks (self time in microseconds) for flamegraph tools"""
+        return "\n".join(self._call_tree.collapsed()) if self._call_tree is not None else ""
+
+    def detect_regressions(self, baseline: str = None, threshold: float = 0.2, **options: Any) -> Dict[str, Any]:
+        """Compare this session against ``baseline`` (default: the previous run on the same hardware)
+
+        See ``profiler.regression.detect_regressions``; requires numpy.
+        """
+        from .regression import detect_regressions
+        return detect_regressions(self.query(), baseline=baseline, current=self.session_id,
+                                  threshold=threshold, **options)
+
+    def export_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Serializable aggregates; combine exports of several processes with ``stats.merge_stats``"""
+        self._pipeline.flush()
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+
+_live_profilers: "weakref.WeakSet[Profiler]" = weakref.WeakSet()
+_fork_hook_installed = False
+
+
+def _reinit_after_fork() -> None:
+    for profiler in list(_live_profilers):
+        profiler._after_fork_in_child()
+
+
+def _track_forks(profiler: Profiler) -> None:
+    global _fork_hook_installed
+    if not _fork_hook_installed and hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_reinit_after_fork)
+        _fork_hook_installed = True
+    _live_profilers.add(profiler)
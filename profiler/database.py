@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .stats import FunctionStats
+from .store import entry_key, format_timestamp, timestamp_micros
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = "profiler_records.sqlite"
+
+# Entry fields kept as columns, in the order entries are rebuilt
+COLUMNS = ("file", "function", "qualname", "current_memory_mb", "peak_memory_mb",
+           "cpu_usage", "process_cpu_usage", "execution_time", "timestamp", "sample_weight")
+_COLUMN_SET = frozenset(COLUMNS)
+_FETCH_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    system_info TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    func_key TEXT NOT NULL,
+    file TEXT,
+    function TEXT,
+    qualname TEXT,
+    current_memory_mb REAL,
+    peak_memory_mb REAL,
+    cpu_usage REAL,
+    process_cpu_usage REAL,
+    execution_time REAL,
+    timestamp INTEGER,
+    sample_weight INTEGER,
+    session_id INTEGER REFERENCES sessions (id),
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS records_func_key_timestamp ON records (func_key, timestamp);
+CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+CREATE TABLE IF NOT EXISTS shard_offsets (
+    name TEXT PRIMARY KEY,
+    consumed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS function_stats (
+    func_key TEXT PRIMARY KEY,
+    stats TEXT NOT NULL
+);
+"""
+
+
+def _scalar(value: Any) -> bool:
+    return isinstance(value, (int, float, str)) and not isinstance(value, bool)
+
+
+class RecordDatabase:
+    """Compacted records in an indexed SQLite table.
+
+    Records are indexed by ``(func_key, timestamp)`` and by timestamp, so
+    time-range and function filters are answered by the index instead of
+    parsing the whole history. Timestamps are stored as integer
+    microseconds, ``system_info`` once per distinct value, and fields
+    without a column as JSON in ``extra``. Shard offsets and per-function
+    aggregates are updated in the same transaction as the records, so
+    opening a report needs neither a full scan nor a replay.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._session_ids: Dict[str, int] = {}
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection for this process (re-opened after a fork)"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn, self._pid = conn, os.getpid()
+            self._session_ids.clear()
+            self._sessions.clear()
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def is_empty(self) -> bool:
+        """True until the first compaction has written records or offsets"""
+        with self._lock:
+            conn = self.connection
+            return (conn.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM shard_offsets LIMIT 1").fetchone() is None)
+
+    def offsets(self) -> Dict[str, int]:
+        """Shard offsets already merged into the database"""
+        with self._lock:
+            return dict(self.connection.execute("SELECT name, consumed FROM shard_offsets"))
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Make the enclosed inserts and offset updates one atomic write"""
+        with self._lock:
+            conn = self.connection
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # Ids handed out inside the transaction no longer exist
+                self._session_ids.clear()
+                raise
+            conn.execute("COMMIT")
+
+    def _session_id(self, info: Any) -> Optional[int]:
+        if info is None:
+            return None
+        text = json.dumps(info, sort_keys=True, default=str)
+        sid = self._session_ids.get(text)
+        if sid is None:
+            conn = self._conn
+            conn.execute("INSERT OR IGNORE INTO sessions (system_info) VALUES (?)", (text,))
+            sid, = conn.execute("SELECT id FROM sessions WHERE system_info = ?", (text,)).fetchone()
+            self._session_ids[text] = sid
+        return sid
+
+    def _encode(self, entry: Dict[str, Any]) -> Tuple[Any, ...]:
+        values: List[Any] = []
+        extra: Dict[str, Any] = {}
+        for name in COLUMNS:
+            value = entry.get(name)
+            if name == "timestamp":
+                micros = timestamp_micros(value)
+                if micros is None and value is not None:
+                    extra[name] = value
+                value = micros
+            elif value is not None and not _scalar(value):
+                extra[name] = value
+                value = None
+            values.append(value)
+        for name, value in entry.items():
+            if name not in _COLUMN_SET and name != "system_info":
+                extra[name] = value
+        return (entry_key(entry), *values, self._session_id(entry.get("system_info")),
+                json.dumps(extra, default=str) if extra else None)
+
+    def insert(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Insert entries and fold them into the stored aggregates; call inside ``transaction()``"""
+        stats: Dict[str, FunctionStats] = {}
+
+        def rows() -> Iterator[Tuple[Any, ...]]:
+            for entry in entries:
+                row = self._encode(entry)
+                func_stats = stats.get(row[0])
+                if func_stats is None:
+                    func_stats = stats[row[0]] = FunctionStats()
+                func_stats.add(entry)
+                yield row
+
+        conn = self._conn
+        columns = ", ".join(("func_key",) + COLUMNS + ("session_id", "extra"))
+        placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+        cursor = conn.executemany(f"INSERT INTO records ({columns}) VALUES ({placeholders})", rows())
+        for func_key, new in stats.items():
+            stored = conn.execute("SELECT stats FROM function_stats WHERE func_key = ?", (func_key,)).fetchone()
+            if stored is not None:
+                merged = FunctionStats.from_dict(json.loads(stored[0]))
+                merged.merge(new)
+                new = merged
+            conn.execute("INSERT OR REPLACE INTO function_stats (func_key, stats) VALUES (?, ?)",
+                         (func_key, json.dumps(new.to_dict())))
+        return cursor.rowcount
+
+    def save_offsets(self, offsets: Dict[str, int]) -> None:
+        """Record consumed shard offsets; call inside ``transaction()``"""
+        self._conn.executemany("INSERT OR REPLACE INTO shard_offsets (name, consumed) VALUES (?, ?)",
+                               offsets.items())
+
+    def function_stats(self) -> Dict[str, FunctionStats]:
+        """Aggregates of every stored record, without reading the records"""
+        with self._lock:
+            rows = self.connection.execute("SELECT func_key, stats FROM function_stats").fetchall()
+        return {func_key: FunctionStats.from_dict(json.loads(stats)) for func_key, stats in rows}
+
+    @staticmethod
+    def where(since: Any = None, until: Any = None,
+              functions: Optional[Sequence[str]] = None) -> Tuple[str, List[Any]]:
+        """SQL filter for ``since <= timestamp < until`` and ``func_key IN functions``"""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(timestamp_micros(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(timestamp_micros(until))
+        if functions is not None:
+            functions = list(functions)
+            clauses.append(f"func_key IN ({', '.join('?' * len(functions))})")
+            params.extend(functions)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _decode(self, row: Sequence[Any]) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {}
+        for name, value in zip(COLUMNS, row):
+            if value is None:
+                continue
+            if name == "timestamp":
+                entry[name] = format_timestamp(value)
+                session_id = row[len(COLUMNS)]
+                if session_id is not None:
+                    entry["system_info"] = self._session(session_id)
+            else:
+                entry[name] = value
+        extra = row[len(COLUMNS) + 1]
+        if extra:
+            entry.update(json.loads(extra))
+        return entry
+
+    def _session(self, session_id: int) -> Dict[str, Any]:
+        info = self._sessions.get(session_id)
+        if info is None:
+            text, = self._conn.execute("SELECT system_info FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            info = self._sessions[session_id] = json.loads(text)
+        return info
+
+    def query(self, since: Any = None, until: Any = None,
+              functions: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream stored entries in timestamp order, filtered in SQL"""
+        where, params = self.where(since, until, functions)
+        sql = f"SELECT {', '.join(COLUMNS)}, session_id, extra FROM records{where} ORDER BY timestamp, id"
+        with self._lock:
+            cursor = self.connection.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+                entries = [self._decode(row) for row in rows]
+            if not entries:
+                return
+            yield from entries
+
+    def count(self, before: Optional[int] = None) -> int:
+        """Stored records, optionally only those before ``before`` microseconds; call inside ``transaction()``"""
+        if before is None:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        return self._conn.execute("SELECT COUNT(*) FROM records WHERE timestamp < ?", (before,)).fetchone()[0]
+
+    def oldest(self, limit: int) -> Iterator[Dict[str, Any]]:
+        """Stream the ``limit`` oldest entries; call inside ``transaction()``"""
+        cursor = self._conn.execute(
+            f"SELECT {', '.join(COLUMNS)}, session_id, extra FROM records ORDER BY timestamp, id LIMIT ?", (limit,))
+        while True:
+            rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield self._decode(row)
+
+    def delete_oldest(self, limit: int) -> int:
+        """Delete the ``limit`` oldest records; call inside ``transaction()``"""
+        return self._conn.execute(
+            "DELETE FROM records WHERE id IN (SELECT id FROM records ORDER BY timestamp, id LIMIT ?)", (limit,)
+        ).rowcount
+
+    def series_summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per ``func_key``: record count, last timestamp, file and names"""
+        sql = ("SELECT func_key, COUNT(*), MAX(timestamp), MAX(file), MAX(function), MAX(qualname) "
+               "FROM records GROUP BY func_key")
+        with self._lock:
+            rows = self.connection.execute(sql).fetchall()
+        return {
+            func_key: {"records": count, "last_timestamp": last, "file": file,
+                       "function": function, "qualname": qualname}
+            for func_key, count, last, file, function, qualname in rows
+        }
@@ -0,0 +1,115 @@
+import fnmatch
+import os
+import re
+import threading
+import tracemalloc
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Calls in flight across all trackers; every peak reset must be folded into
+# them. tracemalloc is process-wide, so it runs only while this set is not
+# empty (unless something else started it)
+_active_frames: "Set[_Frame]" = set()
+_frames_lock = threading.Lock()
+_started_tracing = False
+
+_EXCLUDED_FILES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    # Pattern matching done by the filters themselves
+    tracemalloc.Filter(False, fnmatch.__file__),
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(re.__file__), "*")),
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(os.path.abspath(__file__)), "*")),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+class _Frame:
+    __slots__ = ("base", "peak", "snapshot")
+
+    def __init__(self, base: int):
+        self.base = base
+        self.peak = base
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class MemoryTracker:
+    """Per-call memory measurement on top of a shared tracemalloc.
+
+    Tracing is reference-counted by the profiled calls in flight across all
+    trackers: it starts with the first call and stops when the last one
+    ends, so nested and concurrent calls never reset each other's traces
+    and the rest of the program allocates at full speed. tracemalloc only
+    keeps one global peak, which is reset when a call starts; a call that
+    starts while others run first folds the peak into them, so each call
+    sees the highest traced memory reached while it was running. Calls that
+    overlap in other threads or tasks share that process-wide peak.
+
+    With ``top_allocations`` set, snapshots taken at the start and end of
+    each call are compared to report the source lines that allocated most.
+    """
+
+    def __init__(self, top_allocations: int = 0):
+        self.top_allocations = top_allocations
+
+    def begin(self) -> _Frame:
+        """Start measuring a call"""
+        global _started_tracing
+        with _frames_lock:
+            if _active_frames:
+                # Nested or concurrent: the calls already running keep the
+                # peak so far before it is reset for this one
+                current, peak = tracemalloc.get_traced_memory()
+                for other in _active_frames:
+                    if peak > other.peak:
+                        other.peak = peak
+                tracemalloc.reset_peak()
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+                current = tracemalloc.get_traced_memory()[0]
+            else:
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+            frame = _Frame(current)
+            _active_frames.add(frame)
+        if self.top_allocations:
+            frame.snapshot = tracemalloc.take_snapshot().filter_traces(_EXCLUDED_FILES)
+        return frame
+
+    def end(self, frame: _Frame) -> Tuple[int, int, List[Dict[str, Any]]]:
+        """Finish a call; returns (net bytes, peak bytes, top allocating lines)"""
+        global _started_tracing
+        snapshot = None
+        if frame.snapshot is not None:
+            try:
+                snapshot = tracemalloc.take_snapshot().filter_traces(_EXCLUDED_FILES)
+            except Exception as e:
+                logger.warning(f"Allocation snapshot failed: {str(e)}")
+        with _frames_lock:
+            # Peaks are only reset when a call starts, so the running peak
+            # already covers this call; calls still running read it later
+            current, peak = tracemalloc.get_traced_memory()
+            if peak > frame.peak:
+                frame.peak = peak
+            _active_frames.discard(frame)
+            if not _active_frames and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        top: List[Dict[str, Any]] = []
+        if snapshot is not None:
+            try:
+                for stat in snapshot.compare_to(frame.snapshot, "lineno")[:self.top_allocations]:
+                    if stat.size_diff <= 0:
+                        continue
+                    location = stat.traceback[0]
+                    top.append({
+                        "location": f"{os.path.basename(location.filename)}:{location.lineno}",
+                        "size_kb": round(stat.size_diff / 1024, 3),
+                        "count": stat.count_diff,
+                    })
+            except Exception as e:
+                logger.warning(f"Allocation snapshot comparison failed: {str(e)}")
+        return current - frame.base, max(frame.peak - frame.base, 0), top
@@ -0,0 +1,211 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .policy import CallCounts
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+Record = Tuple[str, Dict[str, Any]]
+
+_pipelines: "weakref.WeakSet[RecordPipeline]" = weakref.WeakSet()
+
+
+@atexit.register
+def _drain_pipelines() -> None:
+    """Hand buffered records to their consumers before the record logs close"""
+    for pipeline in list(_pipelines):
+        try:
+            pipeline.close()
+        except Exception as e:
+            logger.error(f"Failed to drain profiling pipeline at exit: {str(e)}")
+
+
+def _forget_inherited_pipelines() -> None:
+    """Drop the parent's pipelines in a forked child
+
+    Their consumer thread did not survive the fork and closing them could
+    block on a full queue, so they are never drained in the child.
+    """
+    _pipelines.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_pipelines)
+
+
+class _ThreadBuffer:
+    """Records and call counters owned by one producer thread"""
+
+    __slots__ = ("lock", "records", "since", "counts", "thread")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records: List[Record] = []
+        self.since = 0.0
+        self.counts: Dict[str, CallCounts] = {}
+        self.thread = threading.current_thread()
+
+
+class RecordPipeline:
+    """Per-thread buffering with a single background consumer.
+
+    Producer threads append to their own buffer (an uncontended lock) and
+    hand full batches to a bounded queue. One consumer thread feeds every
+    batch to ``consumer``, so the record store, statistics and record log
+    are only ever written from one thread. Buffers older than ``max_delay``
+    are swept by the consumer so idle threads are not left behind.
+
+    When ``max_pending`` batches are queued, ``overflow="drop"`` discards
+    new batches and counts them in ``dropped``; ``"block"`` makes producers
+    wait for the consumer instead.
+    """
+
+    def __init__(self, consumer: Callable[[List[Record]], None], batch_size: int = 64,
+                 max_delay: float = 0.2, max_pending: int = 1024, overflow: str = "drop"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.overflow = overflow
+        self.submitted = 0
+        self.dropped = 0
+
+        self._queue: "queue.Queue[Optional[List[Record]]]" = queue.Queue(maxsize=max_pending)
+        self._local = threading.local()
+        self._buffers: List[_ThreadBuffer] = []
+        self._buffers_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        # Counts of threads that have exited, folded in by the sweep
+        self._retired_counts: Dict[str, CallCounts] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._start()
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler-record-pipeline", daemon=True)
+        self._thread.start()
+        _pipelines.add(self)
+
+    def _buffer(self) -> _ThreadBuffer:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadBuffer()
+            with self._buffers_lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def count(self, func_key: str, elapsed: float, profiled: bool) -> int:
+        """Count a call in the calling thread; returns the weight of a profiled record"""
+        buffer = self._buffer()
+        with buffer.lock:
+            counts = buffer.counts.get(func_key)
+            if counts is None:
+                counts = buffer.counts[func_key] = CallCounts()
+            return counts.add(elapsed, profiled)
+
+    def submit(self, func_key: str, entry: Dict[str, Any]) -> None:
+        buffer = self._buffer()
+        with buffer.lock:
+            if not buffer.records:
+                buffer.since = time.monotonic()
+            buffer.records.append((func_key, entry))
+            if len(buffer.records) < self.batch_size and time.monotonic() - buffer.since < self.max_delay:
+                return
+            batch, buffer.records = buffer.records, []
+        self._handoff(batch)
+
+    def _handoff(self, batch: List[Record]) -> None:
+        # Taken once per batch, not per record
+        with self._counter_lock:
+            self.submitted += len(batch)
+        if self.overflow == "block":
+            self._queue.put(batch)
+            return
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += len(batch)
+
+    def _sweep(self, max_age: float) -> None:
+        """Hand off buffers older than ``max_age`` and retire dead threads"""
+        now = time.monotonic()
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+        for buffer in buffers:
+            retired = not buffer.thread.is_alive()
+            with buffer.lock:
+                if buffer.records and (retired or now - buffer.since >= max_age):
+                    batch, buffer.records = buffer.records, []
+                else:
+                    batch = None
+            if batch:
+                self._handoff(batch)
+            if retired:
+                with self._buffers_lock:
+                    if buffer in self._buffers:
+                        self._buffers.remove(buffer)
+                        _merge_counts(self._retired_counts, buffer.counts)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.max_delay)
+            except queue.Empty:
+                self._sweep(self.max_delay)
+                continue
+            try:
+                if batch is None:
+                    return
+                self.consumer(batch)
+            except Exception as e:
+                logger.error(f"Failed to process profiling records: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Hand off every buffered record and wait until the consumer has processed it"""
+        if threading.current_thread() is self._thread:
+            return
+        self._sweep(0.0)
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def call_counts(self) -> Dict[str, CallCounts]:
+        """Exact call counters merged across all threads"""
+        with self._buffers_lock:
+            merged: Dict[str, CallCounts] = {}
+            _merge_counts(merged, self._retired_counts)
+            buffers = list(self._buffers)
+        for buffer in buffers:
+            with buffer.lock:
+                _merge_counts(merged, buffer.counts)
+        return merged
+
+    def close(self) -> None:
+        """Flush and stop the consumer thread"""
+        if self._thread is None:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        _pipelines.discard(self)
+
+
+def _merge_counts(target: Dict[str, CallCounts], source: Dict[str, CallCounts]) -> None:
+    for func_key, counts in source.items():
+        merged = target.get(func_key)
+        if merged is None:
+            merged = target[func_key] = CallCounts()
+        merged.calls += counts.calls
+        merged.profiled += counts.profiled
+        merged.total_time += counts.total_time
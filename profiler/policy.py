@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class ProfilingPolicy:
+    """Decide which calls of a decorated function get a full profile.
+
+    ``sample_rate`` profiles each call with that probability (``0.01`` is
+    roughly one call in a hundred) and ``max_per_second`` caps full profiles
+    per ``func_key`` with a token bucket holding up to ``burst`` tokens.
+    Calls that are not selected are still timed and counted.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_per_second: Optional[float] = None,
+                 burst: Optional[int] = None):
+        if not 0.0 < sample_rate <= 1.0:
+            raise ValueError("sample_rate must be in (0, 1]")
+        if max_per_second is not None and max_per_second <= 0:
+            raise ValueError("max_per_second must be positive")
+        self.sample_rate = sample_rate
+        self.max_per_second = max_per_second
+        self.burst = burst if burst is not None else max(1, int(max_per_second or 1))
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def override(self, sample_rate: Optional[float] = None,
+                 max_per_second: Optional[float] = None) -> "ProfilingPolicy":
+        """Return this policy, or a copy with per-decorator overrides applied"""
+        if sample_rate is None and max_per_second is None:
+            return self
+        return ProfilingPolicy(
+            sample_rate=self.sample_rate if sample_rate is None else sample_rate,
+            max_per_second=self.max_per_second if max_per_second is None else max_per_second,
+            burst=None if max_per_second is not None else self.burst,
+        )
+
+    def should_profile(self, func_key: str) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_per_second is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(func_key)
+            if bucket is None:
+                bucket = self._buckets[func_key] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.max_per_second)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1.0
+            return True
+
+
+class CallCounts:
+    """Exact per-function counters kept for every call, profiled or not"""
+
+    __slots__ = ("calls", "profiled", "total_time", "unprofiled_since_last")
+
+    def __init__(self):
+        self.calls = 0
+        self.profiled = 0
+        self.total_time = 0.0
+        self.unprofiled_since_last = 0
+
+    def add(self, elapsed: float, profiled: bool) -> int:
+        """Count a call and return the number of calls a profiled record stands for"""
+        self.calls += 1
+        self.total_time += elapsed
+        if not profiled:
+            self.unprofiled_since_last += 1
+            return 0
+        self.profiled += 1
+        weight = self.unprofiled_since_last + 1
+        self.unprofiled_since_last = 0
+        return weight
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "profiled": self.profiled,
+            "total_time": round(self.total_time, 6),
+            "mean_time": round(self.total_time / self.calls, 9) if self.calls else 0.0,
+        }
@@ -0,0 +1,172 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("always", "batch", "never")
+
+_open_logs: "weakref.WeakSet[RecordLog]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_logs() -> None:
+    """Flush buffered records of every live log at interpreter exit"""
+    for log in list(_open_logs):
+        try:
+            log.close()
+        except Exception as e:
+            logger.error(f"Failed to flush {log.path} at exit: {str(e)}")
+
+
+def _forget_inherited_logs() -> None:
+    """Drop the parent's logs in a forked child without flushing them
+
+    Their buffers hold the parent's records, which the parent writes
+    itself; flushing them at the child's exit would duplicate them.
+    """
+    for log in list(_open_logs):
+        log._forget()
+    _open_logs.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_logs)
+
+
+class RecordLog:
+    """Append-only JSON Lines log of profiling records.
+
+    Records are buffered in memory and written by a background thread when
+    ``max_buffer`` records are pending or every ``flush_interval`` seconds.
+    ``fsync`` controls durability: ``"always"`` writes and fsyncs on every
+    append, ``"batch"`` fsyncs after each background flush and ``"never"``
+    leaves it to the OS.
+
+    Logs are always opened on a fresh shard path, so a partially written
+    last line left by a crash is never appended to; shard readers skip it.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0,
+                 max_buffer: int = 1000, fsync: str = "batch"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.fsync = fsync
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._file = None
+        self._write_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_writer(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="profiler-record-log", daemon=True)
+            self._thread.start()
+            _open_logs.add(self)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Queue a record for writing"""
+        if self.fsync == "always":
+            with self._cond:
+                self._buffer.append(record)
+            _open_logs.add(self)
+            self.flush()
+            return
+        with self._cond:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.max_buffer:
+                self._cond.notify()
+        self._ensure_writer()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.max_buffer:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush record log {self.path}: {str(e)}")
+            if closed:
+                return
+
+    def flush(self) -> int:
+        """Write pending records and return the log size in bytes"""
+        with self._write_lock:
+            with self._cond:
+                pending, self._buffer = self._buffer, []
+            if not pending and self._file is None:
+                return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            if pending:
+                lines = "".join(json.dumps(r, default=str) + "\n" for r in pending)
+                self._file.write(lines.encode("utf-8"))
+                self._file.flush()
+                if self.fsync != "never":
+                    os.fsync(self._file.fileno())
+            return self._file.tell()
+
+    def close(self) -> None:
+        """Flush pending records and stop the background writer"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self._closed = False
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        _open_logs.discard(self)
+
+    def _forget(self) -> None:
+        """Discard buffered records, the writer and the file handle without writing anything"""
+        self._buffer = []
+        if self._file is not None:
+            # Close the descriptor but not the buffered writer, which could
+            # still hold a parent write caught mid-flush by the fork
+            try:
+                self._file.raw.close()
+            except OSError:
+                pass
+            self._file = None
+        self._thread = None
+        self._write_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def rotate(self, consumed: int, new_path: str) -> bool:
+        """Switch to ``new_path`` if everything written so far has been consumed.
+
+        The old file is removed. Records still buffered are written to the
+        new file on the next flush.
+        """
+        with self._write_lock:
+            if self._file is not None:
+                self._file.flush()
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size != consumed:
+                return False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            old_path, self.path = self.path, new_path
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove consumed record log {old_path}: {str(e)}")
+            return True
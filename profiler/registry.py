@@ -0,0 +1,67 @@
+import inspect
+import itertools
+import os
+import threading
+import logging
+from typing import Any, Dict, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class FunctionInfo(NamedTuple):
+    """Identity of a profiled function, resolved once at decoration time"""
+    id: int
+    module: str
+    qualname: str
+    name: str
+    file: str
+    lineno: int
+    key: str
+
+
+class FunctionRegistry:
+    """Cache of FunctionInfo keyed by code object.
+
+    Resolution uses the code object's own filename and line, so the
+    ``inspect.stack()`` fallback is never needed on the call path. Keys use
+    ``__qualname__``, which tells apart methods that share a ``__name__``.
+    """
+
+    def __init__(self):
+        self._by_code: Dict[Any, FunctionInfo] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def resolve(self, func: Any) -> FunctionInfo:
+        target = inspect.unwrap(func)
+        code = getattr(target, "__code__", None)
+        cache_key = code if code is not None else target
+        info = self._by_code.get(cache_key)
+        if info is not None:
+            return info
+        with self._lock:
+            info = self._by_code.get(cache_key)
+            if info is None:
+                info = self._by_code[cache_key] = self._build(func, target, code)
+        return info
+
+    def _build(self, func: Any, target: Any, code: Any) -> FunctionInfo:
+        name = getattr(func, "__name__", None) or type(func).__name__
+        qualname = getattr(func, "__qualname__", None) or name
+        module = getattr(func, "__module__", None) or ""
+        if code is not None:
+            filename = os.path.basename(code.co_filename)
+            lineno = code.co_firstlineno
+        else:
+            filename, lineno = "unknown_file.py", 0
+            try:
+                mod = inspect.getmodule(target)
+                if mod is not None and getattr(mod, "__file__", None):
+                    filename = os.path.basename(mod.__file__)
+            except Exception as e:
+                logger.warning(f"Filename resolution failed for {qualname}: {str(e)}")
+        return FunctionInfo(next(self._ids), module, qualname, name, filename, lineno,
+                            f"{filename}:{qualname}")
+
+
+registry = FunctionRegistry()
@@ -0,0 +1,281 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .database import DATABASE_FILE
+from .shards import ShardSet
+from .store import entry_key, format_timestamp, timestamp_micros
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS = ("execution_time", "peak_memory_mb")
+DEFAULT_THRESHOLD = 0.2
+
+# system_info fields that identify the machine; runs are only compared within one fingerprint
+FINGERPRINT_KEYS = ("os", "architecture", "total_ram_gb", "cpu_cores_physical",
+                    "cpu_cores_logical", "cpu_max_freq")
+
+# Larger samples are bootstrapped m-out-of-n to keep memory bounded
+_MAX_BOOTSTRAP_SAMPLES = 5000
+
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+EXIT_NO_BASELINE = 2
+
+
+def _finite(value: float) -> Optional[float]:
+    # Keeps the report strict JSON: no Infinity or NaN
+    return value if math.isfinite(value) else None
+
+
+def fingerprint(system_info: Any) -> str:
+    """Stable identifier of the hardware a run was recorded on"""
+    if not isinstance(system_info, dict):
+        return "unknown"
+    return json.dumps({key: system_info.get(key) for key in FINGERPRINT_KEYS}, sort_keys=True)
+
+
+class Run:
+    """Records of one profiling session, per function and metric"""
+
+    def __init__(self, session_id: str, fingerprint: str):
+        self.session_id = session_id
+        self.fingerprint = fingerprint
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.values: Dict[str, Dict[str, List[float]]] = {}
+
+    def add(self, entry: Dict[str, Any], metrics: Sequence[str]) -> None:
+        micros = timestamp_micros(entry.get("timestamp"))
+        if micros is not None:
+            self.start = micros if self.start is None else min(self.start, micros)
+            self.end = micros if self.end is None else max(self.end, micros)
+        series = self.values.setdefault(entry_key(entry), {})
+        for metric in metrics:
+            value = entry.get(metric)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+                series.setdefault(metric, []).append(float(value))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "start": format_timestamp(self.start) if self.start is not None else None,
+            "end": format_timestamp(self.end) if self.end is not None else None,
+            "functions": len(self.values),
+        }
+
+
+def group_runs(records: Iterable[Dict[str, Any]],
+               metrics: Sequence[str] = DEFAULT_METRICS) -> Dict[str, Run]:
+    """Group records by ``session_id`` (records written before sessions existed share "unknown")"""
+    runs: Dict[str, Run] = {}
+    for entry in records:
+        session_id = str(entry.get("session_id") or "unknown")
+        run = runs.get(session_id)
+        if run is None:
+            run = runs[session_id] = Run(session_id, fingerprint(entry.get("system_info")))
+        run.add(entry, metrics)
+    return runs
+
+
+def _rankdata(values: np.ndarray) -> np.ndarray:
+    """1-based ranks with ties averaged"""
+    order = np.argsort(values, kind="mergesort")
+    ordered = values[order]
+    first = np.r_[True, ordered[1:] != ordered[:-1]]
+    group = np.cumsum(first) - 1
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.r_[starts, len(values)])
+    ranks = np.empty(len(values))
+    ranks[order] = (starts + (counts + 1) / 2.0)[group]
+    return ranks
+
+
+def mann_whitney_greater(baseline: np.ndarray, current: np.ndarray) -> float:
+    """One-sided Mann-Whitney U p-value for ``current`` tending to be larger than ``baseline``
+
+    Normal approximation with tie and continuity correction.
+    """
+    n1, n2 = len(baseline), len(current)
+    combined = np.concatenate([baseline, current])
+    u = _rankdata(combined)[n1:].sum() - n2 * (n2 + 1) / 2.0
+    _, counts = np.unique(combined, return_counts=True)
+    n = n1 + n2
+    ties = float((counts ** 3 - counts).sum())
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2.0 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def bootstrap_quantile_change(baseline: np.ndarray, current: np.ndarray, q: float = 0.95,
+                              resamples: int = 1000, confidence: float = 0.95,
+                              seed: Optional[int] = 0) -> List[float]:
+    """Bootstrap CI of ``quantile(current) / quantile(baseline) - 1``, all resamples at once"""
+    rng = np.random.default_rng(seed)
+
+    def resampled_quantiles(values: np.ndarray) -> np.ndarray:
+        size = min(len(values), _MAX_BOOTSTRAP_SAMPLES)
+        return np.quantile(values[rng.integers(0, len(values), (resamples, size))], q, axis=1)
+
+    base, cur = resampled_quantiles(baseline), resampled_quantiles(current)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(base > 0, cur / base - 1.0, np.nan)
+    change = change[np.isfinite(change)]
+    if len(change) == 0:
+        return [math.nan, math.nan]
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(change, [tail, 100 - tail])
+    return [float(low), float(high)]
+
+
+def compare_runs(baseline: Run, current: Run, metrics: Sequence[str] = DEFAULT_METRICS,
+                 threshold: float = DEFAULT_THRESHOLD, quantile: float = 0.95,
+                 min_samples: int = 5, resamples: int = 1000, alpha: float = 0.05,
+                 seed: Optional[int] = 0) -> List[Dict[str, Any]]:
+    """Per function and metric: quantile change, its bootstrap CI, Mann-Whitney p and a status
+
+    A change is a ``regression`` when the ``quantile`` grew by at least
+    ``threshold`` and the lower CI bound is above zero, and an
+    ``improvement`` in the mirrored case. Without a finite CI (e.g. a
+    baseline quantile of zero) the status is ``insufficient_data``.
+    """
+    results = []
+    for func_key in sorted(set(baseline.values) | set(current.values)):
+        for metric in metrics:
+            base = np.asarray(baseline.values.get(func_key, {}).get(metric, []))
+            cur = np.asarray(current.values.get(func_key, {}).get(metric, []))
+            result: Dict[str, Any] = {
+                "function": func_key,
+                "metric": metric,
+                "baseline_samples": len(base),
+                "current_samples": len(cur),
+            }
+            if len(base) < min_samples or len(cur) < min_samples:
+                result["status"] = "insufficient_data"
+                results.append(result)
+                continue
+            base_q = float(np.quantile(base, quantile))
+            cur_q = float(np.quantile(cur, quantile))
+            change = cur_q / base_q - 1.0 if base_q > 0 else (math.inf if cur_q > 0 else 0.0)
+            ci = bootstrap_quantile_change(base, cur, quantile, resamples, 1 - alpha, seed)
+            if math.isnan(ci[0]) or math.isnan(ci[1]):
+                # No resample had a positive baseline quantile to compare against
+                status = "insufficient_data"
+            elif change >= threshold and not ci[0] <= 0:
+                status = "regression"
+            elif change <= -threshold and not ci[1] >= 0:
+                status = "improvement"
+            else:
+                status = "unchanged"
+            result.update({
+                f"baseline_p{int(quantile * 100)}": base_q,
+                f"current_p{int(quantile * 100)}": cur_q,
+                "change": _finite(change),
+                "ci": [_finite(bound) for bound in ci],
+                "mann_whitney_p": mann_whitney_greater(base, cur),
+                "status": status,
+            })
+            results.append(result)
+    return results
+
+
+def _latest(runs: Iterable[Run]) -> Optional[Run]:
+    runs = [run for run in runs if run.start is not None]
+    return max(runs, key=lambda run: run.start) if runs else None
+
+
+def detect_regressions(records: Iterable[Dict[str, Any]], baseline: Optional[str] = None,
+                       current: Optional[str] = None, metrics: Sequence[str] = DEFAULT_METRICS,
+                       threshold: float = DEFAULT_THRESHOLD, **options: Any) -> Dict[str, Any]:
+    """Compare the current run against a baseline run on the same hardware
+
+    ``current`` defaults to the latest session and ``baseline`` to the
+    latest earlier session with the same hardware fingerprint. Returns a
+    JSON-serialisable report; ``report["regressions"]`` counts flagged
+    function/metric pairs and is ``None`` when there is nothing to compare.
+    ``options`` are passed to ``compare_runs``.
+    """
+    runs = group_runs(records, metrics)
+    report: Dict[str, Any] = {"threshold": threshold, "metrics": list(metrics),
+                              "baseline": None, "current": None, "regressions": None, "results": []}
+    current_run = runs.get(current) if current else _latest(runs.values())
+    if current_run is None:
+        report["error"] = f"No run found for session {current!r}" if current else "No runs recorded"
+        return report
+    report["current"] = current_run.describe()
+
+    if baseline:
+        baseline_run = runs.get(baseline)
+    else:
+        baseline_run = _latest(
+            run for run in runs.values()
+            if run is not current_run and run.fingerprint == current_run.fingerprint
+            and run.start is not None and run.start < current_run.start
+        )
+    if baseline_run is None:
+        report["error"] = (f"No run found for session {baseline!r}" if baseline
+                           else "No earlier run on the same hardware to compare against")
+        return report
+    report["baseline"] = baseline_run.describe()
+    if baseline_run.fingerprint != current_run.fingerprint:
+        report["warning"] = "Baseline and current runs were recorded on different hardware"
+
+    report["results"] = compare_runs(baseline_run, current_run, metrics, threshold, **options)
+    report["regressions"] = sum(1 for r in report["results"] if r["status"] == "regression")
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Short human-readable summary of a regression report"""
+    if report.get("error"):
+        return f"No comparison: {report['error']}"
+    lines = [f"Baseline {report['baseline']['session_id']} vs current {report['current']['session_id']}: "
+             f"{report['regressions']} regression(s) at {report['threshold']:.0%} threshold"]
+    for result in report["results"]:
+        if result["status"] in ("regression", "improvement"):
+            change, low, high = (f"{v:+.1%}" if v is not None else "n/a" for v in [result["change"], *result["ci"]])
+            lines.append(f"  {result['status']:<11} {result['function']} {result['metric']}: "
+                         f"{change} (CI {low} .. {high}, Mann-Whitney p={result['mann_whitney_p']:.3g})")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """CLI: exit 1 when a regression is found, 2 when there is no baseline to compare with"""
+    parser = argparse.ArgumentParser(prog="python -m profiler.regression",
+                                     description="Detect performance regressions between profiling runs")
+    parser.add_argument("report_dir", nargs="?", default=os.path.join(os.getcwd(), "reports"))
+    parser.add_argument("--baseline", help="baseline session_id (default: previous run on the same hardware)")
+    parser.add_argument("--current", help="current session_id (default: latest run)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative p95 change that counts as a regression (default: 0.2)")
+    parser.add_argument("--metric", action="append", dest="metrics",
+                        help=f"metric to compare, repeatable (default: {', '.join(DEFAULT_METRICS)})")
+    parser.add_argument("--min-samples", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    json_dir = os.path.join(args.report_dir, "JsonData")
+    storage = "sqlite" if os.path.exists(os.path.join(json_dir, DATABASE_FILE)) else "json"
+    records = ShardSet(json_dir, storage=storage).iter_records()
+    report = detect_regressions(records, baseline=args.baseline, current=args.current,
+                                metrics=args.metrics or DEFAULT_METRICS, threshold=args.threshold,
+                                min_samples=args.min_samples)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    print(format_report(report))
+    if report["regressions"] is None:
+        return EXIT_NO_BASELINE
+    return EXIT_REGRESSION if report["regressions"] else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .stats import FunctionStats
+from .store import entry_key, format_timestamp, timestamp_micros
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DIR = "rollups"
+
+# Rollup levels from finest to coarsest, with their bucket width in seconds
+LEVELS = (("minute", 60), ("hour", 3600), ("day", 86400))
+
+# Entry fields copied onto a rollup so charts can be named without raw records
+_INFO_FIELDS = ("file", "function", "qualname", "source")
+
+Duration = Union[None, int, float, timedelta]
+
+
+def _micros(value: Duration) -> Optional[int]:
+    if value is None:
+        return None
+    seconds = value.total_seconds() if isinstance(value, timedelta) else float(value)
+    if seconds <= 0:
+        raise ValueError(f"Durations must be positive, got {value!r}")
+    return int(seconds * 1_000_000)
+
+
+def _now_micros() -> int:
+    return time.time_ns() // 1000
+
+
+class RetentionPolicy:
+    """How much raw history a report directory keeps, and for how long rollups are kept
+
+    Raw records older than ``raw_ttl``, or beyond the newest
+    ``max_records`` (or roughly ``max_bytes`` of stored records), are
+    removed at compaction and folded into minute rollups. Minute rollups
+    older than ``minute_ttl`` are folded into hour rollups, hour rollups
+    into day rollups, and day rollups older than ``day_ttl`` are dropped.
+    A ``None`` TTL or cap never expires anything. Durations take seconds or
+    ``timedelta``.
+    """
+
+    def __init__(self, raw_ttl: Duration = None, max_records: Optional[int] = None,
+                 max_bytes: Optional[int] = None, minute_ttl: Duration = timedelta(hours=6),
+                 hour_ttl: Duration = timedelta(days=30), day_ttl: Duration = None):
+        self.raw_ttl = _micros(raw_ttl)
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.level_ttls = {"minute": _micros(minute_ttl), "hour": _micros(hour_ttl), "day": _micros(day_ttl)}
+
+    @property
+    def bounded(self) -> bool:
+        """True when raw records can expire at all"""
+        return self.raw_ttl is not None or self.max_records is not None or self.max_bytes is not None
+
+    def raw_cutoff(self, now: Optional[int] = None) -> Optional[int]:
+        """Raw records before this many microseconds since the epoch expire"""
+        if self.raw_ttl is None:
+            return None
+        return (now if now is not None else _now_micros()) - self.raw_ttl
+
+    def record_limit(self, stored_bytes: int = 0, stored_records: int = 0) -> Optional[int]:
+        """Most raw records to keep; ``max_bytes`` is converted with the current average record size"""
+        limits = [self.max_records] if self.max_records is not None else []
+        if self.max_bytes is not None and stored_records > 0 and stored_bytes > 0:
+            limits.append(int(self.max_bytes / (stored_bytes / stored_records)))
+        return min(limits) if limits else None
+
+
+class RollupStats(FunctionStats):
+    """Aggregates of one rollup bucket; CPU usage is kept too so charts can draw it"""
+
+    METRICS = ("execution_time", "peak_memory_mb", "cpu_usage")
+
+
+class Rollup:
+    """Count, moments and quantile sketches of one function over one time bucket"""
+
+    __slots__ = ("func_key", "level", "bucket", "info", "stats")
+
+    def __init__(self, func_key: str, level: str, bucket: int, info: Dict[str, Any],
+                 stats: Optional[RollupStats] = None):
+        self.func_key = func_key
+        self.level = level
+        self.bucket = bucket
+        self.info = info
+        self.stats = stats or RollupStats()
+
+    @property
+    def width(self) -> int:
+        return dict(LEVELS)[self.level] * 1_000_000
+
+    @property
+    def count(self) -> int:
+        return self.stats.count
+
+    def summary(self) -> Dict[str, Any]:
+        """Bucket start and end, the function's names and count/mean/p50/p95/p99 per metric"""
+        return dict(self.info, func_key=self.func_key, level=self.level,
+                    start=format_timestamp(self.bucket), end=format_timestamp(self.bucket + self.width),
+                    **self.stats.summary())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.info, func_key=self.func_key, bucket=format_timestamp(self.bucket),
+                    stats=self.stats.to_dict())
+
+    @classmethod
+    def from_dict(cls, level: str, data: Dict[str, Any]) -> "Rollup":
+        info = {name: data[name] for name in _INFO_FIELDS if data.get(name) is not None}
+        return cls(data["func_key"], level, timestamp_micros(data["bucket"]), info,
+                   RollupStats.from_dict(data.get("stats", {})))
+
+
+class RollupStore:
+    """Rollups of a report directory: one JSON Lines file per level, sorted by bucket
+
+    Files are only rewritten by compaction, under the compaction lock,
+    and always replaced atomically.
+    """
+
+    def __init__(self, json_dir: str):
+        self.directory = os.path.join(json_dir, ROLLUP_DIR)
+
+    def path(self, level: str) -> str:
+        return os.path.join(self.directory, f"{level}.jsonl")
+
+    def exists(self) -> bool:
+        return any(os.path.exists(self.path(level)) for level, _ in LEVELS)
+
+    def _read(self, level: str) -> Iterator[Rollup]:
+        try:
+            with open(self.path(level), "r") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield Rollup.from_dict(level, json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        logger.warning(f"Skipping corrupt rollup in {self.path(level)} line {number}: {str(e)}")
+        except FileNotFoundError:
+            return
+
+    def oldest(self, level: str) -> Optional[int]:
+        """Start of the oldest bucket of a level, read from the first line only"""
+        for rollup in self._read(level):
+            return rollup.bucket
+        return None
+
+    def load(self, level: str) -> Dict[Tuple[str, int], Rollup]:
+        return {(rollup.func_key, rollup.bucket): rollup for rollup in self._read(level)}
+
+    def save(self, level: str, rollups: Iterable[Rollup]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(level)
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            for rollup in sorted(rollups, key=lambda r: (r.bucket, r.func_key)):
+                f.write(json.dumps(rollup.to_dict()) + "\n")
+        os.replace(temp, path)
+
+    def query(self, since: Any = None, until: Any = None, functions: Optional[Sequence[str]] = None,
+              levels: Optional[Sequence[str]] = None) -> List[Rollup]:
+        """Rollups overlapping ``since <= t < until``, coarsest level first and by bucket"""
+        low = timestamp_micros(since) if since is not None else None
+        high = timestamp_micros(until) if until is not None else None
+        keys = set(functions) if functions is not None else None
+        result = []
+        for level, _ in reversed(LEVELS):
+            if levels is not None and level not in levels:
+                continue
+            for rollup in self._read(level):
+                if ((low is None or rollup.bucket + rollup.width > low)
+                        and (high is None or rollup.bucket < high)
+                        and (keys is None or rollup.func_key in keys)):
+                    result.append(rollup)
+        return result
+
+    def function_stats(self) -> Dict[str, FunctionStats]:
+        """Aggregates of every rolled-up record per function (in the ``FunctionStats`` metrics)"""
+        totals: Dict[str, FunctionStats] = {}
+        for rollup in self.query():
+            stats = totals.get(rollup.func_key)
+            if stats is None:
+                stats = totals[rollup.func_key] = FunctionStats()
+            for name in FunctionStats.METRICS:
+                stats.metrics[name].merge(rollup.stats.metrics[name])
+        return totals
+
+
+class RetentionPass:
+    """Expire raw records during one compaction and fold them into rollups
+
+    Compaction streams records oldest first and asks ``keep()`` about each
+    one; ``excess`` is how many of the oldest records must go to honour the
+    record cap. ``commit()`` then cascades expired minute and hour buckets
+    into coarser levels and rewrites the levels that changed.
+    """
+
+    def __init__(self, policy: RetentionPolicy, store: RollupStore, excess: int = 0,
+                 now: Optional[int] = None):
+        self.policy = policy
+        self.store = store
+        self.now = now if now is not None else _now_micros()
+        self.cutoff = policy.raw_cutoff(self.now)
+        self.excess = max(excess, 0)
+        self.expired = 0
+        self._levels: Dict[str, Dict[Tuple[str, int], Rollup]] = {}
+        self._dirty = set()
+
+    def _level(self, level: str) -> Dict[Tuple[str, int], Rollup]:
+        rollups = self._levels.get(level)
+        if rollups is None:
+            rollups = self._levels[level] = self.store.load(level)
+        return rollups
+
+    def _bucket(self, level: str, func_key: str, micros: int, info: Dict[str, Any]) -> Rollup:
+        width = dict(LEVELS)[level] * 1_000_000
+        bucket = micros - micros % width
+        rollups = self._level(level)
+        rollup = rollups.get((func_key, bucket))
+        if rollup is None:
+            rollup = rollups[(func_key, bucket)] = Rollup(func_key, level, bucket, info)
+        self._dirty.add(level)
+        return rollup
+
+    def expires(self, micros: Optional[int]) -> bool:
+        return self.excess > 0 or (self.cutoff is not None and micros is not None and micros < self.cutoff)
+
+    def keep(self, entry: Dict[str, Any]) -> bool:
+        """False if the entry expires; it is then folded into its minute rollup
+
+        Every entry is checked against the TTL cutoff, so a late record
+        still expires wherever it appears; the record cap removes the first
+        ``excess`` entries, which compaction streams oldest first.
+        """
+        micros = timestamp_micros(entry.get("timestamp"))
+        if not self.expires(micros):
+            return True
+        self.excess = max(self.excess - 1, 0)
+        self.expired += 1
+        if micros is not None:
+            info = {name: entry[name] for name in _INFO_FIELDS if entry.get(name) is not None}
+            self._bucket(LEVELS[0][0], entry_key(entry), micros, info).stats.add(entry)
+        return False
+
+    def commit(self) -> None:
+        """Cascade expired buckets into coarser levels and save the changed levels"""
+        for index, (level, width) in enumerate(LEVELS):
+            ttl = self.policy.level_ttls.get(level)
+            if ttl is None:
+                continue
+            cutoff = self.now - ttl
+            if level not in self._levels:
+                oldest = self.store.oldest(level)
+                if oldest is None or oldest + width * 1_000_000 > cutoff:
+                    continue
+            rollups = self._level(level)
+            expired = [key for key, rollup in rollups.items() if rollup.bucket + rollup.width <= cutoff]
+            for key in expired:
+                rollup = rollups.pop(key)
+                if index + 1 < len(LEVELS):
+                    self._bucket(LEVELS[index + 1][0], rollup.func_key, rollup.bucket,
+                                 rollup.info).stats.merge(rollup.stats)
+            if expired:
+                self._dirty.add(level)
+        for level in self._dirty:
+            self.store.save(level, self._levels[level].values())
+        if self.expired:
+            logger.info(f"Rolled up {self.expired} expired records")
@@ -0,0 +1,301 @@
+import os
+import sys
+import sysconfig
+import threading
+import time
+import logging
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+def _library_prefixes() -> Tuple[str, ...]:
+    paths = sysconfig.get_paths()
+    dirs = {paths.get(name) for name in ("stdlib", "platstdlib", "purelib", "platlib")}
+    return tuple(os.path.join(os.path.normcase(os.path.abspath(d)), "") for d in dirs if d)
+
+
+# The standard library and installed packages; everything else is user code
+_LIBRARY_PREFIXES = _library_prefixes()
+
+
+def _is_library(filename: str) -> bool:
+    if filename.startswith("<"):
+        return filename.startswith("<frozen")
+    return os.path.normcase(os.path.abspath(filename)).startswith(_LIBRARY_PREFIXES)
+
+
+class CPUSampler:
+    """Background sampler of cumulative process and system CPU times.
+
+    A daemon thread reads the CPU counters every ``interval`` seconds into a
+    fixed-size ring buffer. Utilisation over any recent window is computed
+    from the two samples bracketing it, so callers never sleep or block.
+    """
+
+    def __init__(self, interval: float = 0.05, capacity: int = 1200):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.interval = interval
+        self.capacity = capacity
+        self._process = psutil.Process()
+        # Ring buffer columns: sample time, process CPU seconds,
+        # system busy seconds and system total seconds
+        self._times: List[float] = [0.0] * capacity
+        self._proc: List[float] = [0.0] * capacity
+        self._busy: List[float] = [0.0] * capacity
+        self._total: List[float] = [0.0] * capacity
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the sampling thread (no-op if already running)"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="profiler-cpu-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sampling thread, keeping the buffered samples"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.interval * 2))
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning(f"CPU sampling failed: {str(e)}")
+
+    def sample(self) -> None:
+        """Take a single reading and append it to the ring buffer"""
+        now = time.perf_counter()
+        proc = self._process.cpu_times()
+        system = psutil.cpu_times()
+        total = sum(system)
+        busy = total - system.idle - getattr(system, "iowait", 0.0)
+        with self._lock:
+            idx = (self._head + self._count) % self.capacity
+            if self._count == self.capacity:
+                self._head = (self._head + 1) % self.capacity
+            else:
+                self._count += 1
+            self._times[idx] = now
+            self._proc[idx] = proc.user + proc.system
+            self._busy[idx] = busy
+            self._total[idx] = total
+
+    def _bisect(self, value: float, find: Callable[..., int]) -> int:
+        """``find`` (bisect_left/right) over the samples in time order, without copying the ring
+
+        The ring holds at most two sorted runs: from ``_head`` to the end of
+        the list, then the samples wrapped to its front, which are newer.
+        """
+        head, end = self._head, self._head + self._count
+        if end <= self.capacity:
+            return find(self._times, value, head, end) - head
+        index = find(self._times, value, head, self.capacity)
+        if index < self.capacity:
+            return index - head
+        return self.capacity - head + find(self._times, value, 0, end - self.capacity)
+
+    def cpu_usage(self, start: float, end: float) -> Tuple[float, float]:
+        """Return (system %, process %) over the ``perf_counter`` window [start, end].
+
+        Uses the latest sample at or before ``start`` and the earliest sample at
+        or after ``end``. When the window falls between two samples, the most
+        recent sampling interval is used instead.
+        """
+        with self._lock:
+            if self._count < 2:
+                return 0.0, 0.0
+            lo = max(self._bisect(start, bisect_right) - 1, 0)
+            hi = min(self._bisect(end, bisect_left), self._count - 1)
+            if hi <= lo:
+                hi = self._count - 1
+                lo = hi - 1
+            i0 = (self._head + lo) % self.capacity
+            i1 = (self._head + hi) % self.capacity
+            wall = self._times[i1] - self._times[i0]
+            total = self._total[i1] - self._total[i0]
+            busy = self._busy[i1] - self._busy[i0]
+            proc = self._proc[i1] - self._proc[i0]
+
+        system_pct = 100.0 * busy / total if total > 0 else 0.0
+        process_pct = 100.0 * proc / wall if wall > 0 else 0.0
+        return max(system_pct, 0.0), max(process_pct, 0.0)
+
+
+# Background threads of the profiler itself are never sampled
+INTERNAL_THREAD_PREFIX = "profiler-"
+
+
+class SampledFunction:
+    """Samples whose innermost frame was in one function during a window"""
+
+    __slots__ = ("file", "qualname", "name", "samples", "seconds", "lines")
+
+    def __init__(self, file: str, qualname: str, name: str):
+        self.file = file
+        self.qualname = qualname
+        self.name = name
+        self.samples = 0
+        # Estimated wall time: samples / hz
+        self.seconds = 0.0
+        self.lines: Counter = Counter()
+
+    @property
+    def key(self) -> str:
+        return f"{self.file}:{self.qualname}"
+
+
+class StackSampler:
+    """Statistical whole-program profiler based on ``sys._current_frames()``.
+
+    A daemon thread captures the stack of every other thread ``hz`` times
+    per second (wall-clock sampling: blocked threads are sampled where they
+    wait). Samples are attributed to the innermost function and line, and
+    every ``window`` seconds ``callback(start, end, functions)`` receives
+    the per-function counts of that window with ``perf_counter`` bounds.
+    Full stacks are kept as collapsed-stack counts for flamegraphs.
+    Overhead is fixed by ``hz`` and the number of threads, not by how
+    often functions are called.
+
+    With ``user_code`` (the default), a sample whose innermost frames are
+    in the standard library or installed packages is attributed to the
+    innermost frame of user code instead, at the line that called into
+    the library; threads with no user code on their stack are only kept
+    in the collapsed stacks.
+    """
+
+    def __init__(self, callback: Callable[[float, float, Dict[str, SampledFunction]], None],
+                 hz: float = 100.0, window: float = 1.0, max_depth: int = 128, user_code: bool = True):
+        if hz <= 0:
+            raise ValueError("hz must be positive")
+        self.callback = callback
+        self.hz = hz
+        self.window = window
+        self.max_depth = max_depth
+        self.user_code = user_code
+        self.samples = 0
+        self._labels: Dict[Any, Tuple[str, str, str, bool]] = {}
+        self._functions: Dict[str, SampledFunction] = {}
+        self._stacks: Counter = Counter()
+        self._stacks_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StackSampler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{INTERNAL_THREAD_PREFIX}stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling; the last partial window is still delivered"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _label(self, code: Any) -> Tuple[str, str, str, bool]:
+        """(file, qualname, name, whether the code is library code)"""
+        label = self._labels.get(code)
+        if label is None:
+            qualname = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = (os.path.basename(code.co_filename), qualname, code.co_name,
+                                          _is_library(code.co_filename))
+        return label
+
+    @staticmethod
+    def _internal_threads() -> set:
+        return {t.ident for t in threading.enumerate() if t.name.startswith(INTERNAL_THREAD_PREFIX)}
+
+    def _take_sample(self, skip: set) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            names = []
+            owner = None
+            while frame is not None and len(names) < self.max_depth:
+                label = self._label(frame.f_code)
+                if owner is None and not (self.user_code and label[3]):
+                    owner = label, frame.f_lineno
+                names.append(f"{label[0]}:{label[1]}".replace(";", "_"))
+                frame = frame.f_back
+            if owner is not None:
+                (file, qualname, name, _), lineno = owner
+                key = f"{file}:{qualname}"
+                function = self._functions.get(key)
+                if function is None:
+                    function = self._functions[key] = SampledFunction(file, qualname, name)
+                function.samples += 1
+                function.lines[lineno] += 1
+            stack = ";".join(reversed(names))
+            with self._stacks_lock:
+                self._stacks[stack] += 1
+            self.samples += 1
+
+    def _emit(self, start: float, end: float) -> None:
+        functions, self._functions = self._functions, {}
+        if not functions:
+            return
+        for function in functions.values():
+            function.seconds = function.samples / self.hz
+        try:
+            self.callback(start, end, functions)
+        except Exception as e:
+            logger.warning(f"Stack sample window could not be recorded: {str(e)}")
+
+    def _run(self) -> None:
+        interval = 1.0 / self.hz
+        window_start = next_tick = time.perf_counter()
+        skip = self._internal_threads()
+        while not self._stop_event.wait(max(next_tick - time.perf_counter(), 0.0)):
+            now = time.perf_counter()
+            # Skip ticks that were missed instead of sampling in a burst
+            next_tick = max(next_tick + interval, now + interval / 2)
+            try:
+                self._take_sample(skip)
+            except Exception as e:
+                logger.warning(f"Stack sampling failed: {str(e)}")
+            if now - window_start >= self.window:
+                self._emit(window_start, now)
+                window_start = now
+                skip = self._internal_threads()
+        self._emit(window_start, time.perf_counter())
+
+    def stack_micros(self) -> Dict[str, int]:
+        """Estimated wall time per sampled stack, in microseconds"""
+        micros_per_sample = 1_000_000 / self.hz
+        with self._stacks_lock:
+            return {stack: round(count * micros_per_sample) for stack, count in self._stacks.items()}
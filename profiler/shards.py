@@ -0,0 +1,455 @@
+import heapq
+import json
+import logging
+import os
+import socket
+import time
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import psutil
+
+from .database import DATABASE_FILE, RecordDatabase
+from .retention import RetentionPass, RetentionPolicy, RollupStore
+from .store import RecordStore, entry_key, timestamp_micros
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = "shards"
+SHARD_PREFIX = "records-"
+BASE_FILE = "profiler_records.jsonl"
+LOG_VIEW = "profiler_log.json"
+TIME_SERIES_VIEW = "profiler_time_series.json"
+LOCK_FILE = ".compaction.lock"
+_TRAILER_KEY = "__shards__"
+# Bytes read at a time from each sorted lane of a shard tail
+_LANE_CHUNK = 64 * 1024
+STORAGE_BACKENDS = ("json", "sqlite")
+
+
+def shard_path(json_dir: str) -> str:
+    """New shard file for this process: records-<host>-<pid>-<token>.jsonl"""
+    host = socket.gethostname().replace(os.sep, "_")
+    token = format(time.time_ns(), "x")
+    return os.path.join(json_dir, SHARD_DIR, f"{SHARD_PREFIX}{host}-{os.getpid()}-{token}.jsonl")
+
+
+def _shard_owner(name: str) -> Optional[tuple]:
+    stem = name[len(SHARD_PREFIX):-len(".jsonl")]
+    parts = stem.rsplit("-", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1])
+
+
+def _owner_alive(name: str) -> bool:
+    """True unless the shard's writer is known to be gone (same host, no such pid)"""
+    owner = _shard_owner(name)
+    if owner is None:
+        return True
+    host, pid = owner
+    if host != socket.gethostname().replace(os.sep, "_"):
+        return True
+    return pid == os.getpid() or psutil.pid_exists(pid)
+
+
+def _sort_key(entry: Dict[str, Any]) -> int:
+    micros = timestamp_micros(entry.get("timestamp"))
+    return micros if micros is not None else 0
+
+
+def _filtered(entries: Iterable[Dict[str, Any]], since: Any = None, until: Any = None,
+              functions: Optional[Sequence[str]] = None) -> Iterable[Dict[str, Any]]:
+    """Entries with ``since <= timestamp < until`` whose func_key is in ``functions``"""
+    if since is None and until is None and functions is None:
+        return entries
+    low = timestamp_micros(since) if since is not None else None
+    high = timestamp_micros(until) if until is not None else None
+    keys = set(functions) if functions is not None else None
+    return (
+        entry for entry in entries
+        if (low is None or _sort_key(entry) >= low)
+        and (high is None or _sort_key(entry) < high)
+        and (keys is None or entry_key(entry) in keys)
+    )
+
+
+class _FileLock:
+    """Exclusive inter-process lock held while compacting a report directory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "_FileLock":
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        os.close(self._fd)
+        self._fd = None
+
+
+class _ShardReader:
+    """Iterate complete records of a shard between two byte offsets.
+
+    After iteration ``consumed`` is the offset just past the last complete
+    line, so a record still being written is picked up next time.
+
+    Each thread hands its records to the log in batches, so a shard written
+    by several threads interleaves that many ordered streams. ``scan()``
+    deals the records onto lanes in one pass, patience-sort style: each
+    record joins the lane whose last record is the latest one not after it.
+    That yields the fewest lanes in timestamp order, at most one per
+    writing thread, each kept as byte ranges. ``ordered()`` merges the
+    lanes while reading each one a chunk at a time, so no tail is ever
+    held in memory.
+    """
+
+    def __init__(self, path: str, offset: int, end: int):
+        self.path = path
+        self.offset = offset
+        self.end = end
+        self.consumed = offset
+        self.count = 0
+        self._lanes: Optional[List[Tuple[array, array]]] = None
+
+    def _lines(self) -> Iterator[Tuple[int, bytes]]:
+        """(offset, line) of every complete line"""
+        if self.offset >= self.end:
+            return
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.offset)
+            pos = self.offset
+            for line in f:
+                if pos + len(line) > self.end or not line.endswith(b"\n"):
+                    break
+                start, pos = pos, pos + len(line)
+                self.consumed = pos
+                if line.strip():
+                    yield start, line
+
+    def _records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for start, line in self._lines():
+            try:
+                yield start, json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                logger.warning(f"Skipping corrupt record in {self.path} at byte {start}: {str(e)}")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for _, entry in self._records():
+            yield entry
+
+    def scan(self) -> int:
+        """Count the records and deal them onto sorted lanes of byte ranges"""
+        lanes: List[Tuple[array, array]] = []
+        # Last sort key of every lane, ascending, and the lane it belongs to
+        tops: List[int] = []
+        top_lanes: List[int] = []
+        self.count = 0
+        for start, entry in self._records():
+            key = _sort_key(entry)
+            i = bisect_right(tops, key) - 1
+            if i < 0:
+                lane = len(lanes)
+                lanes.append((array("q"), array("q")))
+            else:
+                del tops[i]
+                lane = top_lanes.pop(i)
+            i = bisect_right(tops, key)
+            tops.insert(i, key)
+            top_lanes.insert(i, lane)
+            starts, ends = lanes[lane]
+            if ends and ends[-1] == start:
+                ends[-1] = self.consumed
+            else:
+                starts.append(start)
+                ends.append(self.consumed)
+            self.count += 1
+        self._lanes = lanes
+        return self.count
+
+    def ordered(self) -> Iterator[Dict[str, Any]]:
+        """The records in timestamp order, scanning first if needed"""
+        if self._lanes is None:
+            self.scan()
+        if not self._lanes:
+            return
+        try:
+            f = open(self.path, "rb", buffering=0)
+        except FileNotFoundError:
+            return
+        with f:
+            yield from heapq.merge(*(_read_lane(f, *lane) for lane in self._lanes), key=_sort_key)
+
+
+def _read_lane(f: Any, starts: array, ends: array) -> Iterator[Dict[str, Any]]:
+    """Records in the given byte ranges of ``f``, which other lanes share"""
+    for start, end in zip(starts, ends):
+        pending = b""
+        while start < end:
+            f.seek(start)
+            data = f.read(min(_LANE_CHUNK, end - start))
+            if not data:
+                break
+            start += len(data)
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Reported by scan()
+                    continue
+
+
+class ShardSet:
+    """Per-process shard files and the compacted dataset of a report directory.
+
+    Every process appends only to its own shard, so collection needs no
+    cross-process locking. ``compact()`` k-way merges the compacted base
+    with the unconsumed tail of every shard by timestamp in one streaming
+    pass. The base file's trailer line records how far each shard has been
+    consumed, so base and offsets are replaced atomically together.
+
+    With ``storage="sqlite"`` the compacted dataset is an indexed
+    ``RecordDatabase`` instead, updated in one transaction with the
+    offsets, and no JSON views are written.
+
+    With a ``retention`` policy, compaction also removes expired records
+    from the compacted dataset and folds them into the rollups.
+    """
+
+    def __init__(self, json_dir: str, storage: str = "json", retention: Optional[RetentionPolicy] = None):
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"storage must be one of {STORAGE_BACKENDS}, got {storage!r}")
+        self.json_dir = json_dir
+        self.storage = storage
+        self.retention = retention
+        self.rollups = RollupStore(json_dir)
+        # Raw records the last compaction kept under the record cap, with max_bytes converted
+        self.record_limit: Optional[int] = None
+        self.shard_dir = os.path.join(json_dir, SHARD_DIR)
+        self.base_file = os.path.join(json_dir, BASE_FILE)
+        self.log_view = os.path.join(json_dir, LOG_VIEW)
+        self.time_series_view = os.path.join(json_dir, TIME_SERIES_VIEW)
+        self.database = RecordDatabase(os.path.join(json_dir, DATABASE_FILE)) if storage == "sqlite" else None
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+    def database_ready(self) -> bool:
+        """True once records live in the database.
+
+        A directory switched to sqlite keeps reading its JSON base until the
+        first compaction imports it.
+        """
+        return self.database is not None and not self.database.is_empty()
+
+    def shard_files(self) -> List[str]:
+        try:
+            names = os.listdir(self.shard_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.startswith(SHARD_PREFIX) and n.endswith(".jsonl"))
+
+    def _trailer(self) -> Dict[str, Any]:
+        """The base file's last line: consumed shard offsets and the record count"""
+        try:
+            with open(self.base_file, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                chunk = 1 << 12
+                while True:
+                    f.seek(max(size - chunk, 0))
+                    tail = f.read().rstrip(b"\n")
+                    start = tail.rfind(b"\n")
+                    if start != -1 or chunk >= size:
+                        break
+                    chunk *= 2
+            trailer = json.loads(tail[start + 1:] or b"{}")
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            return {}
+        return trailer if isinstance(trailer, dict) and _TRAILER_KEY in trailer else {}
+
+    def consumed_offsets(self) -> Dict[str, int]:
+        """Shard offsets already merged into the base, read from its trailer line"""
+        if self.database_ready():
+            return self.database.offsets()
+        offsets = self._trailer().get(_TRAILER_KEY)
+        return offsets if isinstance(offsets, dict) else {}
+
+    def _base_records(self) -> Iterator[Dict[str, Any]]:
+        if os.path.exists(self.base_file):
+            reader = _ShardReader(self.base_file, 0, os.path.getsize(self.base_file))
+            for entry in reader:
+                if _TRAILER_KEY not in entry:
+                    yield entry
+            return
+        # Report directories written before sharding only have the JSON views
+        for path in (self.log_view, self.time_series_view):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    data = [entry for records in data.values() for entry in records]
+                yield from sorted(data, key=_sort_key)
+                return
+            except (json.JSONDecodeError, TypeError, AttributeError) as e:
+                logger.warning(f"Error loading {path}: {str(e)}")
+
+    def _readers(self, offsets: Dict[str, int]) -> List[_ShardReader]:
+        readers = []
+        for name in self.shard_files():
+            path = os.path.join(self.shard_dir, name)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                # Rotated away by its process once fully consumed
+                continue
+            offset = offsets.get(name, 0)
+            readers.append(_ShardReader(path, offset if offset <= size else 0, size))
+        return readers
+
+    def iter_records(self, since: Any = None, until: Any = None,
+                     functions: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Records (base plus unconsumed shard tails) merged by timestamp.
+
+        ``since`` (inclusive) and ``until`` (exclusive) take ISO-8601 strings
+        or datetimes; ``functions`` is a collection of func_keys. With the
+        sqlite backend the filters run as indexed queries.
+        """
+        if self.database_ready():
+            base = self.database.query(since, until, functions)
+        else:
+            base = _filtered(self._base_records(), since, until, functions)
+        tails = [_filtered(reader.ordered(), since, until, functions)
+                 for reader in self._readers(self.consumed_offsets())]
+        return heapq.merge(base, *tails, key=_sort_key)
+
+    def iter_tail_records(self) -> Iterator[Dict[str, Any]]:
+        """Only the records not yet merged into the base, by timestamp"""
+        return heapq.merge(*(reader.ordered() for reader in self._readers(self.consumed_offsets())),
+                           key=_sort_key)
+
+    def compact(self, write_views: bool = True, now: Optional[int] = None) -> Dict[str, int]:
+        """Merge shard tails into the base and rewrite the JSON views.
+
+        Returns the consumed offset per shard. Shards of processes that are
+        known to have exited are deleted once fully consumed. ``now``
+        (microseconds since the epoch) is the reference time for retention.
+        """
+        with _FileLock(os.path.join(self.json_dir, LOCK_FILE)):
+            readers = self._readers(self.consumed_offsets())
+            for reader in readers:
+                reader.scan()
+            tails = [reader.ordered() for reader in readers]
+            if self.database is not None:
+                offsets = self._compact_database(readers, tails, now)
+            else:
+                offsets = self._compact_base(readers, tails, write_views, now)
+
+            # Live writers rotate their own shards; exited ones are removed here
+            for reader in readers:
+                if _owner_alive(os.path.basename(reader.path)):
+                    continue
+                if reader.consumed < reader.end:
+                    logger.warning(f"Discarding truncated record at end of {reader.path}")
+                try:
+                    os.remove(reader.path)
+                except OSError as e:
+                    logger.warning(f"Could not remove compacted shard {reader.path}: {str(e)}")
+            return offsets
+
+    def _retention_pass(self, readers: List[_ShardReader], now: Optional[int]) -> Optional[RetentionPass]:
+        """Retention for a JSON compaction of the given scanned shard tails"""
+        if self.retention is None:
+            return None
+        excess = 0
+        if self.retention.max_records is not None or self.retention.max_bytes is not None:
+            stored = self._trailer().get("records")
+            if not isinstance(stored, int):
+                stored = sum(1 for _ in self._base_records())
+            size = os.path.getsize(self.base_file) if os.path.exists(self.base_file) else 0
+            limit = self.record_limit = self.retention.record_limit(size, stored)
+            if limit is not None:
+                excess = stored + sum(reader.count for reader in readers) - limit
+        return RetentionPass(self.retention, self.rollups, excess, now)
+
+    def _compact_base(self, readers: List[_ShardReader], tails: List[Iterator[Dict[str, Any]]],
+                      write_views: bool, now: Optional[int] = None) -> Dict[str, int]:
+        retention = self._retention_pass(readers, now)
+        merged = heapq.merge(self._base_records(), *tails, key=_sort_key)
+        store = RecordStore() if write_views else None
+
+        temp_base = f"{self.base_file}.tmp"
+        count = 0
+        with open(temp_base, "w", encoding="utf-8") as out:
+            for entry in merged:
+                if retention is not None and not retention.keep(entry):
+                    continue
+                out.write(json.dumps(entry, default=str) + "\n")
+                count += 1
+                if store is not None:
+                    store.append(entry, entry_key(entry))
+            # The trailer makes the merged records and shard offsets one atomic replace
+            offsets = {os.path.basename(r.path): r.consumed for r in readers}
+            out.write(json.dumps({_TRAILER_KEY: offsets, "records": count}) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_base, self.base_file)
+        # Rollups are saved after the base: a crash in between loses rollups rather than double counting
+        if retention is not None:
+            retention.commit()
+
+        if store is not None:
+            for path, dump in ((self.log_view, store.dump_records),
+                               (self.time_series_view, store.dump_time_series)):
+                temp = f"{path}.tmp"
+                with open(temp, "w") as f:
+                    dump(f)
+                os.replace(temp, path)
+        return offsets
+
+    def _compact_database(self, readers: List[_ShardReader], tails: List[Iterator[Dict[str, Any]]],
+                          now: Optional[int] = None) -> Dict[str, int]:
+        # Only shard tails are appended; the first compaction also imports a JSON base
+        sources = [] if self.database_ready() else [self._base_records()]
+        retention = RetentionPass(self.retention, self.rollups, now=now) if self.retention is not None else None
+        with self.database.transaction():
+            self.database.insert(heapq.merge(*sources, *tails, key=_sort_key))
+            offsets = {os.path.basename(r.path): r.consumed for r in readers}
+            self.database.save_offsets(offsets)
+            if retention is not None and self.retention.bounded:
+                # Records are ordered by timestamp, so everything expiring is a prefix
+                stored = self.database.count()
+                limit = self.record_limit = self.retention.record_limit(os.path.getsize(self.database.path), stored)
+                expiring = max(self.database.count(before=retention.cutoff) if retention.cutoff is not None else 0,
+                               stored - limit if limit is not None else 0)
+                if expiring:
+                    retention.excess = expiring
+                    for entry in self.database.oldest(expiring):
+                        retention.keep(entry)
+                    self.database.delete_oldest(expiring)
+        if retention is not None:
+            retention.commit()
+        return offsets
@@ -0,0 +1,273 @@
+import json
+import math
+from typing import Any, Dict, Iterable, Optional
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RunningStats:
+    """Count, mean, variance (Welford) and extremes, updated in O(1)"""
+
+    __slots__ = ("count", "total", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "RunningStats") -> None:
+        """Combine with stats collected elsewhere (Chan et al. parallel update)"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__} if self.count else {"count": 0}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunningStats":
+        stats = cls()
+        if data.get("count"):
+            for name in cls.__slots__:
+                setattr(stats, name, float(data[name]) if name != "count" else int(data[name]))
+        return stats
+
+
+class DDSketch:
+    """Quantile sketch with relative-error guarantees (Masson et al., VLDB 2019).
+
+    Positive values fall into logarithmic buckets so any quantile is
+    returned within ``relative_accuracy`` of the true value. Values at or
+    below ``min_value`` (including zero) share one bucket. When more than
+    ``max_bins`` buckets exist the lowest ones are collapsed, which keeps
+    memory bounded while preserving the upper quantiles. Sketches with the
+    same accuracy merge by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048,
+                 min_value: float = 1e-9):
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, weight: int = 1) -> None:
+        self.count += weight
+        if value <= self.min_value:
+            self.zero_count += weight
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + weight
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def merge(self, other: "DDSketch") -> None:
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "bins": {str(k): v for k, v in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DDSketch":
+        sketch = cls(relative_accuracy=data.get("relative_accuracy", 0.01))
+        sketch.zero_count = int(data.get("zero_count", 0))
+        sketch.count = int(data.get("count", 0))
+        sketch.bins = {int(k): int(v) for k, v in data.get("bins", {}).items()}
+        return sketch
+
+
+class MetricStats:
+    """Running moments plus a quantile sketch for one metric"""
+
+    __slots__ = ("moments", "sketch")
+
+    def __init__(self, moments: RunningStats = None, sketch: DDSketch = None):
+        self.moments = moments or RunningStats()
+        self.sketch = sketch or DDSketch()
+
+    def add(self, value: float) -> None:
+        self.moments.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other: "MetricStats") -> None:
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+
+    def summary(self) -> Dict[str, Any]:
+        m = self.moments
+        if m.count == 0:
+            return {"count": 0}
+        result = {
+            "count": m.count,
+            "total": m.total,
+            "mean": m.mean,
+            "stddev": math.sqrt(m.variance),
+            "min": m.min,
+            "max": m.max,
+        }
+        for q in QUANTILES:
+            result[f"p{int(q * 100)}"] = self.sketch.quantile(q)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"moments": self.moments.to_dict(), "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MetricStats":
+        return cls(RunningStats.from_dict(data.get("moments", {})),
+                   DDSketch.from_dict(data.get("sketch", {})))
+
+
+class FunctionStats:
+    """Streaming aggregates of a function's profiled records"""
+
+    METRICS = ("execution_time", "peak_memory_mb")
+
+    def __init__(self):
+        self.metrics: Dict[str, MetricStats] = {name: MetricStats() for name in self.METRICS}
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        for name, stats in self.metrics.items():
+            value = entry.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+                stats.add(float(value))
+
+    def merge(self, other: "FunctionStats") -> None:
+        for name, stats in other.metrics.items():
+            self.metrics.setdefault(name, MetricStats()).merge(stats)
+
+    @property
+    def count(self) -> int:
+        return self.metrics["execution_time"].moments.count
+
+    def summary(self) -> Dict[str, Any]:
+        return {name: stats.summary() for name, stats in self.metrics.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: stats.to_dict() for name, stats in self.metrics.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FunctionStats":
+        stats = cls()
+        for name, metric in data.items():
+            stats.metrics[name] = MetricStats.from_dict(metric)
+        return stats
+
+
+def merge_stats(exports: Iterable[Dict[str, Dict[str, Any]]]) -> Dict[str, FunctionStats]:
+    """Merge ``Profiler.export_stats()`` results from several processes"""
+    merged: Dict[str, FunctionStats] = {}
+    for export in exports:
+        for func_key, data in export.items():
+            stats = FunctionStats.from_dict(data)
+            if func_key in merged:
+                merged[func_key].merge(stats)
+            else:
+                merged[func_key] = stats
+    return merged
+
+
+def _fmt(value: Optional[float], unit: str) -> str:
+    if value is None:
+        return "-"
+    if unit == "s":
+        return f"{value * 1000:.3f}ms" if value < 1 else f"{value:.3f}s"
+    return f"{value:.3f}{unit}"
+
+
+def format_summary(stats: Dict[str, Dict[str, Any]], fmt: str = "text") -> str:
+    """Render ``Profiler.stats()`` output as an aligned text table or JSON"""
+    if fmt == "json":
+        return json.dumps(stats, indent=4, default=str)
+    if fmt != "text":
+        raise ValueError(f"Unknown summary format: {fmt!r}")
+
+    header = ("function", "calls", "records", "mean", "p50", "p95", "p99", "max", "peak_mem_p95")
+    rows = [header]
+    for func_key, summary in sorted(stats.items()):
+        timing = summary.get("execution_time", {})
+        memory = summary.get("peak_memory_mb", {})
+        rows.append((
+            func_key,
+            str(summary.get("calls", timing.get("count", 0))),
+            str(timing.get("count", 0)),
+            _fmt(timing.get("mean"), "s"),
+            _fmt(timing.get("p50"), "s"),
+            _fmt(timing.get("p95"), "s"),
+            _fmt(timing.get("p99"), "s"),
+            _fmt(timing.get("max"), "s"),
+            _fmt(memory.get("p95"), "MB"),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(w) if i == 0 else cell.rjust(w)
+                       for i, (cell, w) in enumerate(zip(row, widths)))
+             for row in rows]
+    lines.insert(1, "-" * len(lines[0]))
+    return "\n".join(lines)
@@ -0,0 +1,136 @@
+import threading
+import time
+import types
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+from .registry import FunctionInfo
+
+
+class StepStats:
+    """Per-call totals of the steps a profiled coroutine ran on the event loop.
+
+    A step is one ``send``/``throw`` into the coroutine: the time between
+    being resumed and suspending again, during which it holds the loop.
+    Everything else between start and finish was spent awaiting.
+    """
+
+    __slots__ = ("steps", "loop_ns", "cpu_ns", "max_step_ns")
+
+    def __init__(self):
+        self.steps = 0
+        self.loop_ns = 0
+        self.cpu_ns = 0
+        self.max_step_ns = 0
+
+    def fields(self, wall_time: float) -> Dict[str, Any]:
+        """Entry fields for a call that took ``wall_time`` seconds from start to finish"""
+        loop_time = self.loop_ns / 1e9
+        return {
+            "steps": self.steps,
+            "loop_time": round(loop_time, 6),
+            "cpu_time": round(self.cpu_ns / 1e9, 6),
+            "awaited_time": round(max(wall_time - loop_time, 0.0), 6),
+            "max_step_time": round(self.max_step_ns / 1e9, 6),
+        }
+
+
+class _Step:
+    __slots__ = ("info", "parent", "root", "start", "child_ns", "selves")
+
+    def __init__(self, info: FunctionInfo, parent: Optional["_Step"], start: int):
+        self.info = info
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.start = start
+        self.child_ns = 0
+        self.selves: Optional[Dict[str, list]] = None
+
+
+class StallMonitor:
+    """Detect steps that block the event loop for at least ``threshold`` seconds.
+
+    Steps of profiled coroutines nest when one awaits another directly, so
+    the step the loop itself resumed is the root. When a root step runs
+    past the threshold, the stall is attributed to the profiled coroutine
+    with the most self time in it (its own step minus nested profiled
+    steps) and ``callback(info, start_ns, end_ns, breakdown)`` is called on
+    the loop thread, with ``breakdown`` mapping func_key to self seconds.
+    """
+
+    def __init__(self, threshold: float, callback: Callable[[FunctionInfo, int, int, Dict[str, float]], None]):
+        self.threshold_ns = int(threshold * 1e9)
+        self.callback = callback
+        self._local = threading.local()
+
+    def enter(self, info: FunctionInfo, start: int) -> _Step:
+        step = _Step(info, getattr(self._local, "step", None), start)
+        self._local.step = step
+        return step
+
+    def exit(self, step: _Step, end: int) -> None:
+        self._local.step = step.parent
+        duration = end - step.start
+        parent = step.parent
+        if parent is not None:
+            parent.child_ns += duration
+            root = step.root
+            if root.selves is None:
+                root.selves = {}
+            own = root.selves.setdefault(step.info.key, [step.info, 0])
+            own[1] += duration - step.child_ns
+            return
+        if duration < self.threshold_ns:
+            return
+        selves = step.selves or {}
+        own = selves.setdefault(step.info.key, [step.info, 0])
+        own[1] += duration - step.child_ns
+        culprit = max(selves.values(), key=lambda item: item[1])[0]
+        breakdown = {key: round(ns / 1e9, 6) for key, (_, ns) in selves.items()}
+        self.callback(culprit, step.start, end, breakdown)
+
+
+@types.coroutine
+def timed_steps(coro: Coroutine, info: FunctionInfo, stats: Optional[StepStats] = None,
+                monitor: Optional[StallMonitor] = None) -> Any:
+    """Await ``coro`` one step at a time, timing each step
+
+    Values the coroutine yields (futures) are passed to the task driving
+    it and whatever the task sends or throws back is forwarded, so
+    cancellation and exceptions behave as with a plain ``await``. Only
+    ``perf_counter_ns`` and, with ``stats``, ``thread_time_ns`` are read
+    per step, so the loop never waits on collection.
+    """
+    clock, cpu_clock = time.perf_counter_ns, time.thread_time_ns
+    send, throw = coro.send, coro.throw
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        start = clock()
+        cpu_start = cpu_clock() if stats is not None else 0
+        step = monitor.enter(info, start) if monitor is not None else None
+        done = False
+        try:
+            yielded = send(value) if error is None else throw(error)
+        except StopIteration as stop:
+            done, value = True, stop.value
+        finally:
+            end = clock()
+            if stats is not None:
+                elapsed = end - start
+                stats.steps += 1
+                stats.loop_ns += elapsed
+                stats.cpu_ns += cpu_clock() - cpu_start
+                if elapsed > stats.max_step_ns:
+                    stats.max_step_ns = elapsed
+            if step is not None:
+                monitor.exit(step, end)
+        if done:
+            return value
+        value, error = None, None
+        try:
+            value = yield yielded
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            error = e
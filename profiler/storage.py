@@ -6,16 +6,80 @@
 #     with open(file_path, "rb") as data:
 #         blob_client.upload_blob(data, overwrite=True)
 
-from azure.storage.blob import BlobServiceClient
+import fnmatch
+import hashlib
 import logging
+import mimetypes
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    from azure.storage.blob import BlobServiceClient, ContentSettings
+except ImportError:  # optional dependency, see the "azure" extra
+    BlobServiceClient = ContentSettings = None
 
 logger = logging.getLogger(__name__)
 
+# Files that are partial writes or local-only state of a report directory
+DEFAULT_EXCLUDES = ("*.tmp", "*.lock", "*-wal", "*-shm")
+
+# One client (and its connection pool) per connection string, shared by every AzureStorage
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _service_client(connection_string: str) -> Any:
+    with _clients_lock:
+        client = _clients.get(connection_string)
+        if client is None:
+            client = _clients[connection_string] = BlobServiceClient.from_connection_string(connection_string)
+        return client
+
+
+def _file_md5(file_path: str) -> bytes:
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _content_settings(md5: bytes, file_path: str) -> Any:
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    if ContentSettings is None:
+        return SimpleNamespace(content_md5=md5, content_type=content_type)
+    return ContentSettings(content_md5=md5, content_type=content_type)
+
+
 class AzureStorage:
-    def __init__(self, connection_string: str):
-        self.service_client = BlobServiceClient.from_connection_string(connection_string)
-        
+    """Upload reports to Azure Blob Storage.
+
+    Clients are cached per connection string so repeated uploads reuse one
+    connection pool; pass ``service_client`` to use an existing client (or
+    a fake in tests). Files are uploaded ``max_workers`` at a time, each in
+    up to ``max_concurrency`` parallel blocks, with their MD5 stored as
+    Content-MD5 so unchanged files can be skipped on the next sync.
+    """
+
+    def __init__(self, connection_string: str = None, service_client: Any = None,
+                 max_workers: int = 8, max_concurrency: int = 4):
+        if service_client is None:
+            if BlobServiceClient is None:
+                raise ImportError("Azure support requires azure-storage-blob: pip install profiler_framework[azure]")
+            service_client = _service_client(connection_string)
+        self.service_client = service_client
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+
+    def _upload(self, container_client: Any, file_path: str, blob_name: str, md5: bytes) -> None:
+        blob_client = container_client.get_blob_client(blob_name)
+        with open(file_path, "rb") as data:
+            blob_client.upload_blob(data, overwrite=True, max_concurrency=self.max_concurrency,
+                                    content_settings=_content_settings(md5, file_path))
+
     def upload_report(self, container_name: str, file_path: str, blob_name: str = None) -> bool:
         """Upload a report file to Azure Blob Storage"""
         try:
@@ -24,18 +88,79 @@ class AzureStorage:
                 return False
 
             blob_name = blob_name or os.path.basename(file_path)
-            blob_client = self.service_client.get_blob_client(container=container_name, blob=blob_name)
-            
-            with open(file_path, "rb") as data:
-                blob_client.upload_blob(data, overwrite=True)
-                
+            container_client = self.service_client.get_container_client(container_name)
+            self._upload(container_client, file_path, blob_name, _file_md5(file_path))
+
             logger.info(f"Successfully uploaded {file_path} to {container_name}/{blob_name}")
             return True
-            
+
         except Exception as e:
             logger.error(f"Azure upload failed: {str(e)}")
             return False
 
+    def _remote_md5(self, container_client: Any, prefix: str) -> Dict[str, Optional[bytes]]:
+        """Content-MD5 of existing blobs under ``prefix``, from a single listing"""
+        remote = {}
+        for blob in container_client.list_blobs(name_starts_with=prefix or None):
+            settings = getattr(blob, "content_settings", None)
+            md5 = getattr(settings, "content_md5", None)
+            remote[blob.name] = bytes(md5) if md5 else None
+        return remote
+
+    def upload_directory(self, container_name: str, directory: str, prefix: str = "",
+                         skip_unchanged: bool = True,
+                         exclude: Sequence[str] = DEFAULT_EXCLUDES) -> Dict[str, List[str]]:
+        """Sync a directory tree (e.g. ``reports/``) to ``container_name/prefix``
+
+        Files whose Content-MD5 matches the existing blob are skipped unless
+        ``skip_unchanged`` is off. Returns the blob names that were
+        ``uploaded``, ``skipped`` and ``failed``.
+        """
+        result: Dict[str, List[str]] = {"uploaded": [], "skipped": [], "failed": []}
+        if not os.path.isdir(directory):
+            logger.error(f"Directory not found: {directory}")
+            return result
+
+        files = {}
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if any(fnmatch.fnmatch(name, pattern) for pattern in exclude):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, directory).replace(os.sep, "/")
+                files[f"{prefix.rstrip('/')}/{relative}" if prefix else relative] = path
+
+        try:
+            container_client = self.service_client.get_container_client(container_name)
+            remote = self._remote_md5(container_client, prefix) if skip_unchanged else {}
+        except Exception as e:
+            logger.error(f"Azure listing failed for {container_name}: {str(e)}")
+            result["failed"] = sorted(files)
+            return result
+
+        def sync(blob_name: str, path: str) -> str:
+            md5 = _file_md5(path)
+            if skip_unchanged and remote.get(blob_name) == md5:
+                return "skipped"
+            self._upload(container_client, path, blob_name, md5)
+            return "uploaded"
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(sync, blob_name, path): blob_name for blob_name, path in files.items()}
+            for future in as_completed(futures):
+                blob_name = futures[future]
+                try:
+                    result[future.result()].append(blob_name)
+                except Exception as e:
+                    logger.error(f"Azure upload failed for {blob_name}: {str(e)}")
+                    result["failed"].append(blob_name)
+
+        for names in result.values():
+            names.sort()
+        logger.info(f"Synced {directory} to {container_name}: {len(result['uploaded'])} uploaded, "
+                    f"{len(result['skipped'])} unchanged, {len(result['failed'])} failed")
+        return result
+
 def save_to_azure(connection_string: str, container_name: str, file_path: str, blob_name: str = None) -> bool:
     """Legacy function for backward compatibility"""
-    return AzureStorage(connection_string).upload_report(container_name, file_path, blob_name)
\ No newline at end of file
+    return AzureStorage(connection_string).upload_report(container_name, file_path, blob_name)
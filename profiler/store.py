@@ -0,0 +1,365 @@
+import json
+import math
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain, compress, islice
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MISSING_INT = -(2 ** 63)
+_NO_STRING = -1
+
+
+def entry_key(entry: Dict[str, Any]) -> str:
+    """``func_key`` of a stored entry: ``file:qualname`` (or ``file:function``)
+
+    Entries from another collector than the decorators (e.g. the stack
+    sampler) carry a ``source`` that is appended as ``@source``.
+    """
+    key = f"{entry.get('file')}:{entry.get('qualname') or entry.get('function')}"
+    source = entry.get("source")
+    return f"{key}@{source}" if source else key
+
+
+def timestamp_micros(value: Any) -> Optional[int]:
+    """Convert an ISO-8601 timestamp (or a datetime) to integer microseconds since the epoch"""
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, str):
+        try:
+            ts = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    else:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    delta = ts - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def format_timestamp(micros: int) -> str:
+    """Inverse of ``timestamp_micros``: ISO-8601 UTC timestamp"""
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+def _session_marker(info: Any) -> Any:
+    """Hashable identity of a ``system_info`` value, equal for equal dicts"""
+    try:
+        marker = tuple(sorted(info.items()))
+        hash(marker)
+    except (AttributeError, TypeError):
+        marker = json.dumps(info, sort_keys=True, default=str)
+    return marker
+
+
+class RecordStore:
+    """Columnar, deduplicated in-memory store for profiling entries.
+
+    Numeric fields live in typed ``array`` columns, string fields are interned
+    into a shared string table and ``system_info`` dicts are stored once per
+    distinct value. Values that fit neither layout are kept sparsely per row.
+    A per-key index maps each ``func_key`` to its row numbers, so time series
+    are views over the same rows rather than duplicate lists.
+    """
+
+    def __init__(self):
+        self._size = 0
+        self._fields: List[str] = []
+        self._field_set = set()
+        self._numeric: Dict[str, array] = {}
+        self._text: Dict[str, array] = {}
+        self._extras: Dict[int, Dict[str, Any]] = {}
+
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+
+        self._sessions: List[Dict[str, Any]] = []
+        self._session_ids: Dict[Any, int] = {}
+        self._last_session: Any = None
+        self._last_session_id = _NO_STRING
+        self._session_col = array("l")
+
+        self._keys: List[str] = []
+        self._key_ids: Dict[str, int] = {}
+        self._index: List[array] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _intern(self, value: str) -> int:
+        sid = self._string_ids.get(value)
+        if sid is None:
+            sid = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return sid
+
+    def _session_id(self, info: Any) -> int:
+        if info is self._last_session:
+            return self._last_session_id
+        marker = _session_marker(info)
+        sid = self._session_ids.get(marker)
+        if sid is None:
+            sid = self._session_ids[marker] = len(self._sessions)
+            self._sessions.append(info)
+        self._last_session, self._last_session_id = info, sid
+        return sid
+
+    def _add_field(self, name: str) -> None:
+        if name not in self._field_set:
+            self._field_set.add(name)
+            self._fields.append(name)
+
+    def _numeric_column(self, name: str, value: Any) -> Optional[array]:
+        column = self._numeric.get(name)
+        if column is None:
+            if name in self._text:
+                return None
+            if isinstance(value, int):
+                column = array("q", [_MISSING_INT]) * self._size
+            else:
+                column = array("d", [math.nan]) * self._size
+            self._numeric[name] = column
+        elif column.typecode == "q" and isinstance(value, float):
+            column = array("d", (math.nan if v == _MISSING_INT else float(v) for v in column))
+            self._numeric[name] = column
+        return column
+
+    def _text_column(self, name: str) -> Optional[array]:
+        column = self._text.get(name)
+        if column is None:
+            if name in self._numeric:
+                return None
+            column = self._text[name] = array("l", [_NO_STRING]) * self._size
+        return column
+
+    def append(self, entry: Dict[str, Any], key: str) -> int:
+        """Append an entry under ``key`` and return its row number"""
+        row = self._size
+        extras = None
+        session = _NO_STRING
+        for name, value in entry.items():
+            self._add_field(name)
+            column = None
+            if name == "system_info":
+                session = self._session_id(value)
+                continue
+            if name == "timestamp" and isinstance(value, str):
+                micros = timestamp_micros(value)
+                if micros is not None:
+                    column = self._numeric_column(name, micros)
+                    value = micros
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                column = self._numeric_column(name, value)
+            elif isinstance(value, str):
+                column = self._text_column(name)
+                if column is not None:
+                    value = self._intern(value)
+            if column is None or (column.typecode == "q" and not isinstance(value, int)):
+                if extras is None:
+                    extras = {}
+                extras[name] = value
+                continue
+            column.append(value)
+
+        # Pad columns this entry did not provide
+        size = row + 1
+        for column in self._numeric.values():
+            if len(column) < size:
+                column.append(_MISSING_INT if column.typecode == "q" else math.nan)
+        for column in self._text.values():
+            if len(column) < size:
+                column.append(_NO_STRING)
+        self._session_col.append(session)
+        if extras:
+            self._extras[row] = extras
+
+        kid = self._key_ids.get(key)
+        if kid is None:
+            kid = self._key_ids[key] = len(self._keys)
+            self._keys.append(key)
+            self._index.append(array("l"))
+        self._index[kid].append(row)
+        self._size = size
+        return row
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Materialise a single row as an entry dict"""
+        extras = self._extras.get(row, {})
+        entry: Dict[str, Any] = {}
+        for name in self._fields:
+            if name in extras:
+                entry[name] = extras[name]
+            elif name == "system_info":
+                sid = self._session_col[row]
+                if sid != _NO_STRING:
+                    entry[name] = self._sessions[sid]
+            elif name in self._numeric:
+                value = self._numeric[name][row]
+                if value == _MISSING_INT or value != value:
+                    continue
+                entry[name] = format_timestamp(value) if name == "timestamp" and isinstance(value, int) else value
+            elif name in self._text:
+                sid = self._text[name][row]
+                if sid != _NO_STRING:
+                    entry[name] = self._strings[sid]
+        return entry
+
+    def column(self, name: str, key: Optional[str] = None) -> List[Any]:
+        """Return the raw values of a numeric column, optionally for one key"""
+        column = self._numeric[name]
+        if key is None:
+            return column.tolist()
+        return [column[r] for r in self.rows(key)]
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def rows(self, key: str, stop: Optional[int] = None) -> array:
+        """Row numbers recorded under ``key``, optionally only those below ``stop``"""
+        kid = self._key_ids.get(key)
+        if kid is None:
+            return array("l")
+        rows = self._index[kid]
+        if stop is None or not rows or rows[-1] < stop:
+            return rows
+        return rows[:bisect_left(rows, stop)]
+
+    def trimmed(self, since: Optional[int] = None, max_rows: Optional[int] = None,
+                stop: Optional[int] = None) -> Optional["RecordStore"]:
+        """A copy of the first ``stop`` rows without those timestamped before ``since``
+        (microseconds) or older than the newest ``max_rows``; ``None`` when nothing would be removed
+
+        Columns are filtered whole rather than row by row. Only rows below
+        ``stop`` are read, so the copy can be built while another thread
+        appends and the rows appended meanwhile carried over afterwards.
+        """
+        stop = self._size if stop is None else stop
+        start = max(stop - max_rows, 0) if max_rows is not None else 0
+        mask = bytearray(start) + b"\x01" * (stop - start)
+        timestamps = self._numeric.get("timestamp")
+        if since is not None and timestamps is not None and timestamps.typecode == "q":
+            for row in range(start, stop):
+                value = timestamps[row]
+                if value < since and value != _MISSING_INT:
+                    mask[row] = 0
+        kept = mask.count(1)
+        if kept == stop:
+            return None
+
+        store = RecordStore()
+        store._size = kept
+        store._fields = list(self._fields)
+        store._field_set = set(store._fields)
+        store._numeric = {name: array(column.typecode, compress(column, mask))
+                          for name, column in list(self._numeric.items())}
+        store._text = {name: array("l", compress(column, mask)) for name, column in list(self._text.items())}
+        # The consumer may intern new values meanwhile, so each id map is
+        # rebuilt from its copied list rather than copied separately
+        store._strings = list(self._strings)
+        store._string_ids = {value: sid for sid, value in enumerate(store._strings)}
+        store._sessions = list(self._sessions)
+        store._session_ids = {_session_marker(info): sid for sid, info in enumerate(store._sessions)}
+        store._session_col = array("l", compress(self._session_col, mask))
+
+        # New row number of every old row that is kept
+        positions = array("l", islice(accumulate(chain((-1,), mask)), 1, None))
+        store._extras = {positions[row]: extras for row, extras in list(self._extras.items())
+                         if row < stop and mask[row]}
+        for key, rows in zip(list(self._keys), list(self._index)):
+            rows = array("l", (positions[row] for row in rows if row < stop and mask[row]))
+            if rows:
+                store._key_ids[key] = len(store._keys)
+                store._keys.append(key)
+                store._index.append(rows)
+        return store
+
+    def records(self, stop: Optional[int] = None) -> "RecordView":
+        return RecordView(self, None, self._size if stop is None else stop)
+
+    def time_series(self, stop: Optional[int] = None) -> "TimeSeriesView":
+        return TimeSeriesView(self, stop)
+
+    def dump_records(self, f: Any, stop: Optional[int] = None) -> None:
+        """Stream the entries as a JSON list without materialising them all"""
+        _dump_list(f, self.records(stop), indent=4)
+
+    def dump_time_series(self, f: Any, stop: Optional[int] = None) -> None:
+        """Stream the per-key entries as a JSON object of lists"""
+        series = self.time_series(stop)
+        f.write("{")
+        first = True
+        for key in series:
+            rows = series[key]
+            if not rows:
+                continue
+            f.write("\n" if first else ",\n")
+            first = False
+            f.write(f"    {json.dumps(key)}: ")
+            _dump_list(f, rows, indent=8)
+        f.write("\n}" if not first else "}")
+
+
+def _dump_list(f: Any, records: Sequence, indent: int) -> None:
+    pad = " " * indent
+    outer = " " * (indent - 4)
+    f.write("[")
+    for i, entry in enumerate(records):
+        f.write("\n" if i == 0 else ",\n")
+        text = json.dumps(entry, indent=4, default=str)
+        f.write(pad + text.replace("\n", "\n" + pad))
+    f.write(f"\n{outer}]" if len(records) else "]")
+
+
+class RecordView(Sequence):
+    """Lazy sequence of entries backed by a RecordStore"""
+
+    def __init__(self, store: RecordStore, rows: Optional[array], stop: int):
+        self._store = store
+        self._rows = rows
+        self._stop = stop
+
+    def __len__(self) -> int:
+        return self._stop
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return self._store.row(index if self._rows is None else self._rows[index])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        rows = self._rows
+        for i in range(self._stop):
+            yield self._store.row(i if rows is None else rows[i])
+
+    def __repr__(self) -> str:
+        return f"<RecordView of {len(self)} records>"
+
+
+class TimeSeriesView(Mapping):
+    """Lazy mapping of ``func_key`` to the RecordView of its entries"""
+
+    def __init__(self, store: RecordStore, stop: Optional[int] = None):
+        self._store = store
+        self._stop = stop
+
+    def __getitem__(self, key: str) -> RecordView:
+        if key not in self._store._key_ids:
+            raise KeyError(key)
+        rows = self._store.rows(key, self._stop)
+        return RecordView(self._store, rows, len(rows))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.keys())
+
+    def __len__(self) -> int:
+        return len(self._store._keys)
+
+    def __repr__(self) -> str:
+        return f"<TimeSeriesView of {len(self)} functions>"
@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from profiler.bench import Benchmark, Runner, save_results, summarize
+from profiler.bench.__main__ import main
+from profiler.shards import ShardSet
+
+
+class TestBench(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_bench_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+    def test_summary_ignores_outliers(self):
+        stats = summarize([10.0] * 19 + [1000.0])
+        self.assertEqual(stats["median"], 10.0)
+        self.assertEqual(stats["mad"], 0.0)
+        self.assertEqual(stats["outliers"], 1)
+        self.assertEqual(stats["mean"], 10.0)
+        self.assertEqual(stats["max"], 1000.0)
+
+    def test_runner_calibrates_sync_and_async(self):
+        calls = {"setup": 0, "teardown": 0}
+
+        async def noop_async():
+            return None
+
+        benches = [
+            Benchmark("sync", lambda: sum(range(10)), ops=2,
+                      setup=lambda: calls.__setitem__("setup", calls["setup"] + 1),
+                      teardown=lambda: calls.__setitem__("teardown", calls["teardown"] + 1)),
+            Benchmark("async", noop_async),
+        ]
+        runner = Runner(warmup=0.01, min_sample_time=0.001, repeat=5)
+        for bench in benches:
+            result = runner.run(bench)
+            self.assertEqual(len(result.samples_ns), 5)
+            self.assertGreater(result.inner, 1)
+            self.assertGreater(result.median_ns, 0)
+        self.assertEqual(calls, {"setup": 1, "teardown": 1})
+
+        # Results are stored as regular records keyed <suite>:<name>@bench
+        session_id = save_results([result], self.report_dir, session_id="v1")
+        records = list(ShardSet(os.path.join(self.report_dir, "JsonData")).iter_records())
+        self.assertEqual(len(records), 5)
+        self.assertEqual({(r["file"], r["function"], r["source"], r["session_id"]) for r in records},
+                         {("bench", "async", "bench", "v1")})
+        self.assertEqual(session_id, "v1")
+
+    def test_cli_lists_overhead_suite(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = main(["--quick", "--list", "-k", "decorator.async.*"])
+        self.assertEqual(code, 0)
+        self.assertEqual(out.getvalue().split(), [
+            "overhead:decorator.async.bare", "overhead:decorator.async.full", "overhead:decorator.async.sampled_out",
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
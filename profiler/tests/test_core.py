@@ -21,11 +21,37 @@
 #     function_data = profiler.get_function_data()
 #     assert len(function_data) == 2
 
+import asyncio
+from bisect import bisect_left, bisect_right
+import atexit
 import unittest
 from unittest.mock import patch
 from profiler.core import Profiler
+from profiler.sampler import CPUSampler
+from profiler.shards import _ShardReader
+from profiler.store import RecordStore, entry_key, format_timestamp, timestamp_micros
+from profiler.stats import DDSketch, merge_stats
+import random
+import multiprocessing
 import os
 import json
+import shutil
+import threading
+import time
+import tracemalloc
+
+def _profile_in_worker(report_dir, calls):
+    profiler = Profiler(report_dir=report_dir)
+
+    @profiler.track_memory
+    def work(i):
+        return i * i
+
+    for i in range(calls):
+        work(i)
+    profiler._pipeline.close()
+    profiler._record_log.close()
+
 
 class TestProfiler(unittest.TestCase):
     def setUp(self):
@@ -33,10 +59,9 @@ class TestProfiler(unittest.TestCase):
         self.profiler = Profiler(report_dir=self.test_report_dir)
         
     def tearDown(self):
-        for f in [os.path.join(self.test_report_dir, "JsonData", n) 
-                for n in ["profiler_log.json", "profiler_time_series.json"]]:
-            if os.path.exists(f):
-                os.remove(f)
+        self.profiler._pipeline.close()
+        self.profiler._record_log.close()
+        shutil.rmtree(os.path.join(self.test_report_dir, "JsonData"), ignore_errors=True)
                 
     def test_decorator(self):
         @self.profiler.track_memory
@@ -48,6 +73,547 @@ class TestProfiler(unittest.TestCase):
         
         # Verify data was recorded
         self.assertGreater(len(self.profiler.function_data), 0)
-        
+
+    def test_record_log_replay(self):
+        @self.profiler.track_memory
+        def test_func():
+            return "success"
+
+        for _ in range(3):
+            test_func()
+        self.profiler._pipeline.flush()
+        self.profiler._record_log.flush()
+        self.assertFalse(os.path.exists(self.profiler.log_file))
+
+        # A fresh profiler recovers records that never reached the JSON views
+        reloaded = Profiler(report_dir=self.test_report_dir)
+        self.assertEqual(len(reloaded.function_data), 3)
+
+        # Writing the views merges the shards without duplicating records
+        reloaded.save_profiling_data()
+        with open(reloaded.log_file) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        self.assertEqual(len(Profiler(report_dir=self.test_report_dir).function_data), 3)
+
+    def test_sqlite_storage_queries_without_loading_history(self):
+        profiler = Profiler(report_dir=self.test_report_dir, storage="sqlite")
+
+        @profiler.track_memory
+        def first():
+            return 1
+
+        @profiler.track_memory
+        def second():
+            return 2
+
+        for _ in range(3):
+            first()
+        second()
+        profiler.save_profiling_data()
+        profiler._pipeline.close()
+        profiler._record_log.close()
+        self.assertFalse(os.path.exists(profiler.log_file))
+
+        reopened = Profiler(report_dir=self.test_report_dir, storage="sqlite")
+        self.addCleanup(reopened._record_log.close)
+        self.addCleanup(reopened._pipeline.close)
+        self.assertEqual(len(reopened.function_data), 0)
+        (key, summary), = [(k, v) for k, v in reopened.stats().items() if k.endswith(".first")]
+        self.assertEqual(summary["execution_time"]["count"], 3)
+
+        records = reopened.query(functions=[key])
+        self.assertEqual([r["function"] for r in records], ["first"] * 3)
+        self.assertEqual(records[0]["system_info"], reopened.system_info)
+        self.assertEqual(len(reopened.query(since=records[-1]["timestamp"])), 2)
+        self.assertEqual(reopened.query(until=records[0]["timestamp"]), [])
+
+    def test_worker_shards_merge_without_loss(self):
+        ctx = multiprocessing.get_context("fork")
+        workers = [ctx.Process(target=_profile_in_worker, args=(self.test_report_dir, 20)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        self.profiler.save_profiling_data()
+        with open(self.profiler.log_file) as f:
+            records = json.load(f)
+        self.assertEqual(len(records), 80)
+        timestamps = [r["timestamp"] for r in records]
+        self.assertEqual(timestamps, sorted(timestamps))
+        # Shards of exited workers are removed once merged
+        own_shard = os.path.basename(self.profiler._record_log.path)
+        self.assertLessEqual(set(self.profiler._shards.shard_files()), {own_shard})
+
+    def test_forked_child_exit_does_not_duplicate_parent_records(self):
+        @self.profiler.track_memory
+        def work():
+            return None
+
+        for _ in range(10):
+            work()
+        self.profiler._pipeline.flush()
+        pid = os.fork()
+        if pid == 0:
+            # A worker exiting normally runs the atexit handlers
+            try:
+                atexit._run_exitfuncs()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.profiler.save_profiling_data()
+        with open(self.profiler.log_file) as f:
+            self.assertEqual(len(json.load(f)), 10)
+
+    def test_shards_rotated_away_by_other_processes_are_skipped(self):
+        @self.profiler.track_memory
+        def work():
+            return None
+
+        work()
+        self.profiler._pipeline.flush()
+        self.profiler._record_log.flush()
+        shards = self.profiler._shards
+        # Another process removes its shard between listing and reading
+        names = shards.shard_files() + ["records-elsewhere-1-gone.jsonl"]
+        with patch.object(type(shards), "shard_files", return_value=names):
+            self.assertEqual(len(list(shards.iter_records())), 1)
+            shards.compact()
+        self.assertEqual(len(list(shards.iter_records())), 1)
+
+    def test_forgotten_log_closes_inherited_file(self):
+        self.profiler._record_log.append({"function": "f"})
+        self.profiler._record_log.flush()
+        inherited = self.profiler._record_log._file
+        self.profiler._record_log._forget()
+        self.assertTrue(inherited.raw.closed)
+
+    def test_forked_child_leaves_closed_profilers_closed(self):
+        profiler = Profiler(report_dir=self.test_report_dir, auto_finalize=False)
+        profiler.close()
+        pipeline, threads = profiler._pipeline, threading.active_count()
+        profiler._after_fork_in_child()
+        self.assertIs(profiler._pipeline, pipeline)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_close_without_saving_keeps_records_in_the_shard(self):
+        profiler = Profiler(report_dir=self.test_report_dir, auto_finalize=False)
+        profiler.record({"file": "bench.py", "function": "op", "source": "bench", "execution_time": 0.5,
+                         "timestamp": "2024-01-01T00:00:00+00:00"})
+        profiler.close(save=False)
+        self.assertFalse(os.path.exists(profiler.log_file))
+        (entry,) = profiler._shards.iter_tail_records()
+        self.assertEqual(entry_key(entry), "bench.py:op@bench")
+        self.assertEqual(entry["session_id"], profiler.session_id)
+
+    def test_threads_record_without_loss(self):
+        @self.profiler.track_memory
+        def work(i):
+            return i + 1
+
+        def run():
+            for i in range(200):
+                work(i)
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        (key, counts), = [(k, v) for k, v in self.profiler.get_call_counts().items() if k.endswith(".work")]
+        self.assertEqual(counts["calls"], 1600)
+        self.assertEqual(len(self.profiler.time_series_data[key]), 1600)
+        self.assertEqual(self.profiler.stats(key)[key]["execution_time"]["count"], 1600)
+        self.assertEqual(self.profiler.dropped_records, 0)
+
+    def test_threaded_records_compact_in_timestamp_order(self):
+        profiler = Profiler(report_dir=self.test_report_dir, record_batch_size=16)
+        self.addCleanup(profiler._record_log.close)
+        self.addCleanup(profiler._pipeline.close)
+
+        @profiler.track_memory
+        def work(i):
+            return i
+
+        def run():
+            for i in range(300):
+                work(i)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Batches of different threads interleave in the shard
+        profiler._pipeline.flush()
+        profiler._record_log.flush()
+        unmerged = [e["timestamp"] for e in profiler._shards.iter_records()]
+        self.assertEqual(len(unmerged), 1200)
+        self.assertEqual(unmerged, sorted(unmerged))
+
+        profiler.save_profiling_data()
+        with open(profiler.log_file) as f:
+            timestamps = [r["timestamp"] for r in json.load(f)]
+        self.assertEqual(len(timestamps), 1200)
+        self.assertEqual(timestamps, sorted(timestamps))
+        with open(profiler.records_file) as f:
+            base = [json.loads(line).get("timestamp") for line in f][:-1]
+        self.assertEqual(base, sorted(base))
+
+    def test_shard_tail_merges_interleaved_batches_in_lanes(self):
+        path = os.path.join(self.test_report_dir, "JsonData", "interleaved.jsonl")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Three writers, each in order, handing over batches of 5 at random
+        rng = random.Random(1)
+        pending = [[[i * 100 + j * 15 + writer for j in range(5)] for i in range(20)] for writer in range(3)]
+        batches = []
+        while any(pending):
+            batches.append(rng.choice([p for p in pending if p]).pop(0))
+        with open(path, "w") as f:
+            for batch in batches:
+                for micros in batch:
+                    f.write(json.dumps({"timestamp": format_timestamp(micros)}) + "\n")
+        reader = _ShardReader(path, 0, os.path.getsize(path))
+        self.assertEqual(reader.scan(), 300)
+        self.assertEqual(reader.consumed, reader.end)
+        timestamps = [timestamp_micros(e["timestamp"]) for e in reader.ordered()]
+        self.assertEqual(timestamps, sorted(m for batch in batches for m in batch))
+        # About one lane per writer, not one per batch
+        self.assertLessEqual(len(reader._lanes), 3)
+
+    def test_sampled_calls_keep_exact_counts(self):
+        @self.profiler.track_memory(max_per_second=1e-3)
+        def hot_func(x):
+            return x * 2
+
+        results = [hot_func(i) for i in range(50)]
+        self.assertEqual(results, [i * 2 for i in range(50)])
+
+        counts = self.profiler.get_call_counts()
+        (key, hot), = [(k, v) for k, v in counts.items() if k.endswith(".hot_func")]
+        self.assertEqual(hot["calls"], 50)
+        self.assertEqual(hot["profiled"], 1)
+        self.assertEqual(len(self.profiler.time_series_data[key]), 1)
+
+    def test_nested_calls_keep_outer_peak(self):
+        @self.profiler.track_memory
+        def inner():
+            data = bytearray(4 * 1024 * 1024)
+            return len(data)
+
+        @self.profiler.track_memory
+        def outer():
+            return inner() + len(bytearray(1024))
+
+        tracing = []
+
+        @self.profiler.track_memory(sample_rate=1e-6)
+        def sampled_out():
+            tracing.append(tracemalloc.is_tracing())
+
+        outer()
+        sampled_out()
+        peaks = {e["function"]: e["peak_memory_mb"] for e in self.profiler.function_data}
+        self.assertGreaterEqual(peaks["inner"], 4.0)
+        self.assertGreaterEqual(peaks["outer"], peaks["inner"])
+        # Tracing stops once no profiled call is running
+        self.assertEqual(tracing, [False])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_nested_call_peak_starts_at_its_own_entry(self):
+        @self.profiler.track_memory
+        def inner():
+            return len(bytearray(1024 * 1024))
+
+        @self.profiler.track_memory
+        def outer():
+            size = len(bytearray(8 * 1024 * 1024))
+            return size + inner()
+
+        outer()
+        peaks = {e["function"]: e["peak_memory_mb"] for e in self.profiler.function_data}
+        self.assertLess(peaks["inner"], 4.0)
+        self.assertGreaterEqual(peaks["outer"], 8.0)
+
+    def test_methods_with_same_name_are_distinct(self):
+        class First:
+            @self.profiler.track_memory
+            def run(self):
+                return 1
+
+        class Second:
+            @self.profiler.track_memory
+            def run(self):
+                return 2
+
+        First().run()
+        Second().run()
+        keys = [k for k in self.profiler.time_series_data if k.endswith(".run")]
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(any("First.run" in k for k in keys))
+
+    def test_call_tree_self_and_inclusive_time(self):
+        profiler = Profiler(report_dir=self.test_report_dir, call_tree=True)
+        self.addCleanup(profiler._record_log.close)
+        self.addCleanup(profiler._pipeline.close)
+
+        @profiler.track_memory
+        def leaf():
+            time.sleep(0.02)
+
+        @profiler.track_memory
+        def parent():
+            time.sleep(0.01)
+            leaf()
+
+        @profiler.track_memory_async
+        async def task():
+            leaf()
+
+        @profiler.track_memory_async
+        async def gather():
+            await asyncio.gather(task(), task())
+
+        parent()
+        asyncio.run(gather())
+        thread = threading.Thread(target=leaf)
+        thread.start()
+        thread.join()
+
+        paths = {tuple(k.rsplit(".", 1)[-1] for k in path): stats
+                 for path, stats in profiler._call_tree.paths().items()}
+        self.assertEqual(paths[("parent", "leaf")].calls, 1)
+        self.assertEqual(paths[("gather", "task", "leaf")].calls, 2)
+        # A thread starts its own root path
+        self.assertEqual(paths[("leaf",)].calls, 1)
+        parent_stats = paths[("parent",)]
+        self.assertGreaterEqual(parent_stats.inclusive_ns, 30_000_000)
+        self.assertLess(parent_stats.self_ns, 20_000_000)
+        self.assertGreaterEqual(parent_stats.self_ns, 10_000_000)
+
+        (root,) = [n for n in profiler.call_tree() if n["name"].endswith(".parent")]
+        self.assertEqual(root["children"][0]["calls"], 1)
+        lines = profiler.collapsed_stacks().splitlines()
+        self.assertTrue(any(line.count(";") == 2 and line.split(";")[0].endswith(".gather") for line in lines))
+
+    def test_async_steps_split_loop_and_awaited_time(self):
+        profiler = Profiler(report_dir=self.test_report_dir, stall_threshold=0.05)
+        self.addCleanup(profiler._record_log.close)
+        self.addCleanup(profiler._pipeline.close)
+
+        def spin(seconds):
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+
+        @profiler.track_memory_async
+        async def blocking():
+            spin(0.08)
+
+        @profiler.track_memory_async
+        async def handler():
+            await asyncio.sleep(0.1)
+            await blocking()
+            return "done"
+
+        @profiler.track_memory_async(sample_rate=1e-6)
+        async def cancelled():
+            await asyncio.sleep(10)
+
+        async def main():
+            task = asyncio.create_task(cancelled())
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await handler()
+
+        self.assertEqual(asyncio.run(main()), "done")
+        entries = {(e["function"], e.get("source")): e for e in profiler.function_data}
+
+        # Sleeping is awaited time; spinning holds the loop and burns CPU
+        outer = entries[("handler", None)]
+        self.assertGreaterEqual(outer["awaited_time"], 0.09)
+        self.assertGreaterEqual(outer["loop_time"], 0.08)
+        self.assertLess(outer["loop_time"], 0.1)
+        self.assertEqual(outer["steps"], 2)
+        inner = entries[("blocking", None)]
+        self.assertGreaterEqual(inner["cpu_time"], 0.05)
+        self.assertLess(inner["awaited_time"], 0.01)
+
+        # The stall is charged to the innermost coroutine that was spinning
+        stall = entries[("blocking", "stall")]
+        self.assertGreaterEqual(stall["execution_time"], 0.08)
+        self.assertEqual({key.rsplit(".", 1)[-1] for key in stall["breakdown"]}, {"handler", "blocking"})
+        self.assertNotIn(("handler", "stall"), entries)
+        self.assertEqual(profiler.stats()[entry_key(stall)]["execution_time"]["count"], 1)
+
+    def test_finalize_without_visualization_extra(self):
+        @self.profiler.track_memory
+        def work():
+            return None
+
+        work()
+        # A collection-only install cannot import the visualizer
+        with patch.dict("sys.modules", {"profiler.visualizer": None}):
+            with self.assertLogs("profiler.core", "WARNING") as logs:
+                self.profiler.finalize()
+        self.assertIn("[viz]", logs.output[0])
+        self.assertTrue(self.profiler._closed)
+        with open(self.profiler.log_file) as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+    def test_async_decorator_awaits_other_awaitables(self):
+        async def one():
+            return 1
+
+        # Not a coroutine function, but returns an awaitable
+        @self.profiler.track_memory_async
+        def gathered():
+            return asyncio.gather(one(), one())
+
+        @self.profiler.track_memory_async(sample_rate=1e-6)
+        def sampled_out():
+            return asyncio.gather(one())
+
+        async def main():
+            return await gathered(), await sampled_out()
+
+        self.assertEqual(asyncio.run(main()), ([1, 1], [1]))
+        (entry,) = [e for e in self.profiler.function_data if e["function"] == "gathered"]
+        self.assertNotIn("steps", entry)
+
+    def test_stack_sampler_attributes_functions_and_lines(self):
+        def spin(seconds):
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+
+        def wait_for(event):
+            event.wait()
+
+        # Time waiting inside the standard library is charged to the caller
+        done = threading.Event()
+        waiter = threading.Thread(target=wait_for, args=(done,))
+        waiter.start()
+        with self.profiler.sample(hz=200, window=0.1) as sampler:
+            spin(0.3)
+        done.set()
+        waiter.join()
+        self.assertGreater(sampler.samples, 20)
+        sampled_files = {e["file"] for e in self.profiler.function_data if e.get("source") == "sampler"}
+        self.assertNotIn("threading.py", sampled_files)
+        self.assertTrue(any(e["qualname"].endswith("wait_for") for e in self.profiler.function_data
+                            if e.get("source") == "sampler"))
+
+        sampled = [e for e in self.profiler.function_data
+                   if e.get("source") == "sampler" and e["qualname"].endswith("spin")]
+        self.assertGreater(len(sampled), 1)
+        self.assertGreater(sum(e["execution_time"] for e in sampled), 0.1)
+        self.assertTrue(all(e["lines"] and e["peak_memory_mb"] > 0 for e in sampled))
+        self.assertTrue(all(key.endswith("@sampler") for key in self.profiler.time_series_data
+                            if "spin" in key))
+        self.assertTrue(any(stack.endswith(".spin") for stack in sampler.stack_micros()))
+
+        self.profiler.save_profiling_data()
+        stacks_dir = os.path.join(self.test_report_dir, "JsonData", "stacks")
+        self.assertTrue(any(name.startswith("samples-") for name in os.listdir(stacks_dir)))
+
+    def test_record_store_views(self):
+        store = RecordStore()
+        info = {"os": "Linux", "cpu_cores_logical": 8}
+        entries = [
+            {"file": "a.py", "function": "f", "peak_memory_mb": 1.5, "calls": 3,
+             "timestamp": "2024-01-01T00:00:00.000001+00:00", "system_info": info},
+            {"file": "a.py", "function": "g", "peak_memory_mb": 2, "tags": ["x"],
+             "timestamp": "2024-01-01T00:00:01+00:00", "system_info": dict(info)},
+            {"file": "a.py", "function": "f", "peak_memory_mb": 0.25,
+             "timestamp": "2024-01-01T00:00:02+00:00", "system_info": info},
+        ]
+        for entry in entries:
+            store.append(entry, f"{entry['file']}:{entry['function']}")
+
+        self.assertEqual(list(store.records()), entries)
+        self.assertEqual(len(store._sessions), 1)
+        series = store.time_series()
+        self.assertEqual(list(series), ["a.py:f", "a.py:g"])
+        self.assertEqual(list(series["a.py:f"]), [entries[0], entries[2]])
+        self.assertEqual(len(store.time_series(stop=1)["a.py:f"]), 1)
+
+        # Trimming keeps sparse values, sessions and per-key rows of the remaining entries
+        trimmed = store.trimmed(since=store.column("timestamp")[1])
+        self.assertEqual(list(trimmed.records()), entries[1:])
+        self.assertEqual(list(trimmed.time_series()["a.py:f"]), [entries[2]])
+        self.assertEqual(list(store.trimmed(max_rows=1, stop=2).records()), [entries[1]])
+        self.assertIsNone(store.trimmed(since=0, max_rows=3))
+
+        # A value being interned while the copy is made is not half-copied
+        store._string_ids["h"] = len(store._strings)
+        trimmed = store.trimmed(max_rows=1)
+        late = dict(entries[0], function="h", system_info={"os": "Mac"})
+        trimmed.append(late, "a.py:h")
+        self.assertEqual(list(trimmed.records()), [entries[2], late])
+        self.assertEqual(len(trimmed._sessions), 2)
+
+    def test_streaming_stats(self):
+        @self.profiler.track_memory
+        def test_func():
+            return "success"
+
+        for _ in range(5):
+            test_func()
+        (key, summary), = [(k, v) for k, v in self.profiler.stats().items() if k.endswith(".test_func")]
+        self.assertEqual(summary["calls"], 5)
+        self.assertEqual(summary["execution_time"]["count"], 5)
+        self.assertIn(key, self.profiler.summary())
+
+        merged = merge_stats([self.profiler.export_stats(), self.profiler.export_stats()])
+        self.assertEqual(merged[key].summary()["execution_time"]["count"], 10)
+
+    def test_ddsketch_relative_accuracy(self):
+        rng = random.Random(1)
+        values = sorted(rng.lognormvariate(0, 2) for _ in range(20_000))
+        left, right = DDSketch(0.01), DDSketch(0.01)
+        for i, v in enumerate(values):
+            (left if i % 2 else right).add(v)
+        left.merge(right)
+        for q in (0.5, 0.95, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(left.quantile(q) / exact, 1.0, delta=0.011)
+
+    def test_cpu_sampler_window(self):
+        sampler = CPUSampler(interval=0.01)
+        sampler.start()
+        try:
+            start = time.perf_counter()
+            deadline = start + 0.1
+            while time.perf_counter() < deadline:
+                pass
+            end = time.perf_counter()
+            time.sleep(0.03)
+            system_pct, process_pct = sampler.cpu_usage(start, end)
+        finally:
+            sampler.stop()
+        self.assertGreaterEqual(system_pct, 0.0)
+        self.assertLessEqual(system_pct, 100.0)
+        self.assertGreater(process_pct, 0.0)
+
+    def test_cpu_sampler_bisects_wrapped_ring(self):
+        sampler = CPUSampler(interval=0.01, capacity=5)
+        for _ in range(7):
+            sampler.sample()
+        self.assertEqual(sampler._head, 2)
+        ordered = sampler._times[2:] + sampler._times[:2]
+        probes = [ordered[0] - 1, ordered[-1] + 1] + ordered + [(a + b) / 2 for a, b in zip(ordered, ordered[1:])]
+        for value in probes:
+            self.assertEqual(sampler._bisect(value, bisect_left), bisect_left(ordered, value))
+            self.assertEqual(sampler._bisect(value, bisect_right), bisect_right(ordered, value))
+        self.assertGreaterEqual(sampler.cpu_usage(ordered[1], ordered[3])[1], 0.0)
+
+
 if __name__ == '__main__':
     unittest.main()
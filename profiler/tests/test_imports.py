@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "seaborn", "tqdm", "azure")
+
+
+def _import_times(statement):
+    """Run ``statement`` under ``-X importtime`` and return {module: cumulative us}"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_collection_path_skips_optional_dependencies(self):
+        times = _import_times("import profiler; profiler.Profiler")
+        self.assertIn("profiler.core", times)
+        heavy = sorted(m for m in times if m.split(".")[0] in HEAVY_MODULES)
+        self.assertEqual(heavy, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from profiler.regression import detect_regressions, main, mann_whitney_greater
+
+SYSTEM_INFO = {"os": "Linux 6.1", "architecture": "x86_64", "total_ram_gb": 16.0,
+               "cpu_cores_physical": 4, "cpu_cores_logical": 8, "cpu_max_freq": 3000.0}
+
+
+def _run(session_id, start, times, system_info=SYSTEM_INFO):
+    return [{
+        "file": "app.py",
+        "function": "handler",
+        "qualname": "handler",
+        "execution_time": t,
+        "peak_memory_mb": 1.0,
+        "timestamp": (start + timedelta(seconds=i)).isoformat(),
+        "system_info": system_info,
+        "session_id": session_id,
+    } for i, t in enumerate(times)]
+
+
+class TestRegression(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.baseline = _run("base", self.start, rng.lognormal(-4, 0.2, 200))
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_regression_")
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+    def _current(self, factor, session_id="current", system_info=SYSTEM_INFO):
+        rng = np.random.default_rng(2)
+        return _run(session_id, self.start + timedelta(days=1), rng.lognormal(-4, 0.2, 200) * factor, system_info)
+
+    def test_flags_p95_slowdown(self):
+        report = detect_regressions(self.baseline + self._current(1.5))
+        self.assertEqual(report["baseline"]["session_id"], "base")
+        self.assertEqual(report["regressions"], 1)
+        (timing,) = [r for r in report["results"] if r["metric"] == "execution_time"]
+        self.assertEqual(timing["status"], "regression")
+        self.assertGreater(timing["ci"][0], 0.2)
+        self.assertLess(timing["mann_whitney_p"], 1e-6)
+        json.dumps(report, allow_nan=False)
+
+        unchanged = detect_regressions(self.baseline + self._current(1.0))
+        self.assertEqual(unchanged["regressions"], 0)
+
+    def test_baseline_requires_same_hardware(self):
+        other = dict(SYSTEM_INFO, cpu_cores_logical=64)
+        report = detect_regressions(self.baseline + self._current(1.5, system_info=other))
+        self.assertIsNone(report["regressions"])
+        self.assertIn("same hardware", report["error"])
+
+    def test_cli_exit_codes(self):
+        json_dir = os.path.join(self.report_dir, "JsonData")
+        os.makedirs(json_dir)
+
+        def run_cli(records):
+            with open(os.path.join(json_dir, "profiler_log.json"), "w") as f:
+                json.dump(records, f)
+            output = os.path.join(self.report_dir, "regressions.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                code = main([self.report_dir, "--output", output])
+            with open(output) as f:
+                return code, json.load(f)
+
+        self.assertEqual(run_cli(self.baseline)[0], 2)
+        self.assertEqual(run_cli(self.baseline + self._current(1.0))[0], 0)
+        code, report = run_cli(self.baseline + self._current(1.5))
+        self.assertEqual(code, 1)
+        self.assertEqual(report["regressions"], 1)
+
+    def test_undefined_interval_is_insufficient_data(self):
+        # A baseline quantile of zero leaves the relative change without a CI
+        baseline = _run("base", self.start, [0.0] * 20)
+        report = detect_regressions(baseline + self._current(1.0))
+        self.assertEqual(report["regressions"], 0)
+        (timing,) = [r for r in report["results"] if r["metric"] == "execution_time"]
+        self.assertEqual(timing["status"], "insufficient_data")
+        self.assertEqual(timing["ci"], [None, None])
+
+    def test_mann_whitney(self):
+        rng = np.random.default_rng(3)
+        same = rng.normal(size=500)
+        self.assertGreater(mann_whitney_greater(same, rng.normal(size=500)), 0.01)
+        self.assertLess(mann_whitney_greater(same, rng.normal(0.5, 1, size=500)), 1e-6)
+        self.assertGreater(mann_whitney_greater(same, rng.normal(-0.5, 1, size=500)), 0.99)
+
+
+if __name__ == '__main__':
+    unittest.main()
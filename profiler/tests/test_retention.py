@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from profiler.core import Profiler
+from profiler.recordlog import RecordLog
+from profiler.retention import RetentionPass, RetentionPolicy, RollupStore
+from profiler.shards import ShardSet, shard_path
+from profiler.store import timestamp_micros
+
+NOW = datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+
+def _write(json_dir, count, start, step=timedelta(minutes=1)):
+    """``count`` records of one function, ``step`` apart from ``start``"""
+    ShardSet(json_dir)
+    log = RecordLog(shard_path(json_dir))
+    for i in range(count):
+        log.append({
+            "file": "app.py",
+            "function": "handler",
+            "qualname": "handler",
+            "peak_memory_mb": 1.0,
+            "cpu_usage": 10.0,
+            "execution_time": 0.01 * (1 + i % 10),
+            "timestamp": (start + i * step).isoformat(),
+        })
+    log.close()
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_retention_")
+        self.json_dir = os.path.join(self.report_dir, "JsonData")
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+    def _compact(self, storage, policy):
+        shards = ShardSet(self.json_dir, storage=storage, retention=policy)
+        shards.compact(now=timestamp_micros(NOW))
+        records = list(shards.iter_records())
+        if shards.database is not None:
+            shards.database.close()
+        return records
+
+    def test_ttl_rolls_up_expired_records(self):
+        for storage in ("json", "sqlite"):
+            with self.subTest(storage=storage):
+                _write(self.json_dir, 180, NOW - timedelta(hours=3))
+                policy = RetentionPolicy(raw_ttl=timedelta(hours=1), minute_ttl=timedelta(minutes=90))
+                records = self._compact(storage, policy)
+                self.assertEqual(len(records), 60)
+                self.assertGreaterEqual(min(timestamp_micros(r["timestamp"]) for r in records),
+                                        timestamp_micros(NOW - timedelta(hours=1)))
+
+                # Two hours expired: the older half cascaded from minutes into hours
+                rollups = RollupStore(self.json_dir)
+                minutes = rollups.query(levels=["minute"])
+                hours = rollups.query(levels=["hour"])
+                self.assertEqual(len(minutes), 30)
+                self.assertEqual(sum(r.count for r in minutes + hours), 120)
+                self.assertEqual(rollups.function_stats()["app.py:handler"].count, 120)
+                summary = hours[0].summary()
+                self.assertAlmostEqual(summary["execution_time"]["p95"], 0.1, delta=0.002)
+                shutil.rmtree(self.report_dir)
+
+    def test_record_cap(self):
+        for storage in ("json", "sqlite"):
+            with self.subTest(storage=storage):
+                _write(self.json_dir, 50, NOW - timedelta(hours=1))
+                self.assertEqual(len(self._compact(storage, RetentionPolicy(max_records=40))), 40)
+                _write(self.json_dir, 20, NOW)
+                records = self._compact(storage, RetentionPolicy(max_records=40))
+                self.assertEqual(len(records), 40)
+                self.assertEqual(records[-1]["timestamp"], (NOW + timedelta(minutes=19)).isoformat())
+                self.assertEqual(RollupStore(self.json_dir).function_stats()["app.py:handler"].count, 30)
+                shutil.rmtree(self.report_dir)
+
+    def test_interleaved_timestamps_expire(self):
+        old, recent = NOW - timedelta(hours=3), NOW - timedelta(minutes=5)
+        entries = [{"file": "app.py", "function": "handler", "qualname": "handler",
+                    "peak_memory_mb": 1.0, "cpu_usage": 10.0, "execution_time": 0.01,
+                    "timestamp": ((old if i % 2 else recent) + timedelta(seconds=i)).isoformat()}
+                   for i in range(40)]
+        policy = RetentionPolicy(raw_ttl=timedelta(hours=1))
+
+        # Every entry is checked, not just those before the first recent one
+        retention = RetentionPass(policy, RollupStore(self.json_dir), now=timestamp_micros(NOW))
+        self.assertEqual(sum(retention.keep(entry) for entry in entries), 20)
+        self.assertEqual(retention.expired, 20)
+
+        for storage in ("json", "sqlite"):
+            with self.subTest(storage=storage):
+                ShardSet(self.json_dir)
+                log = RecordLog(shard_path(self.json_dir))
+                for entry in entries:
+                    log.append(entry)
+                log.close()
+                records = self._compact(storage, policy)
+                self.assertEqual(len(records), 20)
+                self.assertTrue(all(timestamp_micros(r["timestamp"]) >= timestamp_micros(recent) for r in records))
+                self.assertEqual(RollupStore(self.json_dir).function_stats()["app.py:handler"].count, 20)
+                shutil.rmtree(self.report_dir)
+
+    def test_profiler_trims_memory_to_byte_cap(self):
+        _write(self.json_dir, 100, NOW)
+        ShardSet(self.json_dir).compact()
+        record_size = os.path.getsize(os.path.join(self.json_dir, "profiler_records.jsonl")) / 100
+        profiler = Profiler(report_dir=self.report_dir, auto_finalize=False,
+                            retention=RetentionPolicy(max_bytes=int(record_size * 40)))
+        self.assertEqual(len(profiler.function_data), 100)
+        profiler.save_profiling_data()
+        stored = len(list(profiler._shards.iter_records()))
+        self.assertLess(stored, 45)
+        self.assertEqual(len(profiler.function_data), stored)
+        profiler.close()
+
+    def test_profiler_keeps_lifetime_stats_and_bounded_memory(self):
+        _write(self.json_dir, 100, datetime.now(timezone.utc) - timedelta(days=2))
+        profiler = Profiler(report_dir=self.report_dir, auto_finalize=False,
+                            retention=RetentionPolicy(raw_ttl=timedelta(days=1)), compaction_interval=0.05)
+
+        @profiler.track_memory
+        def handler():
+            return None
+
+        handler()
+        self.assertEqual(len(profiler.function_data), 101)
+        deadline = datetime.now() + timedelta(seconds=5)
+        while len(profiler.function_data) > 1 and datetime.now() < deadline:
+            profiler._stop_compaction.wait(0.05)
+        self.assertEqual(len(profiler.function_data), 1)
+        self.assertEqual(profiler.stats()["app.py:handler"]["execution_time"]["count"], 100)
+        profiler.close()
+
+        # A new profiler loads only the retained record, plus the rolled-up aggregates
+        reopened = Profiler(report_dir=self.report_dir, auto_finalize=False)
+        self.assertEqual(len(reopened.function_data), 1)
+        self.assertEqual(reopened.stats()["app.py:handler"]["execution_time"]["count"], 100)
+        reopened.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from profiler import storage
+from profiler.storage import AzureStorage
+
+
+class _FakeBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def upload_blob(self, data, overwrite=False, max_concurrency=1, content_settings=None):
+        self.container.blobs[self.name] = (data.read(), content_settings.content_md5)
+        self.container.uploads.append(self.name)
+
+
+class _FakeContainer:
+    def __init__(self):
+        self.blobs = {}
+        self.uploads = []
+
+    def get_blob_client(self, name):
+        return _FakeBlob(self, name)
+
+    def list_blobs(self, name_starts_with=None):
+        return [SimpleNamespace(name=name, content_settings=SimpleNamespace(content_md5=bytearray(md5)))
+                for name, (_, md5) in self.blobs.items()
+                if not name_starts_with or name.startswith(name_starts_with)]
+
+
+class _FakeServiceClient:
+    def __init__(self):
+        self.containers = {}
+
+    def get_container_client(self, name):
+        return self.containers.setdefault(name, _FakeContainer())
+
+
+class TestAzureStorage(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_upload_")
+        for relative, content in (("JsonData/profiler_log.json", b"[]"),
+                                  ("Visualization/chart.png", b"png"),
+                                  ("JsonData/profiler_log.json.tmp", b"partial")):
+            path = os.path.join(self.report_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+        self.service = _FakeServiceClient()
+        self.storage = AzureStorage(service_client=self.service, max_workers=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+    def test_upload_directory_skips_unchanged_blobs(self):
+        result = self.storage.upload_directory("reports", self.report_dir, prefix="run")
+        self.assertEqual(result["uploaded"], ["run/JsonData/profiler_log.json", "run/Visualization/chart.png"])
+        container = self.service.containers["reports"]
+        self.assertEqual(container.blobs["run/Visualization/chart.png"],
+                         (b"png", hashlib.md5(b"png").digest()))
+
+        with open(os.path.join(self.report_dir, "Visualization", "chart.png"), "wb") as f:
+            f.write(b"new png")
+        container.uploads.clear()
+        result = self.storage.upload_directory("reports", self.report_dir, prefix="run")
+        self.assertEqual(result["uploaded"], ["run/Visualization/chart.png"])
+        self.assertEqual(result["skipped"], ["run/JsonData/profiler_log.json"])
+        self.assertEqual(container.uploads, ["run/Visualization/chart.png"])
+
+    @unittest.skipIf(storage.BlobServiceClient is None, "azure-storage-blob is not installed")
+    def test_clients_are_shared_per_connection_string(self):
+        with patch.object(storage, "_clients", {}), \
+                patch.object(storage.BlobServiceClient, "from_connection_string") as connect:
+            first = AzureStorage("UseDevelopmentStorage=true")
+            second = AzureStorage("UseDevelopmentStorage=true")
+        connect.assert_called_once_with("UseDevelopmentStorage=true")
+        self.assertIs(first.service_client, second.service_client)
+
+
+if __name__ == '__main__':
+    unittest.main()
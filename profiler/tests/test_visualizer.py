@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from profiler.database import RecordDatabase
+from profiler.recordlog import RecordLog
+from profiler.retention import RetentionPolicy, RollupStore
+from profiler.shards import ShardSet, shard_path
+from profiler.store import timestamp_micros
+from profiler.visualizer import Visualizer, _aggregate_time_series, _lttb_downsample
+
+
+def _records(file, function, count, start=None):
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "file": file,
+        "function": function,
+        "peak_memory_mb": 1.0 + i % 3,
+        "cpu_usage": 10.0 + i,
+        "execution_time": 0.01 * (i + 1),
+        "timestamp": (start + timedelta(seconds=i)).isoformat(),
+    } for i in range(count)]
+
+
+class TestVisualizer(unittest.TestCase):
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp(prefix="profiler_vis_")
+        self.json_dir = os.path.join(self.report_dir, "JsonData")
+        os.makedirs(self.json_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir, ignore_errors=True)
+
+    def _write_time_series(self, data):
+        with open(os.path.join(self.json_dir, "profiler_time_series.json"), "w") as f:
+            json.dump(data, f)
+
+    def test_incremental_parallel_render(self):
+        data = {
+            "a.py:f": _records("a.py", "f", 5),
+            "a.py:g": _records("a.py", "g", 3),
+        }
+        self._write_time_series(data)
+        visualizer = Visualizer(report_dir=self.report_dir, workers=2)
+        visualizer.visualize_over_time()
+
+        combined = os.path.join(visualizer.overtime_dir, "combined")
+        charts = sorted(os.listdir(combined))
+        self.assertEqual(charts, ["a_f_combined.png", "a_g_combined.png"])
+        with open(os.path.join(visualizer.vis_dir, "render_manifest.json")) as f:
+            self.assertEqual(json.load(f)["a.py:f"]["records"], 5)
+
+        # Only the function with new records is rendered again
+        mtimes = {name: os.path.getmtime(os.path.join(combined, name)) for name in charts}
+        data["a.py:g"] = _records("a.py", "g", 4)
+        self._write_time_series(data)
+        Visualizer(report_dir=self.report_dir, workers=2).visualize_over_time()
+        self.assertEqual(os.path.getmtime(os.path.join(combined, "a_f_combined.png")), mtimes["a_f_combined.png"])
+        self.assertNotEqual(os.path.getmtime(os.path.join(combined, "a_g_combined.png")), mtimes["a_g_combined.png"])
+
+    def test_sqlite_render_reads_only_pending_functions(self):
+        database = RecordDatabase(os.path.join(self.json_dir, "profiler_records.sqlite"))
+        with database.transaction():
+            database.insert(_records("a.py", "f", 5) + _records("a.py", "g", 3))
+        database.close()
+
+        visualizer = Visualizer(report_dir=self.report_dir, workers=1)
+        self.assertEqual(visualizer.storage, "sqlite")
+        visualizer.visualize_usage()
+        visualizer.visualize_over_time()
+        combined = os.path.join(visualizer.overtime_dir, "combined")
+        self.assertEqual(sorted(os.listdir(combined)), ["a_f_combined.png", "a_g_combined.png"])
+
+        with patch.object(Visualizer, "_load_frames", wraps=visualizer._load_frames) as load:
+            Visualizer(report_dir=self.report_dir, workers=1).visualize_over_time()
+        load.assert_not_called()
+
+    def test_usage_bars_keep_functions_and_sources_apart(self):
+        sampled = [dict(r, source="sampler") for r in _records("a.py", "f", 2, datetime(2024, 1, 2, tzinfo=timezone.utc))]
+        records = _records("a.py", "f", 2) + _records("b.py", "f", 3) + sampled
+        database = RecordDatabase(os.path.join(self.json_dir, "profiler_records.sqlite"))
+        with database.transaction():
+            database.insert(records)
+        database.close()
+
+        visualizer = Visualizer(report_dir=self.report_dir, workers=1)
+        with patch("profiler.visualizer.sns.barplot", wraps=sns.barplot) as barplot:
+            visualizer.visualize_usage()
+        bars = barplot.call_args.kwargs["data"]
+        self.assertEqual(sorted(bars["label"]), ["a.py:f", "b.py:f"])
+        self.assertEqual(sorted(bars["execution_time"]), [0.02, 0.03])
+
+        # Sampled records get their own over-time charts, not the function's
+        visualizer.visualize_over_time()
+        combined = os.path.join(visualizer.overtime_dir, "combined")
+        self.assertEqual(sorted(os.listdir(combined)), ["a_f@sampler_combined.png", "a_f_combined.png",
+                                                        "b_f_combined.png"])
+
+    def test_stall_records_do_not_replace_the_coroutine_bar(self):
+        stall = dict(_records("a.py", "handler", 1, datetime(2024, 1, 2, tzinfo=timezone.utc))[0],
+                     qualname="handler", source="stall", execution_time=0.5)
+        ShardSet(self.json_dir)
+        log = RecordLog(shard_path(self.json_dir))
+        for entry in _records("a.py", "handler", 2) + [stall]:
+            log.append(entry)
+        log.close()
+
+        visualizer = Visualizer(report_dir=self.report_dir, workers=1)
+        with patch("profiler.visualizer.sns.barplot", wraps=sns.barplot) as barplot:
+            visualizer.visualize_usage()
+        bars = barplot.call_args.kwargs["data"]
+        self.assertEqual(list(bars["label"]), ["handler"])
+        self.assertEqual(list(bars["execution_time"]), [0.02])
+
+    def test_rollups_extend_over_time_charts(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._write_time_series({"a.py:f": _records("a.py", "f", 120, start),
+                                 "a.py:g": _records("a.py", "g", 3, start + timedelta(days=1))})
+        # Everything before the last day is rolled up; f then only exists as rollups
+        retention = RetentionPolicy(raw_ttl=timedelta(days=1))
+        ShardSet(self.json_dir, retention=retention).compact(now=timestamp_micros(start + timedelta(days=2)))
+        self.assertEqual(sum(r.count for r in RollupStore(self.json_dir).query()), 120)
+
+        visualizer = Visualizer(report_dir=self.report_dir, workers=1)
+        visualizer.visualize_over_time()
+        combined = os.path.join(visualizer.overtime_dir, "combined")
+        self.assertEqual(sorted(os.listdir(combined)), ["a_f_combined.png", "a_g_combined.png"])
+        with open(os.path.join(visualizer.vis_dir, "render_manifest.json")) as f:
+            self.assertEqual(json.load(f)["a.py:f"], {"records": 0, "last_timestamp": None,
+                                                      "rollups": 1, "rolled_up": 120})
+
+    def test_call_tree_icicle(self):
+        os.makedirs(os.path.join(self.json_dir, "stacks"))
+        for name in ("stacks-1-a.folded", "stacks-2-b.folded"):
+            with open(os.path.join(self.json_dir, "stacks", name), "w") as f:
+                f.write("a.py:main 1000\na.py:main;a.py:load 3000\na.py:main;a.py:save 500\n")
+        visualizer = Visualizer(report_dir=self.report_dir)
+        visualizer.visualize_call_tree()
+        self.assertTrue(os.path.exists(os.path.join(visualizer.call_tree_dir, "icicle.png")))
+
+        # Every root narrower than min_fraction: no boxes, no chart
+        with open(os.path.join(self.json_dir, "stacks", "samples-3-c.folded"), "w") as f:
+            f.writelines(f"a.py:worker{i} 10\n" for i in range(200))
+        visualizer.visualize_call_tree(min_fraction=0.01)
+        self.assertFalse(os.path.exists(os.path.join(visualizer.call_tree_dir, "sampled_icicle.png")))
+
+    def test_lttb_keeps_budget_and_extremes(self):
+        x = np.arange(10_000, dtype=float)
+        y = np.sin(x / 500.0)
+        y[4321] = 50.0
+        keep = _lttb_downsample(x, y, 200)
+        self.assertEqual(len(keep), 200)
+        self.assertEqual((keep[0], keep[-1]), (0, 9_999))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        self.assertIn(4321, keep)
+
+    def test_aggregate_time_series_percentiles(self):
+        df = Visualizer._clean_data(pd.DataFrame(_records("a.py", "f", 1_000)))
+        agg = _aggregate_time_series(df, "execution_time", 10)
+        self.assertEqual(len(agg), 10)
+        self.assertTrue((agg["p50"] <= agg["p95"]).all())
+        self.assertTrue((agg["p99"] <= agg["max"]).all())
+        self.assertAlmostEqual(agg["max"].max(), df["execution_time"].max())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,323 @@
 import os
 import json
 import logging
+import multiprocessing
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
 from tqdm import tqdm
 from pathvalidate import sanitize_filename
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Optional, Sequence, Tuple, Union
+from .calltree import CALL_STACKS, SAMPLED_STACKS, load_collapsed
+from .database import DATABASE_FILE, RecordDatabase
+from .retention import Rollup
+from .shards import ShardSet
+from .store import entry_key, timestamp_micros
 
 logger = logging.getLogger(__name__)
 
+TIME_SERIES_METRICS = [
+    ("cpu_usage", "CPU Usage (%)", "cpu"),
+    ("peak_memory_mb", "Memory Usage (MB)", "memory"),
+    ("execution_time", "Execution Time (seconds)", "execution_time")
+]
+
+MANIFEST_FILE = "render_manifest.json"
+
+# Columns read from the record database for charts
+FRAME_COLUMNS = ("func_key", "file", "function", "qualname", "timestamp",
+                 "cpu_usage", "peak_memory_mb", "execution_time")
+
+# Record sources that are not calls of the function (whole-program samples,
+# event-loop stalls), left out of the latest-usage bars
+_UNCHARTED_SOURCES = {"sampler", "stall"}
+
+# Icicle charts per kind of collapsed stacks
+ICICLE_CHARTS = {
+    CALL_STACKS: ("icicle.png", "Call Tree (icicle)", "Inclusive time (ms)"),
+    SAMPLED_STACKS: ("sampled_icicle.png", "Sampled Stacks (icicle)", "Estimated wall time (ms)"),
+}
+
+# Series longer than this are drawn as aggregated percentile bands
+DEFAULT_MAX_POINTS = 1000
+DEFAULT_TIME_BUCKETS = 200
+
+
+def _apply_plot_style() -> None:
+    """Set consistent visualization style"""
+    plt.style.use("ggplot")
+    sns.set_theme(
+        style="whitegrid",
+        palette="husl",
+        font_scale=1.1,
+        rc={
+            "figure.figsize": (12, 6),
+            "axes.titlesize": 14,
+            "axes.labelsize": 12,
+            "xtick.labelsize": 10,
+            "ytick.labelsize": 10,
+            "legend.fontsize": 10,
+            "grid.alpha": 0.3,
+        }
+    )
+
+
+def _render_context() -> Any:
+    """Start method for render workers that never forks this process
+
+    A forked worker would inherit every live Profiler and restart its
+    collection threads; forkserver and spawn start from a clean process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _init_render_worker() -> None:
+    """Process pool initializer: headless backend and shared style"""
+    matplotlib.use("Agg")
+    _apply_plot_style()
+
+
+# Figures are reused across charts rendered by the same process
+_figures: Dict[Tuple[float, float], Figure] = {}
+
+
+def _get_figure(figsize: Tuple[float, float]) -> Figure:
+    fig = _figures.get(figsize)
+    if fig is None:
+        fig = _figures[figsize] = Figure(figsize=figsize)
+    else:
+        fig.clear()
+    return fig
+
+
+def _key_source(func_key: str) -> str:
+    """The ``@source`` suffix of a func_key, empty for decorated functions"""
+    return func_key.rpartition(":")[2].partition("@")[2]
+
+
+def _chart_names(first: Mapping[str, Any], func_key: Optional[str] = None) -> Tuple[str, str]:
+    """Sanitized file and function names used for a function's chart files"""
+    qualname = first.get("qualname")
+    if not isinstance(qualname, str) or not qualname:
+        qualname = first.get("function", "unknown")
+    source = first.get("source")
+    if not (isinstance(source, str) and source) and func_key is not None:
+        # Database rows keep the source only in their func_key
+        source = _key_source(func_key)
+    if isinstance(source, str) and source:
+        qualname = f"{qualname}@{source}"
+    filename = sanitize_filename(str(first.get("file", "unknown")).replace(".py", ""), replacement_text="_")
+    func_name = sanitize_filename(str(qualname), replacement_text="_")
+    return filename, func_name
+
+
+def _bar_labels(df: pd.DataFrame) -> List[str]:
+    """Bar label per row: the function name, with its file where names repeat"""
+    labels = [f"{name}@{source}" if source else name
+              for name, source in zip(df["function"], map(_key_source, df["func_key"]))]
+    repeated = {label for label, count in Counter(labels).items() if count > 1}
+    return [f"{os.path.basename(str(file))}:{label}" if label in repeated else label
+            for file, label in zip(df["file"], labels)]
+
+
+def _metric_dirs(overtime_dir: str) -> Dict[str, str]:
+    return {
+        "cpu": os.path.join(overtime_dir, "cpu"),
+        "memory": os.path.join(overtime_dir, "memory"),
+        "execution_time": os.path.join(overtime_dir, "execution_time"),
+        "combined": os.path.join(overtime_dir, "combined")
+    }
+
+
+def _combined_chart_path(overtime_dir: str, filename: str, func_name: str) -> str:
+    return os.path.join(_metric_dirs(overtime_dir)["combined"],
+                        sanitize_filename(f"{filename}_{func_name}_combined.png"))
+
+
+def _aggregate_time_series(df: pd.DataFrame, metric: str, buckets: int) -> pd.DataFrame:
+    """Resample a metric into equal time buckets with mean/p50/p95/p99/max"""
+    ts = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    start = ts.min()
+    width = max((ts.max() - start) // buckets + 1, 1)
+    bucket = (ts - start) // width
+
+    grouped = df[metric].groupby(bucket)
+    stats = grouped.agg(["mean", "max"])
+    quantiles = grouped.quantile([0.5, 0.95, 0.99]).unstack()
+    stats["p50"], stats["p95"], stats["p99"] = quantiles[0.5], quantiles[0.95], quantiles[0.99]
+    stats["timestamp"] = pd.to_datetime(start + stats.index.to_numpy() * width + width // 2, utc=True)
+    return stats.reset_index(drop=True)
+
+
+def _lttb_downsample(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` visually representative points"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < threshold - 1:
+            next_lo, next_hi = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev])
+                      - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(area.argmax())
+        selected[i + 1] = prev
+    return selected
+
+
+def _rollup_frame(rollups: Sequence[Rollup]) -> pd.DataFrame:
+    """One row per rollup bucket: its midpoint, count and mean/p50/p95/p99/max per metric"""
+    rows = []
+    for rollup in rollups:
+        row: Dict[str, Any] = dict(rollup.info, level=rollup.level, count=rollup.count)
+        row["timestamp"] = pd.Timestamp(rollup.bucket + rollup.width // 2, unit="us", tz="UTC")
+        for metric, _, _ in TIME_SERIES_METRICS:
+            summary = rollup.stats.metrics[metric].summary()
+            if summary["count"]:
+                row[metric] = summary["mean"]
+                for stat in ("p50", "p95", "p99", "max"):
+                    row[f"{metric}_{stat}"] = summary[stat]
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def _plot_history(ax: Any, history: pd.DataFrame, metric: str) -> None:
+    """Draw rolled-up buckets as a p50-p95 band with mean, p99 and max lines"""
+    if metric not in history:
+        return
+    history = history.dropna(subset=[metric])
+    if history.empty:
+        return
+    ax.fill_between(history["timestamp"], history[f"{metric}_p50"], history[f"{metric}_p95"],
+                    color="tab:purple", alpha=0.25, label="rollup p50-p95")
+    ax.plot(history["timestamp"], history[metric], color="tab:purple", linewidth=1.5, label="rollup mean")
+    ax.plot(history["timestamp"], history[f"{metric}_p99"], color="tab:purple", linestyle="--",
+            linewidth=1, label="rollup p99")
+    ax.plot(history["timestamp"], history[f"{metric}_max"], color="tab:purple", linestyle=":",
+            linewidth=1, label="rollup max")
+
+
+def _plot_metric(ax: Any, df: pd.DataFrame, metric: str, max_points: int, buckets: int,
+                 history: Optional[pd.DataFrame] = None) -> None:
+    """Draw one metric, aggregating long series so render time stays bounded
+
+    ``history`` holds rollups of records that retention has expired; they
+    are drawn before the raw records so the chart covers the whole history.
+    """
+    if history is not None and not history.empty:
+        _plot_history(ax, history, metric)
+        ax.legend(loc="upper left")
+    if df.empty:
+        return
+    if len(df) <= max_points:
+        sns.lineplot(x="timestamp", y=metric, data=df, marker="o", ax=ax)
+        return
+
+    df = df.sort_values("timestamp")
+    x = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    keep = _lttb_downsample(x, df[metric].to_numpy(dtype=float), max_points)
+    sample = df.iloc[keep]
+    ax.plot(sample["timestamp"], sample[metric], color="0.6", linewidth=0.6, alpha=0.6,
+            label=f"raw ({len(sample)} of {len(df)} points)")
+
+    agg = _aggregate_time_series(df, metric, buckets)
+    ax.fill_between(agg["timestamp"], agg["p50"], agg["p95"], alpha=0.3, label="p50-p95")
+    ax.plot(agg["timestamp"], agg["mean"], linewidth=1.5, label="mean")
+    ax.plot(agg["timestamp"], agg["p99"], linestyle="--", linewidth=1, label="p99")
+    ax.plot(agg["timestamp"], agg["max"], linestyle=":", linewidth=1, label="max")
+    ax.legend(loc="upper left")
+
+
+def _render_time_series(overtime_dir: str, df: pd.DataFrame, filename: str, func_name: str,
+                        max_points: int = DEFAULT_MAX_POINTS,
+                        buckets: int = DEFAULT_TIME_BUCKETS,
+                        history: Optional[pd.DataFrame] = None) -> None:
+    """Create comprehensive time-series visualizations"""
+    metric_dirs = _metric_dirs(overtime_dir)
+    for dir_path in metric_dirs.values():
+        os.makedirs(dir_path, exist_ok=True)
+
+    # Individual metric plots
+    for metric, ylabel, subdir in TIME_SERIES_METRICS:
+        fig = _get_figure((10, 5))
+        ax = fig.add_subplot()
+        _plot_metric(ax, df, metric, max_points, buckets, history)
+        ax.set_title(f"{filename} - {func_name}\n{ylabel}")
+        ax.set_xlabel("Timestamp")
+        ax.set_ylabel(ylabel)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M"))
+
+        plot_name = sanitize_filename(f"{filename}_{func_name}_{metric}.png")
+        fig.savefig(os.path.join(metric_dirs[subdir], plot_name),
+                    bbox_inches="tight", dpi=150)
+
+    # Combined plot
+    fig = _get_figure((14, 10))
+    fig.suptitle(f"{filename} - {func_name}", y=1.02)
+
+    for idx, (metric, ylabel, subdir) in enumerate(TIME_SERIES_METRICS, 1):
+        ax = fig.add_subplot(3, 1, idx)
+        _plot_metric(ax, df, metric, max_points, buckets, history)
+        ax.set_title(ylabel)
+        ax.set_xlabel("")
+        ax.set_ylabel(ylabel)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M"))
+
+    fig.savefig(_combined_chart_path(overtime_dir, filename, func_name),
+                bbox_inches="tight", dpi=150)
+
+    logger.debug(f"Generated reports for {filename}:{func_name}")
+
+
+def _render_function(overtime_dir: str, func_key: str, records: Union[List[Dict[str, Any]], pd.DataFrame],
+                     max_points: int = DEFAULT_MAX_POINTS, buckets: int = DEFAULT_TIME_BUCKETS,
+                     history: Optional[pd.DataFrame] = None) -> bool:
+    """Clean and render one function's records and rollups; returns False if nothing was drawn"""
+    frame = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+    has_history = history is not None and not history.empty
+    if frame.empty and not has_history:
+        return False
+    filename, func_name = _chart_names(frame.iloc[0] if not frame.empty else history.iloc[0], func_key)
+    df = Visualizer._clean_data(frame) if not frame.empty else frame
+    if df.empty and not has_history:
+        return False
+    _render_time_series(overtime_dir, df, filename, func_name, max_points, buckets, history)
+    return True
+
+
 class Visualizer:
-    def __init__(self, report_dir: str = None, debug: bool = False):
+    def __init__(self, report_dir: str = None, debug: bool = False,
+                 workers: Optional[int] = None, incremental: bool = True,
+                 max_points: int = DEFAULT_MAX_POINTS, time_buckets: int = DEFAULT_TIME_BUCKETS,
+                 storage: Optional[str] = None):
         self.report_dir = report_dir or os.path.join(os.getcwd(), "reports")
         self.debug = debug
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.incremental = incremental
+        self.max_points = max_points
+        self.time_buckets = time_buckets
         self._setup_paths()
         self._configure_plot_style()
+        # Report directories with a record database are read through SQL by default
+        self.storage = storage or ("sqlite" if os.path.exists(os.path.join(self.json_dir, DATABASE_FILE)) else "json")
+        self._shards = ShardSet(self.json_dir, storage=self.storage)
         
         if debug:
             logging.basicConfig(level=logging.DEBUG)
@@ -28,27 +329,14 @@ class Visualizer:
         self.vis_dir = os.path.join(self.report_dir, "Visualization")
         self.normal_dir = os.path.join(self.vis_dir, "NormalExecution")
         self.overtime_dir = os.path.join(self.vis_dir, "OverTime")
+        self.call_tree_dir = os.path.join(self.vis_dir, "CallTree")
         
-        for path in [self.vis_dir, self.normal_dir, self.overtime_dir]:
+        for path in [self.vis_dir, self.normal_dir, self.overtime_dir, self.call_tree_dir]:
             os.makedirs(path, exist_ok=True)
 
     def _configure_plot_style(self) -> None:
         """Set consistent visualization style"""
-        plt.style.use("ggplot")
-        sns.set_theme(
-            style="whitegrid",
-            palette="husl",
-            font_scale=1.1,
-            rc={
-                "figure.figsize": (12, 6),
-                "axes.titlesize": 14,
-                "axes.labelsize": 12,
-                "xtick.labelsize": 10,
-                "ytick.labelsize": 10,
-                "legend.fontsize": 10,
-                "grid.alpha": 0.3,
-            }
-        )
+        _apply_plot_style()
 
     def _load_data(self, filename: str) -> List[Dict[str, Any]]:
         """Safely load JSON data with error handling"""
@@ -62,26 +350,107 @@ class Visualizer:
             logger.error(f"Error loading {filepath}: {str(e)}")
             return []
 
-    def _clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _load_records(self) -> List[Dict[str, Any]]:
+        """Load every record, reading per-process shards directly"""
+        try:
+            return list(self._shards.iter_records())
+        except OSError as e:
+            logger.error(f"Error loading records from {self.json_dir}: {str(e)}")
+            return []
+
+    def _load_time_series(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Records grouped by ``func_key`` in timestamp order"""
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self._load_records():
+            series.setdefault(entry_key(entry), []).append(entry)
+        return series
+
+    def _read_frame(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """Run a query against the record database; timestamps become UTC datetimes"""
+        df = pd.read_sql_query(sql, self._shards.database.connection, params=list(params))
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="us", utc=True)
+        return df
+
+    def _tail_frame(self, func_keys: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Records still in shards that the database has not merged yet"""
+        keys = set(func_keys) if func_keys is not None else None
+        tails = [e for e in self._shards.iter_tail_records() if keys is None or entry_key(e) in keys]
+        df = pd.DataFrame(tails)
+        if tails:
+            df["func_key"] = [entry_key(e) for e in tails]
+            df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
+        return df
+
+    def _latest_frame(self) -> pd.DataFrame:
+        """Latest record of each function, selected in SQL"""
+        columns = ", ".join(f"r.{name}" for name in FRAME_COLUMNS)
+        df = self._read_frame(
+            f"SELECT {columns} FROM records r JOIN "
+            "(SELECT func_key, MAX(timestamp) AS latest FROM records GROUP BY func_key) m "
+            "ON r.func_key = m.func_key AND r.timestamp = m.latest"
+        )
+        tail = self._tail_frame()
+        return pd.concat([df, tail], ignore_index=True) if not tail.empty else df
+
+    def _database_series(self) -> Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Per function: render signature and chart names, without loading records"""
+        summary = self._shards.database.series_summary()
+        for entry in self._shards.iter_tail_records():
+            info = summary.setdefault(entry_key(entry), {
+                "records": 0, "last_timestamp": None, "file": entry.get("file"),
+                "function": entry.get("function"), "qualname": entry.get("qualname"),
+            })
+            info["records"] += 1
+            micros = timestamp_micros(entry.get("timestamp"))
+            if micros is not None and (info["last_timestamp"] is None or micros > info["last_timestamp"]):
+                info["last_timestamp"] = micros
+        return {
+            func_key: ({"records": info["records"], "last_timestamp": info["last_timestamp"]}, info)
+            for func_key, info in summary.items()
+        }
+
+    def _load_frames(self, func_keys: Sequence[str]) -> Dict[str, pd.DataFrame]:
+        """Records of the given functions, filtered in SQL and grouped by ``func_key``"""
+        where, params = RecordDatabase.where(functions=func_keys)
+        df = self._read_frame(f"SELECT {', '.join(FRAME_COLUMNS)} FROM records{where} ORDER BY timestamp", params)
+        tail = self._tail_frame(func_keys)
+        if not tail.empty:
+            df = pd.concat([df, tail], ignore_index=True).sort_values("timestamp", kind="stable")
+        return {func_key: group.reset_index(drop=True) for func_key, group in df.groupby("func_key", sort=False)}
+
+    @staticmethod
+    def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
         """Clean and prepare data for visualization"""
         numeric_cols = ["peak_memory_mb", "cpu_usage", "execution_time"]
         df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors="coerce")
         df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
+        if "qualname" in df:
+            # Qualified names keep same-named methods of different classes apart
+            df["function"] = df["qualname"].fillna(df["function"])
         return df.dropna(subset=numeric_cols + ["timestamp"])
 
     def visualize_usage(self) -> None:
         """Generate bar charts for latest execution metrics"""
-        data = self._load_data("profiler_log.json")
-        if not data:
+        if self._shards.database_ready():
+            df = self._latest_frame()
+        else:
+            records = self._load_records()
+            df = pd.DataFrame(records)
+            if records:
+                df["func_key"] = [entry_key(entry) for entry in records]
+        if not df.empty:
+            df = df[[_key_source(func_key) not in _UNCHARTED_SOURCES for func_key in df["func_key"]]]
+        if df.empty:
             logger.info("No profiling data available for visualization")
             return
 
-        df = self._clean_data(pd.DataFrame(data))
+        df = self._clean_data(df)
         if df.empty:
             return
 
         # Get latest entry per function
-        df_latest = df.sort_values("timestamp").drop_duplicates("function", keep="last")
+        df_latest = df.sort_values("timestamp").drop_duplicates("func_key", keep="last")
+        df_latest = df_latest.assign(label=_bar_labels(df_latest))
         
         metrics = {
             "peak_memory_mb": "Peak Memory Usage (MB)",
@@ -91,7 +460,7 @@ class Visualizer:
 
         for metric, title in metrics.items():
             plt.figure()
-            ax = sns.barplot(x="function", y=metric, data=df_latest)
+            ax = sns.barplot(x="label", y=metric, data=df_latest)
             ax.set_title(f"Latest {title} by Function")
             ax.set_xlabel("Function Name")
             ax.set_ylabel(title)
@@ -104,74 +473,176 @@ class Visualizer:
 
         logger.info(f"Saved normal execution reports to {self.normal_dir}")
 
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Per-function record signatures of the charts already rendered"""
+        path = os.path.join(self.vis_dir, MANIFEST_FILE)
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        path = os.path.join(self.vis_dir, MANIFEST_FILE)
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp, path)
+
+    @staticmethod
+    def _signature(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"records": len(records), "last_timestamp": records[-1].get("timestamp")}
+
+    def _is_current(self, manifest: Dict[str, Dict[str, Any]], func_key: str,
+                    signature: Dict[str, Any], first: Mapping[str, Any]) -> bool:
+        if manifest.get(func_key) != signature:
+            return False
+        filename, func_name = _chart_names(first, func_key)
+        return os.path.exists(_combined_chart_path(self.overtime_dir, filename, func_name))
+
+    def _rollup_series(self) -> Dict[str, List[Rollup]]:
+        """Rollups of expired records per function, by bucket"""
+        series: Dict[str, List[Rollup]] = {}
+        for rollup in self._shards.rollups.query():
+            series.setdefault(rollup.func_key, []).append(rollup)
+        for rollups in series.values():
+            rollups.sort(key=lambda rollup: rollup.bucket)
+        return series
+
     def visualize_over_time(self) -> None:
-        """Generate time-series plots for historical metrics"""
-        time_series_data = self._load_data("profiler_time_series.json")
-        if not time_series_data:
+        """Generate time-series plots for historical metrics
+
+        Functions whose records are unchanged since the last render are
+        skipped (unless ``incremental`` is off) and the rest are rendered in
+        a process pool of ``workers`` processes using the Agg backend. With
+        a record database only the pending functions' rows are read.
+        Rollups of records expired by retention are drawn before the raw
+        records, so long ranges stay cheap to read and render.
+        """
+        if self._shards.database_ready():
+            series = self._database_series()
+        else:
+            time_series_data = self._load_time_series()
+            series = {func_key: (self._signature(records), records[0])
+                      for func_key, records in time_series_data.items() if records}
+        rollups = self._rollup_series()
+        for func_key, buckets in rollups.items():
+            signature, first = series.get(func_key, ({"records": 0, "last_timestamp": None}, buckets[0].info))
+            rollup_signature = {"rollups": len(buckets), "rolled_up": sum(rollup.count for rollup in buckets)}
+            series[func_key] = (dict(signature, **rollup_signature), first)
+        if not series:
             logger.info("No time series data available")
             return
 
-        for func_key, records in tqdm(time_series_data.items(), desc="Processing functions"):
-            try:
-                df = pd.DataFrame(records)
-                df = self._clean_data(df)
-                if df.empty:
-                    continue
+        manifest = self._load_manifest() if self.incremental else {}
+        signatures = {
+            func_key: signature for func_key, (signature, first) in series.items()
+            if not (self.incremental and self._is_current(manifest, func_key, signature, first))
+        }
+        skipped = len(series) - len(signatures)
+        if skipped:
+            logger.info(f"Skipping {skipped} functions with no new records")
+        if self._shards.database_ready():
+            frames = self._load_frames(list(signatures)) if signatures else {}
+            pending = {func_key: frames.get(func_key, pd.DataFrame()) for func_key in signatures}
+        else:
+            pending = {func_key: time_series_data.get(func_key, []) for func_key in signatures}
+        histories = {func_key: _rollup_frame(rollups[func_key]) for func_key in pending if func_key in rollups}
+
+        progress = tqdm(total=len(pending), desc="Processing functions")
+        if self.workers <= 1 or len(pending) <= 1:
+            for func_key, records in pending.items():
+                try:
+                    if _render_function(self.overtime_dir, func_key, records,
+                                        self.max_points, self.time_buckets, histories.get(func_key)):
+                        manifest[func_key] = signatures[func_key]
+                except Exception as e:
+                    logger.error(f"Error processing {func_key}: {str(e)}")
+                progress.update()
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), mp_context=_render_context(),
+                                     initializer=_init_render_worker) as pool:
+                futures = {
+                    pool.submit(_render_function, self.overtime_dir, func_key, records,
+                                self.max_points, self.time_buckets, histories.get(func_key)): func_key
+                    for func_key, records in pending.items()
+                }
+                for future in as_completed(futures):
+                    func_key = futures[future]
+                    try:
+                        if future.result():
+                            manifest[func_key] = signatures[func_key]
+                    except Exception as e:
+                        logger.error(f"Error processing {func_key}: {str(e)}")
+                    progress.update()
+        progress.close()
 
-                filename = sanitize_filename(df["file"].iloc[0].replace(".py", ""), replacement_text="_")
-                func_name = sanitize_filename(df["function"].iloc[0], replacement_text="_")
-                self._plot_time_series(df, filename, func_name)
-                
-            except Exception as e:
-                logger.error(f"Error processing {func_key}: {str(e)}")
+        self._save_manifest(manifest)
 
     def _plot_time_series(self, df: pd.DataFrame, filename: str, func_name: str) -> None:
         """Create comprehensive time-series visualizations"""
-        metric_dirs = {
-            "cpu": os.path.join(self.overtime_dir, "cpu"),
-            "memory": os.path.join(self.overtime_dir, "memory"),
-            "execution_time": os.path.join(self.overtime_dir, "execution_time"),
-            "combined": os.path.join(self.overtime_dir, "combined")
-        }
-        
-        for dir_path in metric_dirs.values():
-            os.makedirs(dir_path, exist_ok=True)
-
-        # Individual metric plots
-        metrics = [
-            ("cpu_usage", "CPU Usage (%)", "cpu"),
-            ("peak_memory_mb", "Memory Usage (MB)", "memory"),
-            ("execution_time", "Execution Time (seconds)", "execution_time")
-        ]
-
-        for metric, ylabel, subdir in metrics:
-            plt.figure(figsize=(10, 5))
-            sns.lineplot(x="timestamp", y=metric, data=df, marker="o")
-            plt.title(f"{filename} - {func_name}\n{ylabel}")
-            plt.xlabel("Timestamp")
-            plt.ylabel(ylabel)
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M"))
-            
-            plot_name = sanitize_filename(f"{filename}_{func_name}_{metric}.png")
-            plt.savefig(os.path.join(metric_dirs[subdir], plot_name), 
-                       bbox_inches="tight", dpi=150)
-            plt.close()
+        _render_time_series(self.overtime_dir, df, filename, func_name,
+                            self.max_points, self.time_buckets)
 
-        # Combined plot
-        plt.figure(figsize=(14, 10))
-        plt.suptitle(f"{filename} - {func_name}", y=1.02)
-        
-        for idx, (metric, ylabel, subdir) in enumerate(metrics, 1):
-            plt.subplot(3, 1, idx)
-            sns.lineplot(x="timestamp", y=metric, data=df, marker="o")
-            plt.title(ylabel)
-            plt.xlabel("")
-            plt.ylabel(ylabel)
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d\n%H:%M"))
-        
-        combined_name = sanitize_filename(f"{filename}_{func_name}_combined.png")
-        plt.savefig(os.path.join(metric_dirs["combined"], combined_name),
-                  bbox_inches="tight", dpi=150)
-        plt.close()
+    def visualize_call_tree(self, min_fraction: float = 0.002) -> None:
+        """Render collapsed stacks as icicle charts
+
+        One chart for the call tree of ``Profiler(call_tree=True)`` and one
+        for the stacks captured by ``Profiler.sample()``. Roots are on top
+        and each box is as wide as its inclusive time; boxes narrower than
+        ``min_fraction`` of the total are left out.
+        """
+        for kind, (filename, title, xlabel) in ICICLE_CHARTS.items():
+            stacks = load_collapsed(self.json_dir, kind)
+            if stacks:
+                self._render_icicle(stacks, filename, title, xlabel, min_fraction)
+            else:
+                logger.info(f"No {kind} available for an icicle chart")
+
+    def _render_icicle(self, stacks: Dict[str, int], filename: str, title: str,
+                       xlabel: str, min_fraction: float) -> None:
+
+        # Inclusive time of every path prefix, from the self time of its stacks
+        widths: Dict[Tuple[str, ...], int] = {}
+        for stack, micros in stacks.items():
+            path = tuple(stack.split(";"))
+            for depth in range(1, len(path) + 1):
+                widths[path[:depth]] = widths.get(path[:depth], 0) + micros
+        total = sum(width for path, width in widths.items() if len(path) == 1)
+        if total <= 0:
+            return
+
+        # Sorted paths place each parent before its children, siblings left to right
+        offsets: Dict[Tuple[str, ...], int] = {(): 0}
+        boxes = []
+        for path in sorted(widths):
+            left = offsets[path[:-1]]
+            offsets[path[:-1]] = left + widths[path]
+            offsets[path] = left
+            if widths[path] / total >= min_fraction:
+                boxes.append((len(path) - 1, left, widths[path], path[-1]))
+        if not boxes:
+            logger.info(f"No call path reaches {min_fraction:.1%} of the total, skipping {filename}")
+            return
 
-        logger.debug(f"Generated reports for {filename}:{func_name}")
\ No newline at end of file
+        depth = max(box[0] for box in boxes) + 1
+        fig, ax = plt.subplots(figsize=(16, 1.5 + 0.45 * depth))
+        cmap = plt.get_cmap("YlOrRd")
+        for level, left, width, name in boxes:
+            color = cmap(0.25 + 0.5 * (zlib.crc32(name.encode()) % 1000) / 1000)
+            ax.barh(level, width / 1000, left=left / 1000, height=0.92, color=color, edgecolor="white")
+            if width / total >= 0.03:
+                label = name.rsplit(":", 1)[-1]
+                ax.text((left + width / 2) / 1000, level, label, ha="center", va="center",
+                        fontsize=8, clip_on=True)
+        ax.set_ylim(depth - 0.5, -0.5)
+        ax.set_xlim(0, total / 1000)
+        ax.set_yticks(range(depth))
+        ax.set_ylabel("Call depth")
+        ax.set_xlabel(xlabel)
+        ax.set_title(title)
+        ax.grid(False)
+        fig.savefig(os.path.join(self.call_tree_dir, filename), bbox_inches="tight", dpi=150)
+        plt.close(fig)
+        logger.info(f"Saved call tree chart to {self.call_tree_dir}")
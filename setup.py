@@ -10,16 +10,39 @@ setup(
     url="https://github.com/ajaykhanna123/profiler_framework",
     install_requires=[
         "psutil>=5.8.0",
-        "pandas>=1.3.0",
-        "matplotlib>=3.4.0",
-        "seaborn>=0.11.0",
-        "tqdm>=4.60.0",
-        "pathvalidate>=2.5.0",
     ],
+    extras_require={
+        "viz": [
+            "numpy>=1.20.0",
+            "pandas>=1.3.0",
+            "matplotlib>=3.4.0",
+            "seaborn>=0.11.0",
+            "tqdm>=4.60.0",
+            "pathvalidate>=2.5.0",
+        ],
+        "azure": [
+            "azure-storage-blob>=12.0.0",
+        ],
+        "all": [
+            "numpy>=1.20.0",
+            "pandas>=1.3.0",
+            "matplotlib>=3.4.0",
+            "seaborn>=0.11.0",
+            "tqdm>=4.60.0",
+            "pathvalidate>=2.5.0",
+            "azure-storage-blob>=12.0.0",
+        ],
+    },
+    entry_points={
+        "console_scripts": [
+            "profiler-regression=profiler.regression:main",
+            "profiler-bench=profiler.bench.__main__:main",
+        ],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         '..',
         'Operating System :: OS Independent',
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.9',
 )
\ No newline at end of file